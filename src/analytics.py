@@ -0,0 +1,151 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module works out the exact odds of skill checks, rather than sampling
+them.  A check rolls level + attribute bonus + modifiers + d20, so its
+result against a difficulty has twenty equally likely values; an opposed
+check subtracts two such rolls, so its result only depends on the
+difference of the two sides' bonuses and the difference of two d20s.
+Opposed results are the target's result, as Skill.use returns them: the
+attacker wins when it is below zero.  Both sides gain experience_gain()
+of it.
+
+Odds and expected experience are cached by net bonus, so after the first
+query for a given bonus every one is a dictionary lookup.
+
+Functions
+    check_distribution(int:bonus[, int:dc])     -> returns a dictionary of
+                                                    result to probability
+    check_chance(int:bonus[, int:dc])           -> returns the chance a check
+                                                    meets the dc
+    check_experience(int:bonus[, int:dc])       -> returns the experience a
+                                                    check gains on average
+    opposed_distribution(int:net)               -> returns a dictionary of
+                                                    result to probability
+    opposed_chance(int:net)                     -> returns the chance the
+                                                    attacker wins
+    opposed_experience(int:net)                 -> returns the experience
+                                                    each side gains on average
+    opposed_table([int:low, int:high])          -> returns (net, chance,
+                                                    experience) for each net
+    skill_bonus(creature, string:skillName[, int:modifiers]) -> returns what
+                                                    a creature adds to its d20
+    creature_check_chance(creature, string:skillName[, int:dc, int:modifiers])
+    creature_beat_chance(attacker, defender[, string:skillName, int:modifiers])
+    creature_expected_experience(creature, string:skillName[, int:dc, target, int:modifiers])
+
+In opposed checks net is the attacker's bonus less the target's.
+"""
+
+from skillInfo import experience_gain
+
+#------------------------------------------------------------------------------#
+
+D20_FACES = range(1, 21)
+
+def _difference_counts():
+    # how many of the 400 pairs of d20s give each target roll less
+    # attacker roll
+    counts = {}
+    for attackerRoll in D20_FACES:
+        for targetRoll in D20_FACES:
+            difference = targetRoll - attackerRoll
+            counts[difference] = counts.get(difference, 0) + 1
+    
+    return tuple(sorted(counts.items()))
+
+# (difference, count) for every difference from -19 to 19
+D20_DIFFERENCES = _difference_counts()
+_PAIRS = float(len(D20_FACES) ** 2)
+
+# results worked out so far, keyed by margin (bonus - dc) or net bonus
+_checkCache = {}
+_opposedCache = {}
+
+#------------------------------------------------------------------------------#
+
+def check_distribution(bonus, dc = 0):
+    margin = bonus - dc
+    return dict([(margin + face, 1.0 / len(D20_FACES)) for face in D20_FACES])
+
+def check_chance(bonus, dc = 0):
+    return _check_entry(bonus - dc)[0]
+
+def check_experience(bonus, dc = 0):
+    return _check_entry(bonus - dc)[1]
+
+def _check_entry(margin):
+    entry = _checkCache.get(margin)
+    if entry is None:
+        faces = float(len(D20_FACES))
+        results = [margin + face for face in D20_FACES]
+        chance = len([r for r in results if r >= 0]) / faces
+        experience = sum([experience_gain(r) for r in results]) / faces
+        entry = _checkCache[margin] = (chance, experience)
+    
+    return entry
+
+#------------------------------------------------------------------------------#
+
+def opposed_distribution(net):
+    return dict([(difference - net, count / _PAIRS) for difference, count in D20_DIFFERENCES])
+
+def opposed_chance(net):
+    return _opposed_entry(net)[0]
+
+def opposed_experience(net):
+    return _opposed_entry(net)[1]
+
+def opposed_table(low = -20, high = 20):
+    # beyond these nets the attacker always wins or always loses
+    return [(net,) + _opposed_entry(net) for net in range(low, high + 1)]
+
+def _opposed_entry(net):
+    entry = _opposedCache.get(net)
+    if entry is None:
+        wins = 0
+        experience = 0
+        for difference, count in D20_DIFFERENCES:
+            result = difference - net
+            if result < 0:
+                wins += count
+            experience += experience_gain(result) * count
+        entry = _opposedCache[net] = (wins / _PAIRS, experience / _PAIRS)
+    
+    return entry
+
+#------------------------------------------------------------------------------#
+
+def skill_bonus(creature, skillName, modifiers = 0):
+    skill = _get_skill(creature, skillName)
+    return skill.get_level() + creature.get_attribute_bonus(skill) + modifiers
+
+def creature_check_chance(creature, skillName, dc = 0, modifiers = 0):
+    return check_chance(skill_bonus(creature, skillName, modifiers), dc)
+
+def creature_beat_chance(attacker, defender, skillName = "Attack", modifiers = 0):
+    return opposed_chance(_net_bonus(attacker, defender, skillName, modifiers))
+
+def creature_expected_experience(creature, skillName, dc = 0, target = None, modifiers = 0):
+    # as in Skill.use, the target only rolls when the skill is opposed
+    if target is not None and _get_skill(creature, skillName).get_opposing_skill() is not None:
+        return opposed_experience(_net_bonus(creature, target, skillName, modifiers))
+    
+    return check_experience(skill_bonus(creature, skillName, modifiers), dc)
+
+def _net_bonus(attacker, defender, skillName, modifiers):
+    opposingName = _get_skill(attacker, skillName).get_opposing_skill()
+    if opposingName is None:
+        raise ValueError("%s is not opposed" % skillName)
+    
+    return skill_bonus(attacker, skillName, modifiers) - skill_bonus(defender, opposingName)
+
+def _get_skill(creature, skillName):
+    skill = creature.get_skills("list of Skill").get_skill(skillName)
+    if skill is None:
+        raise KeyError(skillName)
+    
+    return skill
+
+#------------------------------------------------------------------------------#
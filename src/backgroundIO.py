@@ -0,0 +1,463 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module runs slow work, such as reading and writing creature files, on
+background threads, so the user interface does not freeze while it runs.
+
+A WorkerPool hands each finished job's result to a callback.  Callbacks
+are passed through the pool's dispatch function, which the user interface
+sets to gobject.idle_add so they run on its main loop, where they may
+safely touch widgets and the creature list.  Nothing here imports GTK.
+
+Files are replaced by writing a temporary file beside them, under a name
+no other writer uses, and moving it over them once it is on disk.  That
+keeps a file from being left half written, but not two writes of one file
+in order: the user interface writes files on a pool of one worker, which
+runs its jobs one at a time in the order they were submitted.
+
+Classes
+    WorkerPool
+    BulkLoad
+    Autosaver
+
+Functions
+    read_creature_file(string:path)             -> returns the creature saved
+                                                    in a file
+    replacing_file(string:path)                 -> returns a context manager
+                                                    whose file replaces path
+                                                    when the with block ends
+    write_file(string:path, string:data)        -> replaces a file's contents
+                                                    without ever leaving it
+                                                    half written
+    write_files(list:files[, list:stale])       -> write_file()s each (path,
+                                                    data) pair, then removes
+                                                    the stale paths, and
+                                                    returns how many were
+                                                    written
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import Queue
+from contextlib import contextmanager
+from timeit import default_timer
+
+from creatureInfo import load_creature, encode_creature
+import changeTracking
+import instrumentation
+
+#------------------------------------------------------------------------------#
+
+# mkstemp makes files only their owner can read, so the files written get
+# the permissions open() would have given them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_FILE_MODE = 0666 & ~_UMASK
+
+def read_creature_file(path):
+    with open(path, "rb") as f:
+        return load_creature(f)
+
+@contextmanager
+def replacing_file(path):
+    directory, name = os.path.split(path)
+    descriptor, temporaryPath = tempfile.mkstemp(".tmp", name + ".", directory or ".")
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            yield f
+            
+            # on disk before it is moved, so a crash can not leave the file
+            # renamed but empty
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temporaryPath, _FILE_MODE)
+        os.rename(temporaryPath, path)
+    except:
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+        raise
+
+def write_file(path, data):
+    with replacing_file(path) as f:
+        f.write(data)
+
+def write_files(files, stale = ()):
+    for path, data in files:
+        write_file(path, data)
+    for path in stale:
+        if os.path.exists(path):
+            os.remove(path)
+    
+    return len(files)
+
+#------------------------------------------------------------------------------#
+
+def _call_now(function, *args):
+    function(*args)
+
+def _deliver(function, args):
+    function(*args)
+    
+    # idle callbacks which return True are run again
+    return False
+
+class WorkerPool(object):
+
+    """
+    A fixed set of daemon threads which run queued jobs in order of
+    submission; a pool of one worker also finishes each job before it
+    starts the next.  When a job finishes, callback(result) is
+    dispatched; if it raises, errback(exception) is dispatched instead, or
+    the error is printed when there is no errback.
+    
+    dispatch(function, *args) is called from the worker thread to have
+    function(*args) run on the right thread; by default it calls it
+    straight away, on the worker thread.
+    
+    While instrumentation is enabled, each job is timed under "job" and
+    its function's name.
+    
+    Functions:
+        submit(function[, args, callback, errback]) -> queues function(*args)
+        get_pending()               -> returns the number of jobs queued or
+                                        running
+        shutdown([bool:wait])       -> stops the threads once the queued jobs
+                                        are done
+    """
+    
+    def __init__(self, workers = 2, dispatch = None):
+        self.__jobs = Queue.Queue()
+        self.__dispatch = dispatch or _call_now
+        self.__pendingLock = threading.Lock()
+        self.__pending = 0
+        
+        self.__threads = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target = self.__work, name = "WorkerPool-%d" % i)
+            thread.setDaemon(True)
+            thread.start()
+            self.__threads.append(thread)
+    
+    def submit(self, function, args = (), callback = None, errback = None):
+        with self.__pendingLock:
+            self.__pending += 1
+        self.__jobs.put((function, args, callback, errback))
+    
+    def get_pending(self):
+        return self.__pending
+    
+    def shutdown(self, wait = True):
+        for thread in self.__threads:
+            self.__jobs.put(None)
+        
+        if wait:
+            for thread in self.__threads:
+                thread.join()
+    
+    def __work(self):
+        while True:
+            job = self.__jobs.get()
+            if job is None:
+                return
+            
+            function, args, callback, errback = job
+            measuring = instrumentation.is_enabled()
+            if measuring:
+                start = default_timer()
+            try:
+                result = function(*args)
+            except Exception, e:
+                if errback is not None:
+                    self.__dispatch(_deliver, errback, (e,))
+                else:
+                    print >> sys.stderr, "  Background job %s failed: %s" % (function.__name__, e)
+            else:
+                if callback is not None:
+                    self.__dispatch(_deliver, callback, (result,))
+            finally:
+                if measuring:
+                    instrumentation.record("job " + function.__name__, default_timer() - start)
+                with self.__pendingLock:
+                    self.__pending -= 1
+
+#------------------------------------------------------------------------------#
+
+class BulkLoad(object):
+
+    """
+    Loads many creature files on a WorkerPool.  Each creature is handed to
+    loaded(path, creature) as it arrives and each failure to
+    failed(path, exception); progress(done, total) is called about every
+    tenth of the way through, and finished(loaded, failed) once at the end.
+    They are all dispatched through the pool, so with gobject.idle_add they
+    run on the main loop.
+    
+    Functions:
+        get_total()                 -> returns the number of files
+        get_done()                  -> returns the number of files finished
+    """
+    
+    def __init__(self, pool, paths, loaded, failed = None, progress = None, finished = None):
+        self.__total = len(paths)
+        self.__done = 0
+        self.__loaded = 0
+        self.__failed = 0
+        self.__step = max(1, self.__total / 10)
+        self.__lock = threading.RLock()
+        
+        self.__onLoaded = loaded
+        self.__onFailed = failed
+        self.__onProgress = progress
+        self.__onFinished = finished
+        
+        if not paths and finished is not None:
+            finished(0, 0)
+        
+        for path in paths:
+            pool.submit(read_creature_file, (path,),
+                        self.__callback(self.__loaded_one, path),
+                        self.__callback(self.__failed_one, path))
+    
+    def get_total(self):
+        return self.__total
+    
+    def get_done(self):
+        return self.__done
+    
+    def __callback(self, method, path):
+        return lambda result: method(path, result)
+    
+    # the lock only matters when the pool dispatches on its worker threads
+    
+    def __loaded_one(self, path, creature):
+        with self.__lock:
+            self.__loaded += 1
+            self.__onLoaded(path, creature)
+            self.__count()
+    
+    def __failed_one(self, path, exception):
+        with self.__lock:
+            self.__failed += 1
+            if self.__onFailed is not None:
+                self.__onFailed(path, exception)
+            self.__count()
+    
+    def __count(self):
+        self.__done += 1
+        if self.__onProgress is not None and self.__done % self.__step == 0 and self.__done < self.__total:
+            self.__onProgress(self.__done, self.__total)
+        if self.__done == self.__total and self.__onFinished is not None:
+            self.__onFinished(self.__loaded, self.__failed)
+
+#------------------------------------------------------------------------------#
+
+class Autosaver(object):
+
+    """
+    Writes changed creatures to a directory as they change, each to the file
+    the Controller would save it to.  Creating an Autosaver starts change
+    tracking (see changeTracking).
+    
+    tick() should be called on a timer, on the same thread the creatures
+    are changed on.  It encodes the creatures changed since the last tick
+    and writes them in one batch on the pool, so a creature changed many
+    times between ticks is written once.  While a batch is being written
+    the next one waits, keeping only the latest record of each creature,
+    and a batch which fails is tried again on the next tick.  Only one
+    batch is written at a time, so creatures which are saved by hand
+    should be handed to save(), which writes them with the next batch,
+    rather than written beside it.
+    
+    When creatures is a LazyCreatureList only its decoded creatures are
+    looked at; it keeps changed creatures decoded until a tick has taken
+    their changes.
+    
+    A renamed creature's file under its old name would bring it back under
+    that name, so once the creature has been written under its new one the
+    old file is removed, unless another creature has taken the name.  Each
+    creature's file is the one it was last written to, or else the one the
+    LazyCreatureList read it from, and the list is told of each file
+    written.
+    
+    Each changed object is traced to its creature through a map of the
+    creatures' parts, so a tick costs as much as the changes it takes.  The
+    map is only built again, from all the creatures, when a change is to a
+    creature it does not hold, such as one added or decoded since.
+    
+    Functions:
+        tick()                      -> queues the changed creatures to be
+                                        written and returns how many are
+                                        waiting or being written
+        save(creature)              -> queues the creature to be written,
+                                        and starts writing if nothing is
+                                        being written
+        flush()                     -> writes every change not yet written
+                                        on this thread, once the pool is idle,
+                                        and returns how many files it wrote
+        get_saved_count()           -> returns how many creature files have
+                                        been written
+        stop()                      -> stops change tracking
+    """
+    
+    def __init__(self, creatures, directory, pool, saved = None, failed = None):
+        self.__creatures = creatures
+        self.__directory = directory
+        self.__pool = pool
+        self.__onSaved = saved
+        self.__onFailed = failed
+        
+        # (creature, record) pairs by path, waiting for the next batch and
+        # in the batch being written
+        self.__waiting = {}
+        self.__writing = None
+        self.__saved = 0
+        
+        # the creature each creature, health and skill belongs to, and the
+        # file each creature was last written to
+        self.__owners = {}
+        self.__files = {}
+        
+        changeTracking.start_tracking()
+    
+    def tick(self):
+        self.__gather()
+        if self.__waiting and self.__writing is None:
+            self.__write_waiting()
+        
+        return len(self.__waiting) + len(self.__writing or ())
+    
+    def save(self, creature):
+        self.__waiting[self.__path(creature)] = (creature, encode_creature(creature))
+        if self.__writing is None:
+            self.__write_waiting()
+    
+    def flush(self):
+        # for shutting down, once the pool has finished its jobs
+        self.__gather()
+        batch = self.__waiting
+        self.__waiting = {}
+        files, stale = self.__files_of(batch)
+        self.__saved += write_files(files, stale)
+        self.__wrote(batch)
+        
+        return len(files)
+    
+    def __gather(self):
+        changes = changeTracking.take_changes()
+        if changes:
+            for creature in self.__changed_creatures(changes):
+                self.__waiting[self.__path(creature)] = (creature, encode_creature(creature))
+    
+    def get_saved_count(self):
+        return self.__saved
+    
+    def stop(self):
+        changeTracking.stop_tracking()
+    
+    def __path(self, creature):
+        return os.path.join(self.__directory, creature.get_name() + ".creature")
+    
+    def __file_of(self, creature):
+        path = self.__files.get(creature)
+        if path is None:
+            getFile = getattr(self.__creatures, "get_file", None)
+            if getFile is not None:
+                path = getFile(creature)
+        
+        return path
+    
+    def __files_of(self, batch):
+        # the (path, record) pairs to write, and the old files of renamed
+        # creatures
+        files = []
+        stale = []
+        for path, (creature, record) in batch.iteritems():
+            files.append((path, record))
+            
+            oldPath = self.__file_of(creature)
+            if oldPath is None or oldPath == path or oldPath in batch:
+                continue
+            oldName = os.path.basename(oldPath)[:-len(".creature")]
+            if not self.__creatures.has_name(oldName):
+                stale.append(oldPath)
+        
+        return files, stale
+    
+    def __wrote(self, batch):
+        setFile = getattr(self.__creatures, "set_file", None)
+        for path, (creature, record) in batch.iteritems():
+            self.__files[creature] = path
+            if setFile is not None:
+                setFile(creature, path)
+    
+    def __candidates(self):
+        getLoaded = getattr(self.__creatures, "get_loaded", None)
+        if getLoaded is not None:
+            return getLoaded()
+        
+        return self.__creatures
+    
+    def __holds(self, creature):
+        # whether the creature is still one of the candidates
+        isLoaded = getattr(self.__creatures, "is_loaded", None)
+        if isLoaded is not None:
+            return isLoaded(creature)
+        
+        return self.__creatures.get_by_name(creature.get_name()) is creature
+    
+    def __changed_creatures(self, changes):
+        creatures = set()
+        for obj in changes:
+            creature = self.__owners.get(obj)
+            if creature is None or not self.__holds(creature):
+                break
+            creatures.add(creature)
+        else:
+            return creatures
+        
+        owners = self.__owners = {}
+        for creature in self.__candidates():
+            owners[creature] = owners[creature.get_health()] = creature
+            for skill in creature.get_skills("list of Skill"):
+                owners[skill] = creature
+        
+        # creatures no longer held are let go; a LazyCreatureList still
+        # knows the files of those it has dropped
+        self.__files = dict([(creature, path) for creature, path in self.__files.iteritems()
+                             if creature in owners])
+        
+        return set([owners[obj] for obj in changes if obj in owners])
+    
+    def __write_waiting(self):
+        # the old files are worked out now, once the last batch's files
+        # have been recorded, so a creature renamed while its last batch
+        # was written has that batch's file removed
+        self.__writing = self.__waiting
+        self.__waiting = {}
+        self.__pool.submit(write_files, self.__files_of(self.__writing), self.__written, self.__failed)
+    
+    # these are dispatched by the pool, so they run where tick() does
+    
+    def __written(self, count):
+        self.__wrote(self.__writing)
+        self.__writing = None
+        self.__saved += count
+        if self.__onSaved is not None:
+            self.__onSaved(count)
+        
+        if self.__waiting:
+            self.__write_waiting()
+    
+    def __failed(self, error):
+        # records changed again since are newer than the failed ones
+        for path, entry in self.__writing.iteritems():
+            self.__waiting.setdefault(path, entry)
+        self.__writing = None
+        
+        if self.__onFailed is not None:
+            self.__onFailed(error)
+
+#------------------------------------------------------------------------------#
@@ -0,0 +1,190 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module keeps track of which creatures, healths and skills have been
+changed, so that only changed creatures need saving.  Their mutators call
+mark_changed(self, event, value); the objects are gathered in a set, which
+whoever saves takes with take_changes().
+
+While journalling, each change to an object the journal watches is also
+kept as an event, in the order they happened, for eventJournal to write
+out; changes to other objects are not kept at all.  The journal gives the
+code each watched object's events are kept under.  The events are kept
+flat, three items (code, event, value) each, so that no tuple is kept per
+event for the garbage collector to walk.  The event says which mutator
+was called and value is what it was given, so the change can be made
+again: a skill's use is journalled as the EXP_GAINED its result gave.
+
+Open views can observe an object, to have a callback(object, event,
+value) called as each change is made; observe_creature() observes a
+creature, its health and its skills together.  Callbacks run on whichever
+thread made the change.
+
+Nothing is gathered until tracking or journalling is started, and nobody
+is called until something is observed, so programs which do none of them
+(simulations, benchmarks) only pay for a check.  The set is kept here
+rather than as a flag on every object because a flag would add a slot to
+each creature, its health and every one of its skills.
+
+Functions
+    start_tracking()                    -> starts gathering changed objects
+    stop_tracking()                     -> stops, and forgets any gathered
+    is_tracking()                       -> returns True while gathering
+    mark_changed(object[, int:event, value]) -> records that an object changed
+    take_changes()                      -> returns the objects changed since
+                                            the last call, and starts afresh
+    is_creature_changed(creature, changes) -> returns True if the creature,
+                                            its health or one of its skills
+                                            is among changes
+    start_journal(dict:codes)           -> starts gathering the events of
+                                            the objects in codes, under
+                                            their codes
+    stop_journal()                      -> stops, and forgets any gathered
+    is_journalling()                    -> returns True while gathering events
+    take_events()                       -> returns a flat list of the code,
+                                            event and value of each event
+                                            since the last call, oldest
+                                            first, and starts afresh
+    observe(object, callback)           -> calls callback(object, event,
+                                            value) on each change to object
+    unobserve(object, callback)         -> stops calling it
+    is_observed(object)                 -> returns True if anything observes
+                                            object
+    observe_creature(creature, callback) -> observe()s the creature, its
+                                            health and each of its skills
+    unobserve_creature(creature, callback) -> stops calling it for any of them
+"""
+
+#------------------------------------------------------------------------------#
+
+# the events mutators report, named for what they did; setting an attribute
+# is ATTRIBUTE_SET plus the attribute's place in creatureInfo.ATTRIBUTE_NAMES
+(RENAMED, WP_DAMAGED, WP_HEALED, WP_RESTORED, STATUS_ADDED, STATUS_REMOVED,
+ FATIGUE_RECOVERED, FATIGUE_RESTORED, FATIGUE_DRAINED, DESCRIBED, LEVEL_SET,
+ EXP_SET, LEVELLED_UP, EXP_GAINED) = range(1, 15)
+ATTRIBUTE_SET = 32
+
+# the objects changed since changes were last taken, or None when nothing
+# is being tracked
+changed = None
+
+# the code, event and value of each event since they were last taken, one
+# after another, or None when nothing is being journalled; record is its
+# bound extend, saving mutators the attribute lookup, and journalled the
+# journal's codes by object, which it goes on adding to
+events = None
+record = None
+journalled = None
+
+# a tuple of the callbacks observing each object, or None when nothing is
+# observed; the tuples are replaced rather than changed, so a callback can
+# stop observing while they are being called
+observers = None
+
+def start_tracking():
+    global changed
+    if changed is None:
+        changed = set()
+
+def stop_tracking():
+    global changed
+    changed = None
+
+def is_tracking():
+    return changed is not None
+
+def mark_changed(obj, event = 0, value = 0):
+    if changed is not None:
+        changed.add(obj)
+    if record is not None and obj in journalled:
+        record((journalled[obj], event, value))
+    if observers is not None:
+        for callback in observers.get(obj, ()):
+            callback(obj, event, value)
+
+def take_changes():
+    global changed
+    if changed is None:
+        return set()
+    
+    taken = changed
+    changed = set()
+    
+    return taken
+
+def is_creature_changed(creature, changes):
+    if not changes:
+        return False
+    if creature in changes or creature.get_health() in changes:
+        return True
+    
+    for skill in creature.get_skills("list of Skill"):
+        if skill in changes:
+            return True
+    
+    return False
+
+#------------------------------------------------------------------------------#
+
+def start_journal(codes):
+    global events, record, journalled
+    if events is None:
+        events = []
+        record = events.extend
+    journalled = codes
+
+def stop_journal():
+    global events, record, journalled
+    events = record = journalled = None
+
+def is_journalling():
+    return events is not None
+
+def take_events():
+    global events, record
+    if events is None:
+        return []
+    
+    taken = events
+    events = []
+    record = events.extend
+    
+    return taken
+
+#------------------------------------------------------------------------------#
+
+def observe(obj, callback):
+    global observers
+    if observers is None:
+        observers = {}
+    observers[obj] = observers.get(obj, ()) + (callback,)
+
+def unobserve(obj, callback):
+    global observers
+    if observers is None or obj not in observers:
+        return
+    
+    callbacks = tuple([other for other in observers[obj] if other != callback])
+    if callbacks:
+        observers[obj] = callbacks
+    else:
+        del observers[obj]
+        if not observers:
+            observers = None
+
+def is_observed(obj):
+    return observers is not None and obj in observers
+
+def _observed_parts(creature):
+    return [creature, creature.get_health()] + list(creature.get_skills("list of Skill"))
+
+def observe_creature(creature, callback):
+    for obj in _observed_parts(creature):
+        observe(obj, callback)
+
+def unobserve_creature(creature, callback):
+    for obj in _observed_parts(creature):
+        unobserve(obj, callback)
+
+#------------------------------------------------------------------------------#
@@ -0,0 +1,536 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module keeps creatures in a SQLite database, so that rosters too big
+to hold in memory can be searched and paged through.  Each creature is a
+row of creatures, with its health, skills and status effects in tables of
+their own:
+
+    creatures       id, name, one column per attribute
+    health          creature, max and current wound points and fatigue
+    skills          creature, position, name, kind, attributes, opposing,
+                    description, level, experience
+    status_effects  creature, position, effect
+
+Creatures are in list order by id.  Skills of kind 0 are standard skills,
+and only their names are kept; kind 1 skills also keep their definition,
+with the associated attributes joined by commas.  Names are indexed, as
+are skills by name and level.
+
+Classes
+    CreatureDatabase
+"""
+
+import sqlite3
+from collections import deque
+
+from creatureInfo import Creature, Health, ATTRIBUTE_NAMES, encode_creature
+from skillInfo import Skill, SkillList, SkillDefinition, SKILL_DEFINITIONS, get_skill_definition
+from rosterArchive import DEFAULT_MAX_LOADED
+import changeTracking
+
+#------------------------------------------------------------------------------#
+
+DATABASE_FORMAT_VERSION = 1
+
+# creatures read or written at a time by paging, iteration and extend()
+PAGE_SIZE = 500
+
+_STANDARD_SKILL = 0
+_CUSTOM_SKILL = 1
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS creatures (
+        id              INTEGER PRIMARY KEY,
+        name            TEXT NOT NULL,
+        strength        INTEGER NOT NULL,
+        dexterity       INTEGER NOT NULL,
+        constitution    INTEGER NOT NULL,
+        intelligence    INTEGER NOT NULL,
+        wisdom          INTEGER NOT NULL,
+        charisma        INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS creatures_by_name ON creatures (name, id);
+    
+    CREATE TABLE IF NOT EXISTS health (
+        creature        INTEGER PRIMARY KEY REFERENCES creatures (id),
+        max_wp          INTEGER NOT NULL,
+        current_wp      INTEGER NOT NULL,
+        max_fatigue     INTEGER NOT NULL,
+        current_fatigue INTEGER NOT NULL
+    );
+    
+    CREATE TABLE IF NOT EXISTS skills (
+        creature        INTEGER NOT NULL REFERENCES creatures (id),
+        position        INTEGER NOT NULL,
+        name            TEXT NOT NULL,
+        kind            INTEGER NOT NULL,
+        attributes      TEXT,
+        opposing        TEXT,
+        description     TEXT,
+        level           INTEGER NOT NULL,
+        experience      INTEGER NOT NULL,
+        PRIMARY KEY (creature, position)
+    );
+    CREATE INDEX IF NOT EXISTS skills_by_level ON skills (name, level);
+    
+    CREATE TABLE IF NOT EXISTS status_effects (
+        creature        INTEGER NOT NULL REFERENCES creatures (id),
+        position        INTEGER NOT NULL,
+        effect          TEXT NOT NULL,
+        PRIMARY KEY (creature, position)
+    );
+"""
+
+# every statement is a constant with ? parameters, so sqlite3 compiles each
+# once and keeps it in its statement cache
+_COUNT = "SELECT count(*) FROM creatures"
+_NAMES = "SELECT name FROM creatures ORDER BY id LIMIT ? OFFSET ?"
+_FIND = "SELECT id FROM creatures WHERE name = ? ORDER BY id LIMIT 1"
+_INDEX = "SELECT count(*) FROM creatures WHERE id < ?"
+_NEXT_ID = "SELECT coalesce(max(id), 0) + 1 FROM creatures"
+_PAGE_AT = """SELECT c.id, c.name, c.strength, c.dexterity, c.constitution, c.intelligence,
+                     c.wisdom, c.charisma, h.max_wp, h.current_wp, h.max_fatigue, h.current_fatigue
+              FROM creatures c JOIN health h ON h.creature = c.id
+              ORDER BY c.id LIMIT ? OFFSET ?"""
+_PAGE_AFTER = """SELECT c.id, c.name, c.strength, c.dexterity, c.constitution, c.intelligence,
+                        c.wisdom, c.charisma, h.max_wp, h.current_wp, h.max_fatigue, h.current_fatigue
+                 FROM creatures c JOIN health h ON h.creature = c.id
+                 WHERE c.id > ? ORDER BY c.id LIMIT ?"""
+_SKILLS_BETWEEN = """SELECT creature, name, kind, attributes, opposing, description, level, experience
+                     FROM skills WHERE creature BETWEEN ? AND ? ORDER BY creature, position"""
+_STATUS_BETWEEN = """SELECT creature, effect FROM status_effects
+                     WHERE creature BETWEEN ? AND ? ORDER BY creature, position"""
+_SKILL_AT_LEAST = """SELECT c.name FROM skills s JOIN creatures c ON c.id = s.creature
+                     WHERE s.name = ? AND s.level >= ? ORDER BY c.id"""
+
+_INSERT_CREATURE = "INSERT INTO creatures VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+_INSERT_HEALTH = "INSERT OR REPLACE INTO health VALUES (?, ?, ?, ?, ?)"
+_INSERT_SKILL = "INSERT INTO skills VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+_INSERT_STATUS = "INSERT INTO status_effects VALUES (?, ?, ?)"
+_UPDATE_CREATURE = """UPDATE creatures SET name = ?, strength = ?, dexterity = ?, constitution = ?,
+                      intelligence = ?, wisdom = ?, charisma = ? WHERE id = ?"""
+_RENAME = "UPDATE creatures SET name = ? WHERE id = ?"
+_DELETE_CREATURE = "DELETE FROM creatures WHERE id = ?"
+_DELETE_HEALTH = "DELETE FROM health WHERE creature = ?"
+_DELETE_SKILLS = "DELETE FROM skills WHERE creature = ?"
+_DELETE_STATUS = "DELETE FROM status_effects WHERE creature = ?"
+
+#------------------------------------------------------------------------------#
+
+class CreatureDatabase(object):
+
+    """
+    A list of creatures kept in a SQLite database, with the name based
+    operations of CreatureList.  Only names and ids are looked up until a
+    creature is asked for, when it is read from the database; iterating
+    and get_page() read a page of creatures with three queries.
+    
+    At most maxLoaded creatures are kept in memory; the least recently used
+    one is dropped when another is read, and written back first if it has
+    changed.  Creatures which are observed (see changeTracking.observe) are
+    never dropped, so views keep the object which changes.  save() writes
+    back every changed creature still in memory.  Creatures added by
+    append() are written straight away and kept in memory; extend() writes
+    its creatures in batches and keeps none of them, so they should be
+    asked for again before being changed.
+    
+    The database is used from the thread which opened it.
+    
+    Functions:
+        get_names([int:offset, int:limit]) -> returns the creatures' names, in
+                                            list order
+        has_name(string:name)           -> returns True if a creature has
+                                            that name
+        get_by_name(string:name)        -> returns the first creature with
+                                            that name, or None
+        find_index_by_name(string:name) -> returns the index of the first
+                                            creature with that name, or -1
+        remove_by_name(string:name)     -> removes and returns the first
+                                            creature with that name, or None
+        rename(string:oldName, string:newName) -> renames a creature and
+                                            returns it
+        append(Creature:creature)
+        extend(list:creatures)          -> adds creatures in one transaction
+        get_page(int:offset, int:limit) -> returns up to limit creatures from
+                                            offset on
+        skill_at_least(string:skillName, int:level) -> returns the names of
+                                            the creatures with that skill at
+                                            level or above, in list order
+        get_loaded_count()              -> returns how many creatures are in
+                                            memory
+        get_loaded()                    -> returns the creatures in memory
+        get_dirty_names()               -> returns the names of creatures in
+                                            memory which have changed
+        iter_records()                  -> yields each creature's name and
+                                            creature record, in list order
+        save()                          -> writes back the changed creatures,
+                                            and returns how many there were
+        close()                         -> saves, and closes the database
+    """
+    
+    def __init__(self, path = ":memory:", maxLoaded = DEFAULT_MAX_LOADED):
+        self.__connection = sqlite3.connect(path, cached_statements = 64)
+        
+        # text comes back as utf-8 bytes, as creature records keep it
+        self.__connection.text_factory = str
+        
+        version = self.__connection.execute("PRAGMA user_version").fetchone()[0]
+        if version > DATABASE_FORMAT_VERSION:
+            raise ValueError("database version %d is newer than this program can read" % version)
+        with self.__connection:
+            self.__connection.executescript(_SCHEMA)
+            self.__connection.execute("PRAGMA user_version = %d" % DATABASE_FORMAT_VERSION)
+        
+        # creatures in memory by id, with the record each had when it was
+        # read or last written, and their ids least recently used first;
+        # __order may hold stale entries, which the stamps tell apart
+        self.__maxLoaded = max(1, maxLoaded)
+        self.__loaded = {}
+        self.__records = {}
+        self.__ids = {}
+        self.__stamps = {}
+        self.__order = deque()
+        self.__stamp = 0
+        self.__evicted = 0
+    
+    # ----- list access ----- #
+    
+    def __len__(self):
+        return self.__connection.execute(_COUNT).fetchone()[0]
+    
+    def __iter__(self):
+        lastId = 0
+        while True:
+            page = self.__read_page(_PAGE_AFTER, (lastId, PAGE_SIZE))
+            if not page:
+                return
+            lastId = self.__ids[page[-1]]
+            for creature in page:
+                yield creature
+    
+    def __getitem__(self, index):
+        if not isinstance(index, (int, long)):
+            raise TypeError("CreatureDatabase indices must be integers")
+        if index < 0:
+            index += len(self)
+        
+        page = self.get_page(index, 1) if index >= 0 else []
+        if not page:
+            raise IndexError("CreatureDatabase index out of range")
+        
+        return page[0]
+    
+    def get_names(self, offset = 0, limit = -1):
+        return [row[0] for row in self.__connection.execute(_NAMES, (limit, offset))]
+    
+    def has_name(self, name):
+        return self.__find(name) is not None
+    
+    def get_by_name(self, name):
+        creatureId = self.__find(name)
+        if creatureId is None:
+            return None
+        
+        return self.__get(creatureId)
+    
+    def find_index_by_name(self, name):
+        creatureId = self.__find(name)
+        if creatureId is None:
+            return -1
+        
+        return self.__connection.execute(_INDEX, (creatureId,)).fetchone()[0]
+    
+    def remove_by_name(self, name):
+        creatureId = self.__find(name)
+        if creatureId is None:
+            return None
+        
+        creature = self.__get(creatureId)
+        with self.__connection:
+            self.__delete_rows(creatureId)
+            self.__connection.execute(_DELETE_CREATURE, (creatureId,))
+        self.__forget(creatureId)
+        
+        return creature
+    
+    def rename(self, oldName, newName):
+        creatureId = self.__find(oldName)
+        if creatureId is None:
+            return None
+        
+        creature = self.__get(creatureId)
+        creature.set_name(newName)
+        with self.__connection:
+            self.__connection.execute(_RENAME, (newName, creatureId))
+        
+        return creature
+    
+    def append(self, creature):
+        with self.__connection:
+            creatureId = self.__connection.execute(_NEXT_ID).fetchone()[0]
+            self.__insert([(creatureId, creature)])
+        
+        self.__keep(creatureId, creature, encode_creature(creature))
+        self.__evict()
+    
+    def extend(self, creatures):
+        with self.__connection:
+            creatureId = self.__connection.execute(_NEXT_ID).fetchone()[0]
+            batch = []
+            for creature in creatures:
+                batch.append((creatureId, creature))
+                creatureId += 1
+                if len(batch) == PAGE_SIZE:
+                    self.__insert(batch)
+                    batch = []
+            self.__insert(batch)
+    
+    def get_page(self, offset, limit):
+        return self.__read_page(_PAGE_AT, (limit, offset))
+    
+    def skill_at_least(self, skillName, level):
+        return [row[0] for row in self.__connection.execute(_SKILL_AT_LEAST, (skillName, level))]
+    
+    def get_loaded_count(self):
+        return len(self.__loaded)
+    
+    def get_loaded(self):
+        return [self.__loaded[i] for i in sorted(self.__loaded)]
+    
+    def get_dirty_names(self):
+        return [self.__loaded[i].get_name() for i in sorted(self.__loaded) if self.__is_dirty(i)]
+    
+    # ----- saving ----- #
+    
+    def iter_records(self):
+        # creatures in memory are encoded as they are now; the rest are
+        # read a page at a time and not kept
+        lastId = 0
+        while True:
+            rows = self.__connection.execute(_PAGE_AFTER, (lastId, PAGE_SIZE)).fetchall()
+            if not rows:
+                return
+            lastId = rows[-1][0]
+            for creatureId, creature in self.__build(rows):
+                creature = self.__loaded.get(creatureId, creature)
+                yield creature.get_name(), encode_creature(creature)
+    
+    def save(self):
+        dirty = [i for i in sorted(self.__loaded) if self.__is_dirty(i)]
+        if dirty:
+            with self.__connection:
+                for creatureId in dirty:
+                    self.__write(creatureId)
+        
+        return len(dirty)
+    
+    def close(self):
+        self.save()
+        self.__connection.close()
+    
+    # ----- reading and writing rows ----- #
+    
+    def __find(self, name):
+        row = self.__connection.execute(_FIND, (name,)).fetchone()
+        if row is None:
+            return None
+        
+        return row[0]
+    
+    def __get(self, creatureId):
+        creature = self.__loaded.get(creatureId)
+        if creature is None:
+            creature = self.__read_page(_PAGE_AFTER, (creatureId - 1, 1))[0]
+        else:
+            self.__use(creatureId)
+            self.__evict()
+        
+        return creature
+    
+    def __read_page(self, query, parameters):
+        # creatures already in memory are handed out as they are, since they
+        # may have changed
+        page = []
+        for creatureId, creature in self.__build(self.__connection.execute(query, parameters).fetchall()):
+            loaded = self.__loaded.get(creatureId)
+            if loaded is None:
+                self.__keep(creatureId, creature, encode_creature(creature))
+            else:
+                creature = loaded
+                self.__use(creatureId)
+            page.append(creature)
+        self.__evict()
+        
+        return page
+    
+    def __build(self, rows):
+        # the page queries hand out rows in id order with none skipped, so
+        # every creature with an id from the first row's to the last row's
+        # is on the page (ids left by removed creatures have no skill or
+        # status rows), and their skills and status effects are read with
+        # one range query each
+        if not rows:
+            return []
+        
+        first, last = rows[0][0], rows[-1][0]
+        skills = {}
+        for row in self.__connection.execute(_SKILLS_BETWEEN, (first, last)):
+            skills.setdefault(row[0], []).append(_skill(row))
+        status = {}
+        for creatureId, effect in self.__connection.execute(_STATUS_BETWEEN, (first, last)):
+            status.setdefault(creatureId, []).append(effect)
+        
+        return [(row[0], _creature(row, skills.get(row[0], []), status.get(row[0], [])))
+                for row in rows]
+    
+    def __insert(self, batch):
+        creatures = []
+        healths = []
+        skills = []
+        statuses = []
+        for creatureId, creature in batch:
+            creatureRow, healthRow, skillRows, statusRows = _rows(creatureId, creature)
+            creatures.append(creatureRow)
+            healths.append(healthRow)
+            skills.extend(skillRows)
+            statuses.extend(statusRows)
+        
+        self.__connection.executemany(_INSERT_CREATURE, creatures)
+        self.__connection.executemany(_INSERT_HEALTH, healths)
+        self.__connection.executemany(_INSERT_SKILL, skills)
+        self.__connection.executemany(_INSERT_STATUS, statuses)
+    
+    def __write(self, creatureId):
+        # called inside a transaction
+        creature = self.__loaded[creatureId]
+        creatureRow, healthRow, skillRows, statusRows = _rows(creatureId, creature)
+        
+        self.__delete_rows(creatureId)
+        self.__connection.execute(_UPDATE_CREATURE, creatureRow[1:] + creatureRow[:1])
+        self.__connection.execute(_INSERT_HEALTH, healthRow)
+        self.__connection.executemany(_INSERT_SKILL, skillRows)
+        self.__connection.executemany(_INSERT_STATUS, statusRows)
+        
+        self.__records[creatureId] = encode_creature(creature)
+    
+    def __delete_rows(self, creatureId):
+        self.__connection.execute(_DELETE_HEALTH, (creatureId,))
+        self.__connection.execute(_DELETE_SKILLS, (creatureId,))
+        self.__connection.execute(_DELETE_STATUS, (creatureId,))
+    
+    # ----- creatures in memory ----- #
+    
+    def __keep(self, creatureId, creature, record):
+        self.__loaded[creatureId] = creature
+        self.__records[creatureId] = record
+        self.__ids[creature] = creatureId
+        self.__use(creatureId)
+    
+    def __forget(self, creatureId):
+        creature = self.__loaded.pop(creatureId, None)
+        if creature is not None:
+            del self.__records[creatureId]
+            del self.__ids[creature]
+            del self.__stamps[creatureId]
+    
+    def __is_dirty(self, creatureId):
+        return encode_creature(self.__loaded[creatureId]) != self.__records[creatureId]
+    
+    def __use(self, creatureId):
+        self.__stamp += 1
+        self.__stamps[creatureId] = self.__stamp
+        self.__order.append((self.__stamp, creatureId))
+        
+        if len(self.__order) > 2 * len(self.__stamps) + 64:
+            # drop the stale entries left by creatures used more than once
+            stamps = self.__stamps
+            self.__order = deque([(stamp, i) for stamp, i in self.__order if stamps.get(i) == stamp])
+    
+    def __evict(self):
+        # a page may be bigger than maxLoaded, so the creatures used since
+        # the last eviction are never dropped
+        stamps = self.__stamps
+        dropped = []
+        kept = []
+        while len(self.__loaded) - len(dropped) > self.__maxLoaded and self.__order:
+            stamp, creatureId = self.__order[0]
+            if stamps.get(creatureId) != stamp:
+                self.__order.popleft()
+                continue
+            if stamp > self.__evicted:
+                break
+            
+            self.__order.popleft()
+            if changeTracking.is_observed(self.__loaded[creatureId]):
+                kept.append((stamp, creatureId))
+            else:
+                dropped.append(creatureId)
+        kept.reverse()
+        self.__order.extendleft(kept)
+        self.__evicted = self.__stamp
+        
+        dirty = [i for i in dropped if self.__is_dirty(i)]
+        if dirty:
+            with self.__connection:
+                for creatureId in dirty:
+                    self.__write(creatureId)
+        for creatureId in dropped:
+            self.__forget(creatureId)
+
+#------------------------------------------------------------------------------#
+
+def _rows(creatureId, creature):
+    attributes = creature.get_attributes()
+    health = creature.get_health()
+    
+    creatureRow = (creatureId, creature.get_name()) + tuple([attributes[name] for name in ATTRIBUTE_NAMES])
+    healthRow = (creatureId, health.get_max_wp(), health.get_current_wp(),
+                 health.get_max_fatigue(), health.get_current_fatigue())
+    
+    skillRows = []
+    for position, skill in enumerate(creature.get_skills("list of Skill")):
+        definition = skill.get_definition()
+        if definition in SKILL_DEFINITIONS:
+            skillRows.append((creatureId, position, definition.get_name(), _STANDARD_SKILL,
+                              None, None, None, skill.get_level(), skill.get_exp()))
+        else:
+            skillRows.append((creatureId, position, definition.get_name(), _CUSTOM_SKILL,
+                              ",".join(definition.get_associated_attributes()),
+                              definition.get_opposing_skill(), definition.get_description(),
+                              skill.get_level(), skill.get_exp()))
+    
+    statusRows = [(creatureId, position, effect) for position, effect in enumerate(health.get_status())]
+    
+    return creatureRow, healthRow, skillRows, statusRows
+
+def _skill(row):
+    creatureId, name, kind, attributes, opposing, description, level, exp = row
+    if kind == _STANDARD_SKILL:
+        definition = get_skill_definition(name)
+    else:
+        definition = SkillDefinition(name, attributes.split(",") if attributes else (), opposing, description)
+    
+    return Skill(definition, lvl = level, exp = exp)
+
+def _creature(row, skillItems, status):
+    # built as creatureInfo.decode_creature builds them, with health as it
+    # was saved and the skills' name index left to the first lookup
+    skills = SkillList.__new__(SkillList)
+    list.extend(skills, skillItems)
+    
+    health = Health.__new__(Health)
+    health.__setstate__({ "_Health__maxWoundPoints"     : row[8],
+                          "_Health__currentWoundPoints" : row[9],
+                          "_Health__status"             : status,
+                          "_Health__maxFatigue"         : row[10],
+                          "_Health__currentFatigue"     : row[11] })
+    
+    creature = Creature.__new__(Creature)
+    creature.__setstate__({ "_Creature__name"       : row[1],
+                            "_Creature__attributes" : dict(zip(ATTRIBUTE_NAMES, row[2:8])),
+                            "_Creature__health"     : health,
+                            "_Creature__skills"     : skills })
+    
+    return creature
@@ -0,0 +1,452 @@
+#! /usr/bin/env python
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module makes creatures in bulk, for load testing and for setting up
+campaigns.  It generates them from distributions of attribute scores and
+skill levels, or imports them from CSV or JSON spreadsheets, and writes
+them to a roster archive or a CreatureStore:
+
+    python creatureGenerator.py [options] count roster
+    python creatureGenerator.py [options] --import spreadsheet roster
+
+Creatures are handled a chunk at a time, as columns: a chunk is a tuple of
+a list of names, a list of six columns of attribute scores in
+ATTRIBUTE_NAMES order, and a list of columns of skill levels, one for
+each standard skill in SKILL_DEFINITIONS order.  Chunks are encoded
+straight into roster records or appended to a store's columns, so no
+Creature object is made for any of the creatures, and memory only grows
+with their number by the names imported, which are kept to catch a name
+given twice.  Every creature starts at full health, with the standard
+skills and no experience.
+
+A distribution is written as dice, "3d6" or "1d8+2"; a range, "3-18",
+from which every value is as likely; or a single number.  Generation is
+seeded, and gives the same creatures for the same seed; with numpy
+installed the values are drawn with numpy, so they differ from those
+drawn without it.
+
+A CSV spreadsheet has a header row naming its columns: "name", any of the
+attributes and any of the standard skills, whose columns hold their
+levels; letter case does not matter, and columns left out are zero.  A
+JSON spreadsheet holds objects like skillBatch's create command:
+{"name": ..., "strength": ..., "skills": {"Attack": 3}}, either in one
+array or one per line.  Decoding JSON takes several times longer than
+reading CSV, so large spreadsheets are quicker imported as CSV.
+
+Creatures are saved to files named after them, so imported names must be
+unique and not empty, and may not hold a path separator; neither may the
+prefix of generated names.
+
+Classes
+    Distribution
+
+Functions
+    generate_chunks(int:count[, seed, dict:attributes, dict:skills, ...]) ->
+                                            yields chunks of generated
+                                            creatures
+    read_csv_chunks(file:f[, int:chunkSize])    -> yields chunks of the
+                                            creatures in a CSV spreadsheet
+    read_json_chunks(file:f[, int:chunkSize])   -> yields chunks of the
+                                            creatures in a JSON spreadsheet
+    write_roster_chunks(string:path, chunks)    -> writes the chunks' creatures
+                                            to a roster archive, and returns
+                                            how many there were
+    store_chunks(CreatureStore:store, chunks)   -> adds the chunks' creatures
+                                            to a store, and returns how many
+                                            there were
+"""
+
+import csv
+import hashlib
+import json
+import optparse
+import os
+import random
+import re
+import sys
+from itertools import chain, islice
+from operator import itemgetter
+from timeit import default_timer
+
+from creatureInfo import ATTRIBUTE_NAMES, encode_creature_rows
+from skillInfo import SKILL_DEFINITIONS
+from rosterArchive import write_roster
+
+#------------------------------------------------------------------------------#
+
+# creatures handled at a time
+CHUNK_SIZE = 10000
+
+DEFAULT_ATTRIBUTE_DISTRIBUTION = "3d6"
+DEFAULT_SKILL_DISTRIBUTION = "0-5"
+
+SKILL_NAMES = [definition.get_name() for definition in SKILL_DEFINITIONS]
+
+def _numpy():
+    # numpy is optional; without it the values are drawn with the random
+    # module
+    try:
+        import numpy
+    except ImportError:
+        return None
+    
+    return numpy
+
+class Distribution(object):
+
+    """
+    A distribution of whole numbers: the sum of some dice plus a bonus, or
+    a range in which every value is as likely.
+    
+    Functions:
+        draw(generator, int:n)      -> returns a list of n values drawn with a
+                                        numpy RandomState or random.Random
+    """
+    
+    __PATTERN = re.compile(r"^\s*(?:(\d+)d(\d+)\s*([+-]\s*\d+)?|(-?\d+)\s*-\s*(-?\d+)|(-?\d+))\s*$")
+    
+    def __init__(self, text):
+        match = self.__PATTERN.match(text)
+        if match is None:
+            raise ValueError("%r is not a distribution; give dice (3d6), a range (3-18) or a number" % text)
+        
+        self.__text = text.strip()
+        dice, sides, bonus, low, high, constant = match.groups()
+        if dice is not None:
+            self.__dice, self.__sides = int(dice), int(sides)
+            self.__bonus = int(bonus.replace(" ", "")) if bonus else 0
+            if self.__dice < 1 or self.__sides < 1:
+                raise ValueError("%r needs at least one die of at least one side" % text)
+        else:
+            if constant is not None:
+                low = high = constant
+            self.__dice = None
+            self.__low, self.__high = int(low), int(high)
+            if self.__low > self.__high:
+                raise ValueError("%r is an empty range" % text)
+    
+    def __repr__(self):
+        return "Distribution(%r)" % self.__text
+    
+    def draw(self, generator, n):
+        numpy = _numpy() if not isinstance(generator, random.Random) else None
+        if numpy is not None:
+            if self.__dice is not None:
+                rolls = generator.randint(1, self.__sides + 1, size = (n, self.__dice))
+                return (rolls.sum(axis = 1) + self.__bonus).tolist()
+            
+            return generator.randint(self.__low, self.__high + 1, size = n).tolist()
+        
+        draw = generator.random
+        if self.__dice is not None:
+            sides, bonus = self.__sides, self.__bonus
+            values = [bonus] * n
+            for die in xrange(self.__dice):
+                values = [value + int(draw() * sides) + 1 for value in values]
+            return values
+        
+        low, span = self.__low, self.__high - self.__low + 1
+        return [low + int(draw() * span) for i in xrange(n)]
+
+def _generator(seed):
+    # seeded as DiceStream seeds its dice
+    if seed is None:
+        seed = int(hashlib.sha1(os.urandom(20)).hexdigest(), 16)
+    digest = hashlib.sha256("generate," + str(int(seed))).hexdigest()
+    
+    numpy = _numpy()
+    if numpy is not None:
+        words = [int(digest[i:i + 8], 16) for i in range(0, len(digest), 8)]
+        return numpy.random.RandomState(numpy.array(words, dtype = numpy.uint32))
+    
+    return random.Random(int(digest, 16))
+
+def generate_chunks(count, seed = None, attributes = None, skills = None, prefix = "Creature",
+                    chunkSize = CHUNK_SIZE):
+    # attributes and skills map names to Distributions, or to their text;
+    # the rest are drawn from the defaults
+    attributes = attributes or {}
+    skills = skills or {}
+    for name in attributes:
+        if name not in ATTRIBUTE_NAMES:
+            raise ValueError("%s is not an attribute" % name)
+    for name in skills:
+        if name not in SKILL_NAMES:
+            raise ValueError("%s is not a standard skill" % name)
+    _check_separators([prefix])
+    
+    attributeDistributions = [_distribution(attributes.get(name, DEFAULT_ATTRIBUTE_DISTRIBUTION))
+                              for name in ATTRIBUTE_NAMES]
+    skillDistributions = [_distribution(skills.get(name, DEFAULT_SKILL_DISTRIBUTION)) for name in SKILL_NAMES]
+    
+    generator = _generator(seed)
+    for start in xrange(0, count, chunkSize):
+        n = min(chunkSize, count - start)
+        names = ["%s %d" % (prefix, number) for number in xrange(start + 1, start + n + 1)]
+        yield (names, [distribution.draw(generator, n) for distribution in attributeDistributions],
+               [distribution.draw(generator, n) for distribution in skillDistributions])
+
+def _distribution(distribution):
+    if isinstance(distribution, Distribution):
+        return distribution
+    
+    return Distribution(distribution)
+
+#------------------------------------------------------------------------------#
+
+def read_csv_chunks(f, chunkSize = CHUNK_SIZE):
+    reader = csv.reader(f)
+    try:
+        header = reader.next()
+    except StopIteration:
+        return
+    
+    # where each of the name, the attributes and the skills is found
+    places = {}
+    wanted = dict([(name.lower(), name) for name in ("name",) + ATTRIBUTE_NAMES + tuple(SKILL_NAMES)])
+    for place, title in enumerate(header):
+        name = wanted.get(title.strip().lower())
+        if name is None:
+            raise ValueError("the CSV column %r is not a name, attribute or standard skill" % title)
+        if name in places:
+            raise ValueError("the CSV column %r is given twice" % title)
+        places[name] = place
+    if "name" not in places:
+        raise ValueError("the CSV spreadsheet has no name column")
+    
+    width = len(header)
+    line = 1
+    seen = set()
+    while True:
+        rows = list(islice(reader, chunkSize))
+        if not rows:
+            return
+        
+        if set(map(len, rows)) != set([width]):
+            rows = _check_rows(rows, width, line)
+        line += chunkSize
+        if not rows:
+            continue
+        
+        try:
+            names = map(itemgetter(places["name"]), rows)
+            _check_names(names, seen)
+            yield (names,
+                   [_int_column(rows, places.get(name)) for name in ATTRIBUTE_NAMES],
+                   [_int_column(rows, places.get(name)) for name in SKILL_NAMES])
+        except ValueError, e:
+            raise ValueError("in the CSV rows after line %d: %s" % (line - chunkSize, e))
+
+def _check_rows(rows, width, line):
+    # blank lines are skipped; short or long rows are errors
+    kept = []
+    for number, row in enumerate(rows, line + 1):
+        if row:
+            if len(row) != width:
+                raise ValueError("CSV line %d has %d values where the header names %d" % (number, len(row), width))
+            kept.append(row)
+    
+    return kept
+
+# the numbers scores and levels are usually written as; looking them up is
+# several times quicker than int()
+_SMALL_INTS = dict([(str(number), number) for number in range(-1000, 1001)])
+
+def _int_column(rows, place):
+    # a column is taken from the rows with itemgetter, which is quicker
+    # than zip(*rows) and makes no tuple of each column
+    if place is None:
+        return [0] * len(rows)
+    
+    column = map(itemgetter(place), rows)
+    try:
+        return map(_SMALL_INTS.__getitem__, column)
+    except KeyError:
+        return map(int, column)
+
+def read_json_chunks(f, chunkSize = CHUNK_SIZE):
+    # an array is read whole; objects one per line are read a chunk at a time
+    seen = set()
+    start = f.read(1)
+    while start.isspace():
+        start = f.read(1)
+    
+    if start == "[":
+        objects = json.loads(start + f.read())
+        if not isinstance(objects, list):
+            raise ValueError("the JSON spreadsheet is not an array of objects")
+        for first in xrange(0, len(objects), chunkSize):
+            yield _json_chunk(objects[first:first + chunkSize], seen)
+    elif start:
+        lines = _prepend(start, f)
+        while True:
+            # a chunk's lines are decoded as one array
+            chunk = [line for line in islice(lines, chunkSize) if not line.isspace()]
+            if not chunk:
+                return
+            yield _json_chunk(json.loads("[%s]" % ",".join(chunk)), seen)
+
+def _prepend(first, f):
+    # the rest of the first line, after the character already read
+    lines = iter(f)
+    yield first + next(lines, "")
+    for line in lines:
+        yield line
+
+_JSON_ATTRIBUTE_KEYS = [unicode(name.lower()) for name in ATTRIBUTE_NAMES]
+_JSON_SKILL_KEYS = [unicode(name) for name in SKILL_NAMES]
+
+def _json_chunk(objects, seen):
+    # read a column at a time, which is quicker than a creature at a time
+    try:
+        names = [creature[u"name"] for creature in objects]
+        gets = [creature.get for creature in objects]
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError("creatures in a JSON spreadsheet are objects with a name")
+    for name in names:
+        if not isinstance(name, basestring):
+            raise ValueError("the name %s in a JSON spreadsheet is not a string" % json.dumps(name))
+    names = [name.encode("utf-8") if isinstance(name, unicode) else name for name in names]
+    _check_names(names, seen)
+    
+    # decoded keys are unicode, and are found quicker by unicode keys
+    attributes = [_json_int_column([get(key, 0) for get in gets], names, key) for key in _JSON_ATTRIBUTE_KEYS]
+    
+    skills = [get(u"skills") or {} for get in gets]
+    if not all([isinstance(creatureSkills, dict) for creatureSkills in skills]):
+        raise ValueError("the skills of creatures in a JSON spreadsheet are objects")
+    unknown = set().union(*skills).difference(_JSON_SKILL_KEYS)
+    if unknown:
+        raise ValueError("skills which are not standard were given: %s" % ", ".join(sorted(unknown)))
+    levels = [_json_int_column([creatureSkills.get(key, 0) for creatureSkills in skills], names, key)
+              for key in _JSON_SKILL_KEYS]
+    
+    return names, attributes, levels
+
+def _json_int_column(values, names, key):
+    try:
+        return map(int, values)
+    except (TypeError, ValueError):
+        for name, value in zip(names, values):
+            try:
+                int(value)
+            except (TypeError, ValueError):
+                raise ValueError("%s's %s in the JSON spreadsheet is %s, not a number" % (name, key,
+                                                                                         json.dumps(value)))
+        raise
+
+#------------------------------------------------------------------------------#
+
+# creatures are saved to files named after them in a data directory
+_SEPARATORS = [separator for separator in (os.sep, os.altsep) if separator]
+
+def _check_names(names, seen):
+    # seen holds the names of the chunks before, and is given these
+    chunk = set(names)
+    if len(chunk) != len(names) or not seen.isdisjoint(chunk):
+        counted = set()
+        for name in names:
+            if name in seen or name in counted:
+                raise ValueError("the name %r is given to more than one creature" % name)
+            counted.add(name)
+    if "" in chunk:
+        raise ValueError("a creature has no name")
+    _check_separators(chunk)
+    
+    seen.update(chunk)
+
+def _check_separators(names):
+    joined = "".join(names)
+    for separator in _SEPARATORS:
+        if separator in joined:
+            name = [name for name in names if separator in name][0]
+            raise ValueError("%r holds a %r, which can not be in a creature's file name" % (name, separator))
+
+def write_roster_chunks(path, chunks):
+    counted = [0]
+    
+    def records():
+        for names, attributes, levels in chunks:
+            counted[0] += len(names)
+            yield zip(names, encode_creature_rows(names, attributes, levels))
+    
+    write_roster(path, chain.from_iterable(records()))
+    
+    return counted[0]
+
+def store_chunks(store, chunks):
+    count = 0
+    for names, attributes, levels in chunks:
+        store.extend_columns(names, attributes, dict(zip(SKILL_NAMES, levels)))
+        count += len(names)
+    
+    return count
+
+#------------------------------------------------------------------------------#
+
+def _parse_assignments(assignments, known, kind):
+    # NAME=DISTRIBUTION options, where letter case does not matter
+    byLower = dict([(name.lower(), name) for name in known])
+    parsed = {}
+    for assignment in assignments:
+        name, equals, distribution = assignment.partition("=")
+        if not equals or name.strip().lower() not in byLower:
+            raise ValueError("%r should be an %s's name, =, and a distribution" % (assignment, kind))
+        parsed[byLower[name.strip().lower()]] = Distribution(distribution)
+    
+    return parsed
+
+def main(arguments):
+    parser = optparse.OptionParser(usage = "%prog [options] count roster\n"
+                                           "       %prog [options] --import spreadsheet roster")
+    parser.add_option("-i", "--import", dest = "spreadsheet",
+                      help = "import the creatures of this .csv or .json spreadsheet instead of generating them")
+    parser.add_option("-s", "--seed", type = "int",
+                      help = "seed for generating [default: a random one]")
+    parser.add_option("-p", "--prefix", default = "Creature",
+                      help = "generated creatures are named this and their number [default: %default]")
+    parser.add_option("-a", "--attributes", default = DEFAULT_ATTRIBUTE_DISTRIBUTION,
+                      help = "distribution of every attribute [default: %default]")
+    parser.add_option("-k", "--skills", default = DEFAULT_SKILL_DISTRIBUTION,
+                      help = "distribution of every skill's level [default: %default]")
+    parser.add_option("-A", "--attribute", action = "append", default = [],
+                      help = "distribution of one attribute, as Strength=2d8+2; may be repeated")
+    parser.add_option("-K", "--skill", action = "append", default = [],
+                      help = "distribution of one skill's level, as Attack=1d4; may be repeated")
+    parser.add_option("-c", "--chunk-size", type = "int", dest = "chunkSize", default = CHUNK_SIZE,
+                      help = "creatures handled at a time [default: %default]")
+    options, rest = parser.parse_args(arguments)
+    if len(rest) != (1 if options.spreadsheet else 2):
+        parser.error("give a count and a roster to generate, or --import and a roster")
+    
+    start = default_timer()
+    try:
+        if options.spreadsheet:
+            path = rest[0]
+            with open(options.spreadsheet, "rb") as f:
+                if options.spreadsheet.lower().endswith(".json"):
+                    chunks = read_json_chunks(f, options.chunkSize)
+                else:
+                    chunks = read_csv_chunks(f, options.chunkSize)
+                count = write_roster_chunks(path, chunks)
+        else:
+            path = rest[1]
+            attributes = dict([(name, Distribution(options.attributes)) for name in ATTRIBUTE_NAMES])
+            attributes.update(_parse_assignments(options.attribute, ATTRIBUTE_NAMES, "attribute"))
+            skills = dict([(name, Distribution(options.skills)) for name in SKILL_NAMES])
+            skills.update(_parse_assignments(options.skill, SKILL_NAMES, "skill"))
+            chunks = generate_chunks(int(rest[0]), options.seed, attributes, skills, options.prefix,
+                                     options.chunkSize)
+            count = write_roster_chunks(path, chunks)
+    except (IOError, ValueError), e:
+        print >> sys.stderr, "%s: %s" % (os.path.basename(sys.argv[0]), e)
+        sys.exit(1)
+    elapsed = default_timer() - start
+    
+    print "%d creatures were written to %s in %.3f s (%.0f creatures/s)." % (count, path, elapsed,
+                                                                        count / max(elapsed, 1e-9))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
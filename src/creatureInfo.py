@@ -8,36 +8,110 @@ Classes:
     Creature
     Health
     CreatureList
+    CreatureStore
+    StoredCreature
+    StoredSkill
+    RecordCutShortError
+
+Functions:
+    attribute_bonus(int:score)          -> returns the bonus an attribute score
+                                            adds to skill rolls
+    encode_creature(Creature:creature)  -> returns the creature as a binary
+                                            creature record
+    encode_creature_rows(list:names, list:attributes, list:levels) -> returns
+                                            the records of creatures with full
+                                            health and the standard skills,
+                                            given as columns, without making
+                                            the creatures
+    decode_creature(string:data[, int:offset]) -> returns the creature in the
+                                            record at offset, and the offset
+                                            just past it
+    is_creature_record(string:data)     -> returns True if data starts with a
+                                            creature record
+    load_creature(file:f)               -> returns the creature saved in f,
+                                            which may also be a pickle written
+                                            by older versions
+    save_creature(Creature:creature, file:f) -> writes a creature record to f,
+                                            which should be opened in binary mode
 """
 
-from skillInfo import SkillList
+import cPickle
+import operator
+import struct
+import sys
+from array import array
+from itertools import imap, repeat
+from cStringIO import StringIO
+
+from skillInfo import SkillList, Skill, SkillDefinition, SKILL_DEFINITIONS
+from skillInfo import experience_gain, get_skill_definition
+from indexedList import NameIndexedList
+from changeTracking import mark_changed, ATTRIBUTE_SET, RENAMED, WP_DAMAGED, WP_HEALED
+from changeTracking import WP_RESTORED, STATUS_ADDED, STATUS_REMOVED, FATIGUE_RECOVERED
+from changeTracking import FATIGUE_RESTORED, FATIGUE_DRAINED
+import diceStream
     
 #------------------------------------------------------------------------------#
 
-class Creature:
+# the six attributes, in the order they are given to Creature()
+ATTRIBUTE_NAMES = ("Strength", "Dexterity", "Constitution", "Intelligence", "Wisdom", "Charisma")
+
+def attribute_bonus(score):
+    if score >= 10:
+        return int((score - 10) / 2)
+    else:
+        return int((score - 11) / 2)
+
+#------------------------------------------------------------------------------#
+
+class Creature(object):
 
     """
-    The SkillDnD class which holds and manages a creature.
+    The SkillDnD class which holds and manages a creature.  Creatures are
+    slotted to keep large populations small; they pickle to the same state
+    dictionary the old dict-based class did.
+    
+    The attribute bonus each skill gets is worked out on the skill's first
+    use and kept until an attribute changes, which is why attributes are
+    only changed through set_attribute().
+    
+    Changes made through the mutators of a creature, its health and its
+    skills are recorded by changeTracking while it is tracking or
+    journalling.
     
     Functions:
         get_name()                -> returns the creature's name string
+        set_name(string:name)     -> renames the creature; creatures held in
+                                    a CreatureList should be renamed through
+                                    CreatureList.rename()
         get_attributes()           -> returns a dictionary with keys of attribute
-                                    name, and values equal to the attribute's value
+                                    name, and values equal to the attribute's value;
+                                    changing it does not change the creature
+        get_attribute(string:name) -> returns the value of one attribute
+        set_attribute(string:name, int:value) -> sets the value of one attribute
+        get_attribute_bonus(Skill:skill) -> returns the bonus the creature's
+                                    attributes give to the skill
         get_skills([string:whatToReturn]) -> returns a list of the creature's skills
+        get_health()              -> returns the creature's Health
         get_wound_percentage()    -> returns the value for the creature's wound
                                     point percentage
         get_status_effects()      -> returns a list of status effects affecting
                                     the creature
         get_fatigue_percentage()  -> returns the value for the creature's fatigue
                                     percentage
-        use_skill(string:skillName[,int:difficulty,Creature:target, int:modifiers]) -> returns a
+        use_skill(string:skillName[,int:difficulty,Creature:target, int:modifiers, DiceStream:dice]) -> returns a
                                     value indicating the degree of success of
                                     the action
     """
     
+    __slots__ = ("__name", "__attributes", "__health", "__skills", "__bonuses")
+    
+    # set to False to work out attribute bonuses on every skill use
+    useBonusCache = True
+    
     def __init__(self, name, strength = 0, dexterity = 0, constitution = 0,
                  intelligence = 0, wisdom = 0, charisma = 0, wp = -1, fatigue = -1,
-                 status = ["None"], skills = None):
+                 status = ("None",), skills = None):
         self.__name = name
         self.__attributes = { "Strength"     : strength,
                               "Dexterity"    : dexterity,
@@ -54,12 +128,64 @@ class Creature:
             self.__skills = skills
         else:
             self.__skills = SkillList()
+        
+        self.__bonuses = None
+    
+    def __getstate__(self):
+        return { "_Creature__name"       : self.__name,
+                 "_Creature__attributes" : self.__attributes,
+                 "_Creature__health"     : self.__health,
+                 "_Creature__skills"     : self.__skills }
+    
+    def __setstate__(self, state):
+        self.__name = state["_Creature__name"]
+        self.__attributes = state["_Creature__attributes"]
+        self.__health = state["_Creature__health"]
+        self.__skills = state["_Creature__skills"]
+        self.__bonuses = None
                            
     def get_name(self):
         return self.__name
+    
+    def set_name(self, name):
+        mark_changed(self, RENAMED, name)
+        self.__name = name
         
     def get_attributes(self):
-        return self.__attributes
+        return self.__attributes.copy()
+    
+    def get_attribute(self, name):
+        return self.__attributes[name]
+    
+    def set_attribute(self, name, value):
+        if name not in self.__attributes:
+            raise KeyError(name)
+        
+        mark_changed(self, ATTRIBUTE_SET + ATTRIBUTE_NAMES.index(name), value)
+        self.__attributes[name] = value
+        self.__bonuses = None
+    
+    def get_attribute_bonus(self, skill):
+        # bonuses are cached by skill definition, which never changes
+        bonuses = self.__bonuses
+        if bonuses is None:
+            if not Creature.useBonusCache:
+                return self.__compute_bonus(skill)
+            bonuses = self.__bonuses = {}
+        
+        definition = skill.get_definition()
+        bonus = bonuses.get(definition)
+        if bonus is None:
+            bonus = bonuses[definition] = self.__compute_bonus(skill)
+        
+        return bonus
+    
+    def __compute_bonus(self, skill):
+        attributeBonus = 0
+        for i in skill.get_associated_attributes():
+            attributeBonus += attribute_bonus(self.__attributes[i])
+        
+        return attributeBonus
     
     def get_skills(self, whatToReturn = "all names"):
         if whatToReturn == "list of Skill":
@@ -67,6 +193,9 @@ class Creature:
         else:
             return self.__skills.get_all_skill_names()
     
+    def get_health(self):
+        return self.__health
+    
     def get_wound_percentage(self):
         return self.__health.get_wound_percentage()
         
@@ -76,26 +205,21 @@ class Creature:
     def get_fatigue_percentage(self):
         return self.__health.get_fatigue_percentage()
         
-    def use_skill(self, skillName, difficulty = 0, target = None, modifiers = 0):
+    def use_skill(self, skillName, difficulty = 0, target = None, modifiers = 0, dice = None):
         # set initial variables
         skill = self.__skills.get_skill(skillName)
-        attributeBonus = 0
-        for i in skill.get_associated_attributes():
-            if self.__attributes[i] >= 10:
-                attributeBonus += int((self.__attributes[i] - 10) / 2)
-            else:
-                attributeBonus += int((self.__attributes[i] - 11) / 2)
         
-        return skill.use(attributeBonus, difficulty, target, modifiers)
+        return skill.use(self.get_attribute_bonus(skill), difficulty, target, modifiers, dice)
             
 #------------------------------------------------------------------------------#
 
 from math import sqrt
 
-class Health:
+class Health(object):
 
     """
-    A management class controlling a creature's health.
+    A management class controlling a creature's health.  Status effects are
+    kept as a tuple, so creatures without any share the same one.
     
     Functions:
         get_max_wp()                            -> returns the max wound point value
@@ -115,7 +239,10 @@ class Health:
         drain_fatigue(int:amount)               -> returns modified fatigue value
     """
     
-    def __init__(self, conScore, strScore, status = ["None"], curWP = -1, curFatigue = -1):
+    __slots__ = ("__maxWoundPoints", "__currentWoundPoints", "__status",
+                 "__maxFatigue", "__currentFatigue")
+    
+    def __init__(self, conScore, strScore, status = ("None",), curWP = -1, curFatigue = -1):
         self.__maxWoundPoints = conScore
         
         if curWP == -1:
@@ -123,7 +250,7 @@ class Health:
         else:
             self.__currentWoundPoints = curWP
         
-        self.__status = status
+        self.__status = _status_tuple(status)
         
         self.__maxFatigue = self.__maxWoundPoints + strScore
         
@@ -131,6 +258,20 @@ class Health:
             self.__currentFatigue = self.__maxFatigue
         else:
             self.__currentFatigue = curFatigue
+    
+    def __getstate__(self):
+        return { "_Health__maxWoundPoints"     : self.__maxWoundPoints,
+                 "_Health__currentWoundPoints" : self.__currentWoundPoints,
+                 "_Health__status"             : list(self.__status),
+                 "_Health__maxFatigue"         : self.__maxFatigue,
+                 "_Health__currentFatigue"     : self.__currentFatigue }
+    
+    def __setstate__(self, state):
+        self.__maxWoundPoints = state["_Health__maxWoundPoints"]
+        self.__currentWoundPoints = state["_Health__currentWoundPoints"]
+        self.__status = _status_tuple(state["_Health__status"])
+        self.__maxFatigue = state["_Health__maxFatigue"]
+        self.__currentFatigue = state["_Health__currentFatigue"]
         
     def get_max_wp(self):
         return self.__maxWoundPoints
@@ -149,7 +290,7 @@ class Health:
         return percentage
     
     def get_status(self):
-        return self.__status
+        return list(self.__status)
         
     def get_max_fatigue(self):
         return self.__maxFatigue
@@ -168,6 +309,7 @@ class Health:
         return percentage
     
     def damage_wp(self, amount = 1):
+        mark_changed(self, WP_DAMAGED, amount)
         self.__currentWoundPoints -= amount
         
         if self.__currentWoundPoints <= 0:
@@ -178,8 +320,10 @@ class Health:
     
     def heal_wp(self, amount = 1, fullRecover = False):
         if fullRecover:
+            mark_changed(self, WP_RESTORED)
             self.__currentWoundPoints = self.__maxWoundPoints
         else:
+            mark_changed(self, WP_HEALED, amount)
             self.__currentWoundPoints += amount
         
             if self.__currentWoundPoints > self.__maxWoundPoints:
@@ -188,23 +332,27 @@ class Health:
         return self.__currentWoundPoints
     
     def add_status_effect(self, effect):
-        if self.__status.find("None") > 0:
-            self.__status.remove("None")
+        mark_changed(self, STATUS_ADDED, effect)
+        status = [i for i in self.__status if i != "None"]
+        status.append(effect)
         
-        self.__status.append(effect)
+        self.__status = _status_tuple(status)
     
     def remove_status_effect(self, effect):
-        returnee = self.__status.remove(effect)
+        mark_changed(self, STATUS_REMOVED, effect)
+        status = list(self.__status)
+        status.remove(effect)
         
-        if len(self.__status) == 0:
-            self.__status.append("None")
+        self.__status = _status_tuple(status)
         
-        return returnee
+        return effect
     
     def recover_fatigue(self, amount = 1, fullRecover = False):
         if fullRecover:
+            mark_changed(self, FATIGUE_RESTORED)
             self.__currentFatigue = self.__maxFatigue
         else:
+            mark_changed(self, FATIGUE_RECOVERED, amount)
             self.__currentFatigue += amount
         
             if self.__currentFatigue > self.__maxFatigue:
@@ -213,6 +361,7 @@ class Health:
         return self.__currentFatigue
     
     def drain_fatigue(self, amount = 1):
+        mark_changed(self, FATIGUE_DRAINED, amount)
         self.__currentFatigue -= amount
         
         if self.__currentFatigue < 0:
@@ -222,39 +371,791 @@ class Health:
         
         return self.__currentFatigue
     
+# the status of every creature with no status effects
+_NO_STATUS = ("None",)
+
+def _status_tuple(status):
+    status = tuple(status)
+    if len(status) == 0 or status == _NO_STATUS:
+        return _NO_STATUS
+    
+    return status
+
 #------------------------------------------------------------------------------#
 
-class CreatureList(list):
+class CreatureList(NameIndexedList):
     """
-    A subclass of the list type which manages a list of creatures.
+    A subclass of the list type which manages a list of creatures.  The
+    creatures are indexed by name, so lookups and removals by name do not
+    scan the list.  Several creatures may share a name; the one nearest the
+    front of the list is the one found by name.
     
     Functions:
         remove_by_name(string:name)
         get_by_name(string:name)
         find_index_by_name(string:name)
+        get_names()
+        rename(string:oldName, string:newName)
     """
     
     def __init__(self):
-        list.__init__(self)
+        NameIndexedList.__init__(self)
+    
+#------------------------------------------------------------------------------#
+
+def _numpy():
+    # numpy is optional; without it the store answers queries in Python
+    try:
+        import numpy
+    except ImportError:
+        return None
+    
+    return numpy
+
+class CreatureStore(object):
+
+    """
+    A column oriented store for large populations of creatures.  Instead of
+    one Creature object per creature, the store keeps each attribute, the
+    current and max wound points and fatigue, and the level and experience
+    of every skill in its own contiguous array of ints, one entry per row.
+    StoredCreature views, which follow the Creature getters, are handed out
+    on request.
+    
+    Population wide queries work on whole columns.  When numpy is installed
+    they are vectorized over zero-copy views of the columns and return numpy
+    arrays of rows; without it they loop in Python and return lists.
     
-    def remove_by_name(self, name):
-        index = self.find_index_by_name(name)
+    Rows are only ever appended, so a row number stays valid for the life
+    of the store.
+    
+    Functions:
+        append(Creature:creature)       -> copies a creature into the store and
+                                            returns its row
+        add(string:name[, ...])         -> adds a creature from raw values, with
+                                            the same arguments as Creature(),
+                                            and returns its row
+        extend_columns(list:names, list:attributes[, dict:skillLevels]) ->
+                                            adds creatures with full health
+                                            from columns of values, a whole
+                                            column at a time
+        get(int:row)                    -> returns a StoredCreature view of a row
+        get_by_name(string:name)        -> returns a view of the first creature
+                                            with that name, or None
+        get_names()                     -> returns a list of the creature names
+        get_skill_names()               -> returns the names of the stored skills
+        to_creature(int:row)            -> returns a full Creature copy of a row
+        column(string:name)             -> returns a column's array
+        numpy_column(string:name)       -> returns a zero-copy numpy view of a
+                                            column, valid until the store grows
+        wound_percentages()             -> returns every row's wound percentage
+        fatigue_percentages()           -> returns every row's fatigue percentage
+        wounded_below(int:percentage)   -> returns the rows whose wound
+                                            percentage is below percentage
+        fatigued_below(int:percentage)  -> returns the rows whose fatigue
+                                            percentage is below percentage
+        skill_at_least(string:skillName, int:level) -> returns the rows with that
+                                            skill at level or above
+    
+    Columns are named after the attributes ("Strength", ...), "current wp",
+    "max wp", "current fatigue", "max fatigue", and "<skill> level" and
+    "<skill> exp" for each skill.
+    """
+    
+    def __init__(self, skillDefinitions = SKILL_DEFINITIONS):
+        self.__names = []
+        self.__rowsByName = {}
+        self.__status = {}
+        self.__skillDefinitions = tuple(skillDefinitions)
+        
+        self.__columns = {}
+        columnNames = list(ATTRIBUTE_NAMES) + ["current wp", "max wp", "current fatigue", "max fatigue"]
+        for definition in self.__skillDefinitions:
+            columnNames.append(definition.get_name() + " level")
+            columnNames.append(definition.get_name() + " exp")
+        for name in columnNames:
+            self.__columns[name] = array("i")
         
-        # remove the creature from the list if it was found
-        if index >= 0:
-            return self.pop(index)
+        self.__attributeColumns = [self.__columns[i] for i in ATTRIBUTE_NAMES]
+        self.__skillColumns = [(d, self.__columns[d.get_name() + " level"], self.__columns[d.get_name() + " exp"])
+                               for d in self.__skillDefinitions]
+    
+    def __len__(self):
+        return len(self.__names)
+    
+    def __iter__(self):
+        for row in xrange(len(self.__names)):
+            yield StoredCreature(self, row)
+    
+    # ----- adding creatures ----- #
+    
+    def add(self, name, strength = 0, dexterity = 0, constitution = 0,
+            intelligence = 0, wisdom = 0, charisma = 0, wp = -1, fatigue = -1,
+            status = ("None",), skillLevels = None, skillExp = None):
+        # skillLevels and skillExp map skill names to values; skills that are
+        # left out start at zero
+        row = len(self.__names)
+        
+        attributes = (strength, dexterity, constitution, intelligence, wisdom, charisma)
+        for column, value in zip(self.__attributeColumns, attributes):
+            column.append(value)
+        
+        # same rules as Health
+        maxFatigue = constitution + strength
+        if wp == -1:
+            wp = constitution
+        if fatigue == -1:
+            fatigue = maxFatigue
+        
+        self.__columns["max wp"].append(constitution)
+        self.__columns["current wp"].append(wp)
+        self.__columns["max fatigue"].append(maxFatigue)
+        self.__columns["current fatigue"].append(fatigue)
+        
+        for definition, levels, exps in self.__skillColumns:
+            skillName = definition.get_name()
+            levels.append(skillLevels and skillLevels.get(skillName, 0) or 0)
+            exps.append(skillExp and skillExp.get(skillName, 0) or 0)
+        
+        status = _status_tuple(status)
+        if status is not _NO_STATUS:
+            self.__status[row] = status
+        
+        self.__names.append(name)
+        self.__rowsByName.setdefault(name, row)
+        
+        return row
+    
+    def append(self, creature):
+        attributes = creature.get_attributes()
+        skills = creature.get_skills("list of Skill")
+        health = creature.get_health()
+        
+        row = self.add(creature.get_name(), *[attributes[i] for i in ATTRIBUTE_NAMES],
+                       **{ "status" : creature.get_status_effects(),
+                           "skillLevels" : dict([(sk.get_name(), sk.get_level()) for sk in skills]),
+                           "skillExp" : dict([(sk.get_name(), sk.get_exp()) for sk in skills]) })
+        
+        # keep the creature's own health rather than recomputing it
+        self.__columns["max wp"][row] = health.get_max_wp()
+        self.__columns["current wp"][row] = health.get_current_wp()
+        self.__columns["max fatigue"][row] = health.get_max_fatigue()
+        self.__columns["current fatigue"][row] = health.get_current_fatigue()
+        
+        return row
+    
+    def extend(self, creatures):
+        for creature in creatures:
+            self.append(creature)
+    
+    def extend_columns(self, names, attributes, skillLevels = None):
+        # attributes holds a column for each of ATTRIBUTE_NAMES and
+        # skillLevels maps skill names to columns; columns may be lists,
+        # arrays or numpy arrays
+        count = len(names)
+        attributes = [_int_list(column) for column in attributes]
+        for column in attributes:
+            if len(column) != count:
+                raise ValueError("every column needs a value for each name")
+        
+        firstRow = len(self.__names)
+        for column, values in zip(self.__attributeColumns, attributes):
+            column.fromlist(values)
+        
+        # same rules as Health, with full health
+        strength, constitution = attributes[0], attributes[2]
+        maxFatigue = map(operator.add, constitution, strength)
+        self.__columns["max wp"].fromlist(constitution)
+        self.__columns["current wp"].fromlist(constitution)
+        self.__columns["max fatigue"].fromlist(maxFatigue)
+        self.__columns["current fatigue"].fromlist(maxFatigue)
+        
+        zeros = array("i", [0]) * count
+        for definition, levels, exps in self.__skillColumns:
+            values = skillLevels and skillLevels.get(definition.get_name())
+            if values is None:
+                levels.extend(zeros)
+            else:
+                values = _int_list(values)
+                if len(values) != count:
+                    raise ValueError("every column needs a value for each name")
+                levels.fromlist(values)
+            exps.extend(zeros)
+        
+        self.__names.extend(names)
+        rowsByName = self.__rowsByName
+        for row, name in enumerate(names, firstRow):
+            if name not in rowsByName:
+                rowsByName[name] = row
+    
+    # ----- reading creatures ----- #
+    
+    def get(self, row):
+        if row < 0 or row >= len(self.__names):
+            raise IndexError("creature store row out of range")
+        
+        return StoredCreature(self, row)
     
     def get_by_name(self, name):
-        return self[self.find_index_by_name(name)]
+        row = self.__rowsByName.get(name)
+        if row is None:
+            return None
+        
+        return StoredCreature(self, row)
+    
+    def get_names(self):
+        return list(self.__names)
+    
+    def get_name(self, row):
+        return self.__names[row]
+    
+    def get_skill_names(self):
+        return [d.get_name() for d in self.__skillDefinitions]
+    
+    def get_skill_definitions(self):
+        return self.__skillDefinitions
+    
+    def get_status(self, row):
+        return self.__status.get(row, _NO_STATUS)
+    
+    def set_status(self, row, status):
+        status = _status_tuple(status)
+        if status is _NO_STATUS:
+            self.__status.pop(row, None)
+        else:
+            self.__status[row] = status
+    
+    def to_creature(self, row):
+        columns = self.__columns
+        skills = SkillList(empty = True)
+        for definition, levels, exps in self.__skillColumns:
+            skills.append(Skill(definition, lvl = levels[row], exp = exps[row]))
+        
+        currentWP = columns["current wp"][row]
+        creature = Creature(self.__names[row], *[column[row] for column in self.__attributeColumns],
+                            **{ "wp" : currentWP, "fatigue" : columns["current fatigue"][row],
+                                "status" : self.get_status(row), "skills" : skills })
+        
+        if currentWP == -1:
+            # -1 asks Creature() for full health, so take the wounds off after
+            health = creature.get_health()
+            health.damage_wp(health.get_current_wp() + 1)
+        
+        return creature
+    
+    # ----- columns ----- #
+    
+    def column(self, name):
+        return self.__columns[name]
+    
+    def numpy_column(self, name):
+        # the view shares the array's memory, which moves when the array grows
+        numpy = _numpy()
+        column = self.__columns[name]
+        if len(column) == 0:
+            return numpy.zeros(0, dtype = numpy.intc)
+        
+        return numpy.frombuffer(column, dtype = numpy.intc)
+    
+    # ----- population queries ----- #
+    
+    def wound_percentages(self):
+        return self.__percentages("current wp", "max wp")
+    
+    def fatigue_percentages(self):
+        return self.__percentages("current fatigue", "max fatigue")
+    
+    def wounded_below(self, percentage):
+        return self.__rows_below(self.wound_percentages(), percentage)
+    
+    def fatigued_below(self, percentage):
+        return self.__rows_below(self.fatigue_percentages(), percentage)
+    
+    def skill_at_least(self, skillName, level):
+        numpy = _numpy()
+        if numpy is not None:
+            return numpy.flatnonzero(self.numpy_column(skillName + " level") >= level)
+        
+        levels = self.__columns[skillName + " level"]
+        return [row for row in xrange(len(levels)) if levels[row] >= level]
+    
+    def __percentages(self, currentName, maxName):
+        # same arithmetic as Health, where a max of zero counts as 100%
+        numpy = _numpy()
+        if numpy is not None:
+            current = self.numpy_column(currentName).astype(numpy.float64)
+            maximum = self.numpy_column(maxName).astype(numpy.float64)
+            percentages = numpy.full(len(current), 100, dtype = numpy.intc)
+            nonzero = maximum != 0
+            percentages[nonzero] = (100.0 * (current[nonzero] / maximum[nonzero])).astype(numpy.intc)
+            return percentages
+        
+        percentages = array("i")
+        for current, maximum in zip(self.__columns[currentName], self.__columns[maxName]):
+            if maximum == 0:
+                percentages.append(100)
+            else:
+                percentages.append(int(100.0 * (float(current) / float(maximum))))
+        
+        return percentages
+    
+    def __rows_below(self, percentages, percentage):
+        numpy = _numpy()
+        if numpy is not None:
+            return numpy.flatnonzero(percentages < percentage)
+        
+        return [row for row in xrange(len(percentages)) if percentages[row] < percentage]
+
+#------------------------------------------------------------------------------#
+
+class StoredCreature(object):
+
+    """
+    A lightweight view of one row of a CreatureStore which follows the
+    Creature getters.  Reads and writes go straight to the store's columns.
+    
+    Functions:
+        get_row()                 -> returns the view's row in the store
+        get_name()
+        get_attributes()
+        get_attribute(string:name)
+        set_attribute(string:name, int:value)
+        get_attribute_bonus(Skill:skill)
+        get_skills([string:whatToReturn])
+        get_wound_percentage()
+        get_status_effects()
+        get_fatigue_percentage()
+        use_skill(string:skillName[,int:difficulty,Creature:target, int:modifiers, DiceStream:dice])
+    """
+    
+    __slots__ = ("__store", "__row")
+    
+    def __init__(self, store, row):
+        self.__store = store
+        self.__row = row
     
-    def find_index_by_name(self, name):
-        for i in range(len(self)):
-            if self[i].get_name() == name:
-                return i
-                
-        # if creature not found return a value beyond bounds of the list
-        return -1
+    def get_row(self):
+        return self.__row
     
+    def get_store(self):
+        return self.__store
+    
+    def get_name(self):
+        return self.__store.get_name(self.__row)
+    
+    def get_attributes(self):
+        store = self.__store
+        row = self.__row
+        return dict([(i, store.column(i)[row]) for i in ATTRIBUTE_NAMES])
+    
+    def get_attribute(self, name):
+        # the store has health columns too, which are not attributes
+        if name not in ATTRIBUTE_NAMES:
+            raise KeyError(name)
+        
+        return self.__store.column(name)[self.__row]
+    
+    def set_attribute(self, name, value):
+        if name not in ATTRIBUTE_NAMES:
+            raise KeyError(name)
+        
+        self.__store.column(name)[self.__row] = value
+    
+    def get_attribute_bonus(self, skill):
+        attributeBonus = 0
+        for i in skill.get_associated_attributes():
+            attributeBonus += attribute_bonus(self.__store.column(i)[self.__row])
+        
+        return attributeBonus
+    
+    def get_skills(self, whatToReturn = "all names"):
+        if whatToReturn == "list of Skill":
+            skills = SkillList(empty = True)
+            for definition in self.__store.get_skill_definitions():
+                skills.append(StoredSkill(self.__store, self.__row, definition))
+            return skills
+        else:
+            return self.__store.get_skill_names()
+    
+    def get_wound_percentage(self):
+        return _percentage(self.__store.column("current wp")[self.__row],
+                           self.__store.column("max wp")[self.__row])
+    
+    def get_status_effects(self):
+        return list(self.__store.get_status(self.__row))
+    
+    def get_fatigue_percentage(self):
+        return _percentage(self.__store.column("current fatigue")[self.__row],
+                           self.__store.column("max fatigue")[self.__row])
+    
+    def use_skill(self, skillName, difficulty = 0, target = None, modifiers = 0, dice = None):
+        skill = StoredSkill(self.__store, self.__row, self.__get_definition(skillName))
+        
+        return skill.use(self.get_attribute_bonus(skill), difficulty, target, modifiers, dice)
+    
+    def __get_definition(self, skillName):
+        for definition in self.__store.get_skill_definitions():
+            if definition.get_name() == skillName:
+                return definition
+        
+        raise KeyError(skillName)
+    
+    def __repr__(self):
+        return "<StoredCreature %r, row %d>" % (self.get_name(), self.__row)
+
+def _percentage(current, maximum):
+    percentage = 100
+    
+    try:
+        percentage = int( 100.0 * ( float(current) / float(maximum) ) )
+    except ZeroDivisionError:
+        pass
+    
+    return percentage
+
+#------------------------------------------------------------------------------#
+
+class StoredSkill(object):
+
+    """
+    A view of one skill of one row of a CreatureStore which follows the
+    Skill getters and mutators.
+    """
+    
+    __slots__ = ("__levels", "__exps", "__row", "__definition")
+    
+    def __init__(self, store, row, definition):
+        self.__levels = store.column(definition.get_name() + " level")
+        self.__exps = store.column(definition.get_name() + " exp")
+        self.__row = row
+        self.__definition = definition
+    
+    def get_definition(self):
+        return self.__definition
+    
+    def get_level(self):
+        return self.__levels[self.__row]
+    
+    def get_exp(self):
+        return self.__exps[self.__row]
+    
+    def get_description(self):
+        return self.__definition.get_description()
+    
+    def get_name(self):
+        return self.__definition.get_name()
+    
+    def get_associated_attributes(self):
+        return self.__definition.get_associated_attributes()
+    
+    def get_opposing_skill(self):
+        return self.__definition.get_opposing_skill()
+    
+    def set_level(self, lvl):
+        self.__levels[self.__row] = lvl
+    
+    def set_exp(self, exp):
+        self.__exps[self.__row] = exp
+    
+    def level_up(self, numOfLevels = 1):
+        self.__levels[self.__row] += numOfLevels
+        self.__exps[self.__row] = 0
+    
+    def gain_exp(self, skillCheckResult):
+        self.__exps[self.__row] += experience_gain(skillCheckResult)
+        
+        if self.__exps[self.__row] >= 100:
+            self.level_up()
+    
+    def use(self, attributeBonus, dc = 0, target = None, modifiers = 0, dice = None):
+        # same as Skill.use
+        if dice is None:
+            dice = diceStream.defaultDice
+        
+        roll = self.get_level() + attributeBonus + modifiers + dice.roll()
+        
+        if target is not None and self.get_opposing_skill() is not None:
+            result = target.use_skill(self.get_opposing_skill(), roll, dice = dice)
+        else:
+            result = roll - dc
+        
+        self.gain_exp(result)
+        
+        return result
+
+#------------------------------------------------------------------------------#
+
+# Creature records, version 1.  Integers are little-endian and strings are
+# utf-8, each preceded by its length as an unsigned short.
+#
+#   header      4s "SDNC", B format version
+#   name        string
+#   attributes  6i in ATTRIBUTE_NAMES order
+#   health      4i max wp, current wp, max fatigue, current fatigue
+#   status      H count, then each effect as a string
+#   skills      H count, then for each skill its name string and B kind,
+#               i level, i experience; a kind 1 (non-standard) skill goes on
+#               with B count and the associated attribute strings, the
+#               opposing skill string (empty for none) and the description
+CREATURE_FORMAT_VERSION = 1
+
+_MAGIC = "SDNC"
+_HEADER = struct.Struct("<4sB")
+_SHORT = struct.Struct("<H")
+_BYTE = struct.Struct("<B")
+# attributes, health and the number of status effects
+_BODY = struct.Struct("<6i4iH")
+_SKILL = struct.Struct("<Bii")
+
+_STANDARD_SKILL = 0
+_CUSTOM_SKILL = 1
+
+def encode_creature(creature):
+    parts = [_HEADER.pack(_MAGIC, CREATURE_FORMAT_VERSION), _pack_string(creature.get_name())]
+    
+    attributes = creature.get_attributes()
+    health = creature.get_health()
+    status = health.get_status()
+    values = [attributes[name] for name in ATTRIBUTE_NAMES]
+    values.extend([health.get_max_wp(), health.get_current_wp(),
+                   health.get_max_fatigue(), health.get_current_fatigue(), len(status)])
+    parts.append(_BODY.pack(*values))
+    parts.extend([_pack_string(effect) for effect in status])
+    
+    skills = creature.get_skills("list of Skill")
+    parts.append(_SHORT.pack(len(skills)))
+    for skill in skills:
+        definition = skill.get_definition()
+        parts.append(_pack_string(definition.get_name()))
+        
+        # the standard skills are shared definitions, so only their names
+        # need saving
+        if definition in SKILL_DEFINITIONS:
+            parts.append(_SKILL.pack(_STANDARD_SKILL, skill.get_level(), skill.get_exp()))
+        else:
+            parts.append(_SKILL.pack(_CUSTOM_SKILL, skill.get_level(), skill.get_exp()))
+            attributeNames = definition.get_associated_attributes()
+            parts.append(_BYTE.pack(len(attributeNames)))
+            parts.extend([_pack_string(name) for name in attributeNames])
+            parts.append(_pack_string(definition.get_opposing_skill() or ""))
+            parts.append(_pack_string(definition.get_description()))
+    
+    return "".join(parts)
+
+# the part of a record which follows the name, for creatures with no status
+# effects (which Health keeps as the one effect "None") and just the
+# standard skills: the attributes and health, then each skill's level.  The
+# bytes between two levels are the same in every such record (the end of
+# the status effects or the last skill's experience, 0, then the skill's
+# packed name and kind), so each run of them is packed as one string, and
+# the last skill's experience as padding, which halves the values packed
+_NO_STATUS_RECORD = "".join([_SHORT.pack(len(effect)) + effect for effect in _NO_STATUS])
+_STANDARD_SKILL_NAMES = [_SHORT.pack(len(d.get_name())) + d.get_name() for d in SKILL_DEFINITIONS]
+_STANDARD_GAPS = [before + name + _BYTE.pack(_STANDARD_SKILL) for before, name in
+                  zip([_SHORT.pack(len(_NO_STATUS)) + _NO_STATUS_RECORD + _SHORT.pack(len(_STANDARD_SKILL_NAMES))] +
+                      [struct.pack("<i", 0)] * (len(_STANDARD_SKILL_NAMES) - 1), _STANDARD_SKILL_NAMES)]
+_STANDARD_TAIL = struct.Struct("<6i4i" + "".join(["%dsi" % len(gap) for gap in _STANDARD_GAPS]) + "4x")
+_STANDARD_START = struct.Struct("<4sBH")
+
+def encode_creature_rows(names, attributes, levels):
+    # attributes holds a column for each of ATTRIBUTE_NAMES, and levels one
+    # for each of SKILL_DEFINITIONS; the records are built a column at a
+    # time where possible, and with a single pack each
+    attributes = [_int_list(column) for column in attributes]
+    levels = [_int_list(column) for column in levels]
+    count = len(names)
+    if [len(column) for column in attributes + levels] != [count] * len(attributes + levels):
+        raise ValueError("every column needs a value for each name")
+    strength, constitution = attributes[0], attributes[2]
+    maxFatigue = map(operator.add, constitution, strength)
+    
+    # each record's values, a column at a time, with the constant runs
+    # between the skills' levels spliced in; imap calls pack with a value
+    # from each column, and stops where the columns do
+    skillParts = []
+    for gap, column in zip(_STANDARD_GAPS, levels):
+        skillParts.extend([repeat(gap, count), column])
+    try:
+        tails = list(imap(_STANDARD_TAIL.pack, *(attributes + [constitution, constitution, maxFatigue, maxFatigue] +
+                                                 skillParts)))
+    except struct.error, e:
+        raise ValueError("a score or level does not fit in a creature record (%s)" % e)
+    
+    # the header and names are packed as _pack_string would, a column at a
+    # time too
+    names = [name.encode("utf-8") if isinstance(name, unicode) else name for name in names]
+    lengths = map(len, names)
+    if count and max(lengths) > 0xffff:
+        raise ValueError("strings in creature records are limited to 65535 bytes")
+    starts = map(_STANDARD_START.pack, repeat(_MAGIC, count), repeat(CREATURE_FORMAT_VERSION, count), lengths)
+    
+    return map(operator.add, map(operator.add, starts, names), tails)
+
+def _int_list(column):
+    # numpy arrays hand over their values much faster with tolist()
+    if hasattr(column, "tolist"):
+        column = column.tolist()
+    
+    return [int(value) for value in column] if not isinstance(column, list) else column
+
+class RecordCutShortError(ValueError):
+
+    """
+    Raised by decode_creature when a record runs past the end of its data,
+    as the last record of a file cut short by a crash does.
+    """
+
+def is_creature_record(data):
+    return data[:len(_MAGIC)] == _MAGIC
+
+def decode_creature(data, offset = 0):
+    try:
+        return _decode_creature(data, offset)
+    except struct.error, e:
+        raise RecordCutShortError("creature record is cut short (%s)" % e)
+
+def _decode_creature(data, offset):
+    magic, version = _HEADER.unpack_from(data, offset)
+    if magic != _MAGIC:
+        raise ValueError("not a creature record")
+    if version > CREATURE_FORMAT_VERSION:
+        raise ValueError("creature record version %d is newer than this program can read" % version)
+    offset += _HEADER.size
+    
+    name, offset = _unpack_string(data, offset)
+    
+    body = _BODY.unpack_from(data, offset)
+    offset += _BODY.size
+    attributes = dict(zip(ATTRIBUTE_NAMES, body[:6]))
+    maxWP, wp, maxFatigue, fatigue, count = body[6:]
+    status = []
+    for i in xrange(count):
+        effect, offset = _unpack_string(data, offset)
+        status.append(effect)
+    
+    count, = _SHORT.unpack_from(data, offset)
+    offset += _SHORT.size
+    skillItems = []
+    for i in xrange(count):
+        skillName, offset = _unpack_string(data, offset)
+        kind, level, exp = _SKILL.unpack_from(data, offset)
+        offset += _SKILL.size
+        
+        if kind == _STANDARD_SKILL:
+            try:
+                definition = get_skill_definition(skillName)
+            except KeyError:
+                raise ValueError("%s is not a standard skill" % skillName)
+        elif kind == _CUSTOM_SKILL:
+            attributeCount, = _BYTE.unpack_from(data, offset)
+            offset += _BYTE.size
+            attributeNames = []
+            for j in xrange(attributeCount):
+                attributeName, offset = _unpack_string(data, offset)
+                attributeNames.append(attributeName)
+            opposing, offset = _unpack_string(data, offset)
+            description, offset = _unpack_string(data, offset)
+            definition = SkillDefinition(skillName, attributeNames, opposing or None, description)
+        else:
+            raise ValueError("unknown kind of skill %d" % kind)
+        
+        skillItems.append(Skill(definition, lvl = level, exp = exp))
+    
+    # the list is filled without its name index, which is then built on the
+    # first lookup, as for an unpickled list
+    skills = SkillList.__new__(SkillList)
+    list.extend(skills, skillItems)
+    
+    # health is restored as saved, since its maximums need not match the
+    # attributes any more
+    health = Health.__new__(Health)
+    health.__setstate__({ "_Health__maxWoundPoints"     : maxWP,
+                          "_Health__currentWoundPoints" : wp,
+                          "_Health__status"             : status,
+                          "_Health__maxFatigue"         : maxFatigue,
+                          "_Health__currentFatigue"     : fatigue })
+    
+    creature = Creature.__new__(Creature)
+    creature.__setstate__({ "_Creature__name"       : name,
+                            "_Creature__attributes" : attributes,
+                            "_Creature__health"     : health,
+                            "_Creature__skills"     : skills })
+    
+    return creature, offset
+
+def _pack_string(string):
+    if isinstance(string, unicode):
+        string = string.encode("utf-8")
+    if len(string) > 0xffff:
+        raise ValueError("strings in creature records are limited to 65535 bytes")
+    
+    return _SHORT.pack(len(string)) + string
+
+def _unpack_string(data, offset):
+    length, = _SHORT.unpack_from(data, offset)
+    start = offset + _SHORT.size
+    end = start + length
+    if end > len(data):
+        raise RecordCutShortError("creature record is cut short")
+    
+    return data[start:end], end
+
+#------------------------------------------------------------------------------#
+
+# files written before Creature, Health and Skill were slotted create their
+# objects with the "i" opcode, which calls the class with no arguments
+_LEGACY_PICKLE = "(icreatureInfo\nCreature\n"
+
+# the only globals a creature file may refer to
+_CREATURE_GLOBALS = { ("creatureInfo", "Creature") : Creature,
+                      ("creatureInfo", "Health")   : Health,
+                      ("skillInfo", "Skill")       : Skill,
+                      ("skillInfo", "SkillList")   : SkillList,
+                      ("skillInfo", "SkillDefinition") : None,
+                      ("copy_reg", "_reconstructor") : None,
+                      ("__builtin__", "list")      : list,
+                      ("__builtin__", "object")    : object }
+
+def _find_creature_global(module, name):
+    try:
+        found = _CREATURE_GLOBALS[(module, name)]
+    except KeyError:
+        raise cPickle.UnpicklingError("%s.%s is not allowed in a creature file" % (module, name))
+    
+    if found is None:
+        __import__(module)
+        found = getattr(sys.modules[module], name)
+    
+    return found
+
+def _find_legacy_global(module, name):
+    found = _find_creature_global(module, name)
+    
+    if found in (Creature, Health, Skill):
+        # build an empty instance; the pickled state is then handed to
+        # __setstate__ as usual
+        return lambda: found.__new__(found)
+    
+    return found
+
+def load_creature(f):
+    data = f.read()
+    
+    if is_creature_record(data):
+        return decode_creature(data)[0]
+    
+    # files saved before creature records were pickles
+    unpickler = cPickle.Unpickler(StringIO(data))
+    if data.startswith(_LEGACY_PICKLE):
+        unpickler.find_global = _find_legacy_global
+    else:
+        unpickler.find_global = _find_creature_global
+    
+    return unpickler.load()
+
+def save_creature(creature, f):
+    f.write(encode_creature(creature))
+
 #------------------------------------------------------------------------------#
 
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module contains the dice which skill rolls are made with.
+
+Classes
+    DiceStream
+
+Functions
+    set_default_dice(DiceStream:dice)   -> sets the dice used when none are given
+
+The dice used when none are given are kept in defaultDice.
+"""
+
+import hashlib
+import os
+import random
+
+#------------------------------------------------------------------------------#
+
+def _numpy():
+    # numpy is optional; without it the dice are rolled with the random module
+    try:
+        import numpy
+    except ImportError:
+        return None
+    
+    return numpy
+
+class DiceStream(object):
+
+    """
+    A seedable stream of d20 rolls.  Rolls are generated in bulk into a
+    buffer and handed out one at a time, which is much cheaper than calling
+    randint for every roll.
+    
+    A stream is identified by its seed key, a tuple of ints.  spawn() hands
+    out child streams whose keys extend their parent's, so every encounter
+    or worker can be given its own stream, and the rolls each one sees do
+    not depend on how the work was divided up or in which order it ran.
+    Given the same key a stream always produces the same rolls (with numpy
+    installed the rolls come from numpy, so they differ from a stream with
+    the same key made without it).
+    
+    roll() and rolls() draw from the same sequence: rolls(n) returns the
+    same values n calls to roll() would have.
+    
+    Functions:
+        roll()              -> returns one d20 roll
+        rolls(int:n)        -> returns the next n rolls, as a numpy array when
+                                numpy is installed and a list otherwise
+        spawn([int:n])      -> returns a list of n new child streams
+        get_key()           -> returns the stream's seed key
+    """
+    
+    def __init__(self, seed = None, bufferSize = 4096):
+        if seed is None:
+            seed = int(hashlib.sha1(os.urandom(20)).hexdigest(), 16)
+        if isinstance(seed, tuple):
+            self.__key = tuple([int(i) for i in seed])
+        else:
+            self.__key = (int(seed),)
+        
+        self.__bufferSize = bufferSize
+        self.__children = 0
+        self.__generator = None
+        self.__numpy = None
+        
+        # the rolls still to be handed out, last one first
+        self.__buffer = []
+    
+    def get_key(self):
+        return self.__key
+    
+    def spawn(self, n = 1):
+        children = []
+        for i in range(n):
+            children.append(DiceStream(self.__key + (self.__children,), self.__bufferSize))
+            self.__children += 1
+        
+        return children
+    
+    def roll(self):
+        try:
+            return self.__buffer.pop()
+        except IndexError:
+            fresh = self.__draw_list(self.__bufferSize)
+            fresh.reverse()
+            self.__buffer = fresh
+            return fresh.pop()
+    
+    def rolls(self, n):
+        # use up what is left in the buffer before drawing more
+        buffer = self.__buffer
+        taken = min(n, len(buffer))
+        head = buffer[len(buffer) - taken:]
+        head.reverse()
+        del buffer[len(buffer) - taken:]
+        
+        rest = self.__draw(n - taken)
+        if self.__numpy is not None:
+            return self.__numpy.concatenate((self.__numpy.array(head, dtype = self.__numpy.int64), rest))
+        
+        return head + rest
+    
+    # ----- generation ----- #
+    
+    def __draw(self, n):
+        generator = self.__get_generator()
+        if self.__numpy is not None:
+            # 64 bit draws take one word of the generator each, so a stream
+            # comes out the same whatever sizes it is drawn in
+            return generator.randint(1, 21, size = n, dtype = self.__numpy.int64)
+        
+        draw = generator.random
+        return [int(draw() * 20) + 1 for i in xrange(n)]
+    
+    def __draw_list(self, n):
+        rolls = self.__draw(n)
+        if self.__numpy is not None:
+            return rolls.tolist()
+        
+        return rolls
+    
+    def __get_generator(self):
+        # made on first use, so creating a stream does not import numpy
+        if self.__generator is None:
+            digest = hashlib.sha256(",".join([str(i) for i in self.__key])).hexdigest()
+            numpy = _numpy()
+            if numpy is not None:
+                words = [int(digest[i:i + 8], 16) for i in range(0, len(digest), 8)]
+                self.__generator = numpy.random.RandomState(numpy.array(words, dtype = numpy.uint32))
+                self.__numpy = numpy
+            else:
+                self.__generator = random.Random(int(digest, 16))
+        
+        return self.__generator
+    
+    def __getstate__(self):
+        # generators are rebuilt from the key, so only the key and position
+        # travel to other processes
+        state = self.__dict__.copy()
+        state["_DiceStream__generator"] = None
+        state["_DiceStream__numpy"] = None
+        state["_DiceStream__buffer"] = []
+        if self.__generator is not None or self.__buffer:
+            raise ValueError("only unused dice streams can be sent to another process")
+        
+        return state
+
+#------------------------------------------------------------------------------#
+
+# the dice rolled when no others are given
+defaultDice = DiceStream()
+
+def set_default_dice(dice):
+    global defaultDice
+    defaultDice = dice
+
+#------------------------------------------------------------------------------#
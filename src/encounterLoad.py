@@ -0,0 +1,245 @@
+#! /usr/bin/env python
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module puts load on an encounterServer, and reports how long the
+server took to answer:
+
+    python encounterLoad.py [options]
+
+It makes its own creatures and encounters on the server.  Each creature
+gets a client connection of its own, which uses Attack on the next creature
+in its encounter, waits for the result, and does it again, until it has
+made its requests.  An answer can only come on the creature's turn, so
+the latency includes waiting for the rest of its encounter.  The creatures
+and encounters are removed at the end.
+
+With --malformed it first sends the server commands which are broken in
+various ways, and checks that each gets a failed result and that the
+connection stays open.
+
+Functions
+    run_load(address[, int:encounters, int:creatures, int:requests]) ->
+                                            returns the latency of every
+                                            request in seconds, and the time
+                                            the whole load took
+    percentile(list:values, float:fraction) -> returns the value which that
+                                            fraction of the sorted values are
+                                            no greater than
+    check_malformed(address)            -> sends malformed commands, and
+                                            returns a list of the problems
+                                            with the server's answers
+"""
+
+import asynchat
+import asyncore
+import json
+import optparse
+import socket
+import sys
+from timeit import default_timer
+
+from encounterServer import DEFAULT_PORT
+
+#------------------------------------------------------------------------------#
+
+# the percentiles reported
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _connect(address):
+    if isinstance(address, basestring):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+class _Setup(object):
+
+    # a blocking connection for making and removing the creatures and
+    # encounters, one command at a time
+    
+    def __init__(self, address):
+        self.__socket = _connect(address)
+        self.__file = self.__socket.makefile("rb")
+    
+    def call(self, command):
+        result = self.send_line(json.dumps(command))
+        if not result.get("ok"):
+            raise RuntimeError("%s failed: %s" % (command["op"], result.get("error")))
+        return result
+    
+    def send_line(self, line):
+        # returns the result, or None if the server closed the connection
+        self.__socket.sendall(line + "\n")
+        answer = self.__file.readline()
+        if not answer:
+            return None
+        return json.loads(answer)
+    
+    def close(self):
+        self.__file.close()
+        self.__socket.close()
+
+class _Client(asynchat.async_chat):
+
+    # one creature's connection: sends a request, and the next once the
+    # answer comes back
+    
+    def __init__(self, address, socketMap, command, requests, latencies):
+        asynchat.async_chat.__init__(self, _connect(address), socketMap)
+        self.__line = json.dumps(command) + "\n"
+        self.__left = requests
+        self.__latencies = latencies
+        self.__received = []
+        self.__sent = None
+        self.set_terminator("\n")
+    
+    def start(self):
+        self.__send()
+    
+    def collect_incoming_data(self, data):
+        self.__received.append(data)
+    
+    def found_terminator(self):
+        self.__latencies.append(default_timer() - self.__sent)
+        result = json.loads("".join(self.__received))
+        self.__received = []
+        if not result.get("ok"):
+            raise RuntimeError("use_skill failed: %s" % result.get("error"))
+        
+        if self.__left:
+            self.__send()
+        else:
+            self.close()
+    
+    def __send(self):
+        self.__left -= 1
+        self.__sent = default_timer()
+        self.push(self.__line)
+
+def run_load(address, encounters = 10, creatures = 4, requests = 200):
+    setup = _Setup(address)
+    names = []
+    try:
+        socketMap = {}
+        latencies = []
+        clients = []
+        for i in range(encounters):
+            encounter = "load %d" % i
+            order = ["load %d.%d" % (i, j) for j in range(creatures)]
+            for name in order:
+                setup.call({ "op" : "create", "name" : name, "strength" : 10, "dexterity" : 10,
+                             "skills" : { "Attack" : 5, "Defense" : 5 } })
+                names.append(name)
+            setup.call({ "op" : "start_encounter", "encounter" : encounter, "creatures" : order })
+            
+            for j, name in enumerate(order):
+                command = { "op" : "use_skill", "encounter" : encounter, "creature" : name,
+                            "skill" : "Attack", "target" : order[(j + 1) % creatures] }
+                clients.append(_Client(address, socketMap, command, requests, latencies))
+        
+        start = default_timer()
+        for client in clients:
+            client.start()
+        asyncore.loop(0.1, map = socketMap)
+        elapsed = default_timer() - start
+        
+        for i in range(encounters):
+            setup.call({ "op" : "end_encounter", "encounter" : "load %d" % i })
+    finally:
+        for name in names:
+            try:
+                setup.call({ "op" : "remove", "creature" : name })
+            except RuntimeError:
+                pass
+        setup.close()
+    
+    return latencies, elapsed
+
+#------------------------------------------------------------------------------#
+
+# commands which must fail, without closing the connection
+MALFORMED_COMMANDS = ['{"op":"create","name":"malformed","skills":[1]}',
+                      '{"op":"create","name":"malformed","strength":null}',
+                      '{"op":"create","name":["malformed"]}',
+                      '{"op":"query","creature":{"a":1}}',
+                      '{"op":"remove","creature":["malformed"]}',
+                      '{"op":"damage","creature":"malformed","amount":"lots"}',
+                      '{"op":"use_skill","encounter":[1],"creature":"malformed","skill":"Attack"}',
+                      '{"op":"use_skill","encounter":"none","actor":{},"skill":"Attack"}',
+                      '{"op":"start_encounter","encounter":{},"creatures":[[1],[2]]}',
+                      '{"op":"start_encounter","encounter":"malformed","creatures":"ab"}',
+                      '{"op":"end_encounter","encounter":[1]}',
+                      '{"op":"nothing"}',
+                      '[1, 2]',
+                      'not json']
+
+def check_malformed(address):
+    setup = _Setup(address)
+    problems = []
+    try:
+        for line in MALFORMED_COMMANDS:
+            result = setup.send_line(line)
+            if result is None:
+                problems.append("the server closed the connection after %s" % line)
+                setup.close()
+                setup = _Setup(address)
+            elif result.get("ok") or not result.get("error"):
+                problems.append("%s did not fail: %s" % (line, result))
+        
+        result = setup.send_line(json.dumps({ "op" : "query" }))
+        if result is None or not result.get("ok"):
+            problems.append("a query after the malformed commands failed: %s" % result)
+    finally:
+        setup.close()
+    
+    return problems
+
+def main(arguments):
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-H", "--host", default = "127.0.0.1",
+                      help = "address of the server [default: %default]")
+    parser.add_option("-p", "--port", type = "int", default = DEFAULT_PORT,
+                      help = "TCP port of the server [default: %default]")
+    parser.add_option("-u", "--unix",
+                      help = "connect to this Unix socket instead of TCP")
+    parser.add_option("-e", "--encounters", type = "int", default = 10,
+                      help = "encounters to run at once [default: %default]")
+    parser.add_option("-c", "--creatures", type = "int", default = 4,
+                      help = "creatures, and clients, in each encounter [default: %default]")
+    parser.add_option("-n", "--requests", type = "int", default = 200,
+                      help = "requests each client makes [default: %default]")
+    parser.add_option("-m", "--malformed", action = "store_true", default = False,
+                      help = "first check that malformed commands fail without closing the connection")
+    options, rest = parser.parse_args(arguments)
+    if rest:
+        parser.error("no arguments are taken")
+    if options.encounters < 1 or options.creatures < 2 or options.requests < 1:
+        parser.error("an encounter needs at least two creatures, and each at least one request")
+    
+    address = options.unix or (options.host, options.port)
+    if options.malformed:
+        problems = check_malformed(address)
+        for problem in problems:
+            print problem
+        if problems:
+            sys.exit(1)
+        print "%d malformed commands failed as they should" % len(MALFORMED_COMMANDS)
+    
+    latencies, elapsed = run_load(address, options.encounters, options.creatures, options.requests)
+    
+    print "%d requests from %d clients in %.3f s: %.0f requests/s" % (len(latencies),
+                                                                     options.encounters * options.creatures,
+                                                                     elapsed, len(latencies) / elapsed)
+    for fraction in PERCENTILES:
+        print "    p%-6s %10.3f ms" % ("%g" % (fraction * 100), percentile(latencies, fraction) * 1000.0)
+    print "    %-7s %10.3f ms" % ("max", max(latencies) * 1000.0)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
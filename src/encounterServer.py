@@ -0,0 +1,433 @@
+#! /usr/bin/env python
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module serves one set of creatures to many clients at once, for
+shared sessions.  Clients connect over TCP or a Unix socket and send
+skillBatch commands, one JSON object per line; a result is sent back for
+each, one per line:
+
+    python encounterServer.py [options]
+
+Creatures fight in encounters, each with a turn order.  A client starts one
+with {"op": "start_encounter", "encounter": name, "creatures": [names]}, in
+the order they take their turns, and ends it with "end_encounter".  A
+creature can only be in one encounter at a time.
+
+A use_skill, damage or heal command which names an "encounter" is queued
+for the turn of its "actor", which is its "creature" unless given; it is
+run when that creature's turn comes, and the turn then passes to the next.
+A creature which has nothing queued when its turn comes has TURN_TIMEOUT
+seconds before its turn is skipped.  Other commands, and those without an
+encounter, are run as soon as they arrive, so the results of one client's
+commands can come back out of order; give each an "id" to match them up.
+
+The server runs on one thread, and runs each command to the end before
+starting another, so a creature's changes never interleave.  An encounter
+waiting on a slow client holds up only its own turns; the others go on.
+
+Classes
+    Encounter
+    EncounterServer
+"""
+
+import asynchat
+import asyncore
+import collections
+import json
+import optparse
+import os
+import socket
+import sys
+from timeit import default_timer
+
+from skillBatch import run_command
+
+#------------------------------------------------------------------------------#
+
+# seconds a creature with nothing queued has before its turn is skipped
+TURN_TIMEOUT = 5.0
+
+# seconds the server waits for a socket before checking the turn timeouts
+POLL_INTERVAL = 0.05
+
+# the commands which take a turn when they name an encounter
+TURN_OPERATIONS = frozenset(["use_skill", "damage", "heal"])
+
+DEFAULT_PORT = 7420
+
+class Encounter(object):
+
+    """
+    The turn order of an encounter, and the commands queued for each of its
+    creatures' turns.  The queued items are whatever the server passes in;
+    take_ready() hands them back, in turn order, once they can be run.
+    
+    Functions:
+        get_name()                  -> returns the encounter's name
+        get_order()                 -> returns its creatures' names, in turn
+                                        order
+        get_current()               -> returns the name of the creature whose
+                                        turn it is
+        get_round()                 -> returns how many times every creature
+                                        has had its turn
+        queue(string:name, item)    -> queues an item for the creature's turn
+        take_ready()                -> returns the items whose turn has come,
+                                        passing the turn on after each
+        skip_if_idle(float:now)     -> passes the turn on if the creature has
+                                        nothing queued and its time is up
+        take_all()                  -> returns every queued item, emptying
+                                        the queues
+    """
+    
+    def __init__(self, name, order, timeout = TURN_TIMEOUT):
+        self.__name = name
+        self.__order = list(order)
+        self.__queues = dict([(creature, collections.deque()) for creature in self.__order])
+        self.__timeout = timeout
+        self.__turn = 0
+        self.__round = 0
+        self.__deadline = default_timer() + timeout
+    
+    def get_name(self):
+        return self.__name
+    
+    def get_order(self):
+        return list(self.__order)
+    
+    def get_current(self):
+        return self.__order[self.__turn]
+    
+    def get_round(self):
+        return self.__round
+    
+    def queue(self, name, item):
+        self.__queues[name].append(item)
+    
+    def take_ready(self):
+        ready = []
+        queue = self.__queues[self.__order[self.__turn]]
+        while queue:
+            ready.append(queue.popleft())
+            self.__next_turn()
+            queue = self.__queues[self.__order[self.__turn]]
+        
+        return ready
+    
+    def skip_if_idle(self, now):
+        if now < self.__deadline or self.__queues[self.__order[self.__turn]]:
+            return False
+        
+        self.__next_turn()
+        return True
+    
+    def take_all(self):
+        items = []
+        for name in self.__order:
+            items.extend(self.__queues[name])
+            self.__queues[name].clear()
+        
+        return items
+    
+    def __next_turn(self):
+        self.__turn += 1
+        if self.__turn == len(self.__order):
+            self.__turn = 0
+            self.__round += 1
+        self.__deadline = default_timer() + self.__timeout
+
+#------------------------------------------------------------------------------#
+
+def _is_name(value):
+    # names are looked up in dicts, so other JSON values are refused first
+    return isinstance(value, basestring)
+
+class _Connection(asynchat.async_chat):
+
+    # one client: splits what it sends into lines, and hands each to the
+    # server
+    
+    def __init__(self, server, sock, socketMap):
+        asynchat.async_chat.__init__(self, sock, socketMap)
+        self.__server = server
+        self.__received = []
+        self.set_terminator("\n")
+    
+    def collect_incoming_data(self, data):
+        self.__received.append(data)
+    
+    def found_terminator(self):
+        line = "".join(self.__received).strip()
+        self.__received = []
+        if line:
+            self.__server.handle_line(self, line)
+    
+    def send_result(self, result):
+        self.push(json.dumps(result, separators = (",", ":")) + "\n")
+    
+    def handle_close(self):
+        self.__server.handle_disconnect(self)
+        self.close()
+
+class EncounterServer(asyncore.dispatcher):
+
+    """
+    Serves commands on a set of creatures, which may be a CreatureList or
+    any list like it.  address is a (host, port) pair to listen on TCP, or
+    a path to listen on a Unix socket.
+    
+    Functions:
+        get_address()               -> returns the address it listens on,
+                                        with the port chosen when given 0
+        get_encounters()            -> returns the names of the encounters
+        get_command_count()         -> returns the number of commands run
+        serve([float:duration])     -> handles clients until close() is
+                                        called, or for duration seconds
+        handle_line(connection, string:line)    -> runs, or queues, a command
+        handle_disconnect(connection)           -> forgets a client
+        close()                     -> stops listening and drops the clients
+    """
+    
+    def __init__(self, creatures, address = ("127.0.0.1", DEFAULT_PORT), dice = None,
+                 turnTimeout = TURN_TIMEOUT):
+        # the server has its own socket map, so more than one can be run
+        self.__map = {}
+        asyncore.dispatcher.__init__(self, map = self.__map)
+        
+        self.__creatures = creatures
+        self.__dice = dice
+        self.__turnTimeout = turnTimeout
+        self.__connections = set()
+        self.__serving = False
+        self.__commandCount = 0
+        
+        # encounters by name, and the encounter each creature is in
+        self.__encounters = {}
+        self.__encounterOf = {}
+        
+        if isinstance(address, basestring):
+            if os.path.exists(address):
+                os.remove(address)
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+        self.bind(address)
+        self.listen(64)
+    
+    def get_address(self):
+        return self.socket.getsockname()
+    
+    def get_encounters(self):
+        return self.__encounters.keys()
+    
+    def get_command_count(self):
+        return self.__commandCount
+    
+    def serve(self, duration = None):
+        self.__serving = True
+        end = None
+        if duration is not None:
+            end = default_timer() + duration
+        
+        while self.__serving and self.__map:
+            asyncore.loop(POLL_INTERVAL, map = self.__map, count = 1)
+            
+            now = default_timer()
+            for encounter in self.__encounters.values():
+                if encounter.skip_if_idle(now):
+                    self.__run_ready(encounter)
+            if end is not None and now >= end:
+                break
+    
+    def handle_accept(self):
+        accepted = self.accept()
+        if accepted is None:
+            return
+        
+        connection = _Connection(self, accepted[0], self.__map)
+        self.__connections.add(connection)
+    
+    def handle_line(self, connection, line):
+        try:
+            command = json.loads(line)
+        except ValueError, e:
+            connection.send_result({ "ok" : False, "error" : "not JSON: %s" % e })
+            return
+        if not isinstance(command, dict):
+            connection.send_result({ "ok" : False, "error" : "not a JSON object" })
+            return
+        
+        # a command which breaks fails alone, rather than taking the
+        # connection down with it
+        try:
+            self.__dispatch(connection, command)
+        except Exception, e:
+            self.__reply(connection, command, self.__failure("%s: %s" % (e.__class__.__name__, e)))
+    
+    def __dispatch(self, connection, command):
+        op = command.get("op")
+        if op == "start_encounter":
+            self.__reply(connection, command, self.__start_encounter(command))
+        elif op == "end_encounter":
+            self.__reply(connection, command, self.__end_encounter(command))
+        elif command.get("encounter") is not None and op in TURN_OPERATIONS:
+            self.__queue(connection, command)
+        elif op == "remove" and _is_name(command.get("creature")) and command["creature"] in self.__encounterOf:
+            self.__reply(connection, command, self.__failure("%s is in the encounter %s" %
+                                                             (command["creature"],
+                                                              self.__encounterOf[command["creature"]])))
+        else:
+            self.__run(connection, command)
+    
+    def handle_disconnect(self, connection):
+        # its queued commands are still run when their turns come, but
+        # their results go nowhere
+        self.__connections.discard(connection)
+    
+    def close(self):
+        self.__serving = False
+        for connection in list(self.__connections):
+            connection.close()
+        self.__connections.clear()
+        
+        address = self.get_address()
+        asyncore.dispatcher.close(self)
+        if isinstance(address, basestring) and os.path.exists(address):
+            os.remove(address)
+    
+    # ----- commands ----- #
+    
+    def __run(self, connection, command):
+        self.__commandCount += 1
+        result = run_command(command, self.__creatures, self.__dice)
+        if connection in self.__connections:
+            connection.send_result(result)
+    
+    def __reply(self, connection, command, result):
+        if "id" in command:
+            result["id"] = command["id"]
+        connection.send_result(result)
+    
+    def __failure(self, error):
+        return { "ok" : False, "error" : error }
+    
+    def __queue(self, connection, command):
+        if not _is_name(command["encounter"]):
+            self.__reply(connection, command, self.__failure("an encounter's name is a string"))
+            return
+        encounter = self.__encounters.get(command["encounter"])
+        if encounter is None:
+            self.__reply(connection, command, self.__failure("no encounter is called %s" % command["encounter"]))
+            return
+        
+        actor = command.get("actor", command.get("creature"))
+        if not _is_name(actor):
+            self.__reply(connection, command, self.__failure("an actor's name is a string"))
+            return
+        if self.__encounterOf.get(actor) != encounter.get_name():
+            self.__reply(connection, command, self.__failure("%s is not in the encounter %s" %
+                                                             (actor, encounter.get_name())))
+            return
+        
+        encounter.queue(actor, (connection, command))
+        self.__run_ready(encounter)
+    
+    def __run_ready(self, encounter):
+        for connection, command in encounter.take_ready():
+            self.__run(connection, command)
+    
+    def __start_encounter(self, command):
+        name = command.get("encounter")
+        order = command.get("creatures")
+        if name is None or not order:
+            return self.__failure("an encounter needs a name and creatures")
+        if not _is_name(name) or not isinstance(order, list) or not all([_is_name(creature) for creature in order]):
+            return self.__failure("an encounter's name is a string, and its creatures a list of names")
+        if name in self.__encounters:
+            return self.__failure("there is already an encounter called %s" % name)
+        if len(set(order)) != len(order):
+            return self.__failure("a creature can only take one place in the turn order")
+        for creature in order:
+            if not self.__creatures.has_name(creature):
+                return self.__failure("no creature is called %s" % creature)
+            if creature in self.__encounterOf:
+                return self.__failure("%s is already in the encounter %s" % (creature, self.__encounterOf[creature]))
+        
+        self.__encounters[name] = Encounter(name, order, self.__turnTimeout)
+        for creature in order:
+            self.__encounterOf[creature] = name
+        
+        return { "ok" : True, "encounter" : name, "turn" : order[0] }
+    
+    def __end_encounter(self, command):
+        if not _is_name(command.get("encounter")):
+            return self.__failure("an encounter's name is a string")
+        encounter = self.__encounters.pop(command["encounter"], None)
+        if encounter is None:
+            return self.__failure("no encounter is called %s" % command.get("encounter"))
+        
+        for creature in encounter.get_order():
+            del self.__encounterOf[creature]
+        
+        # commands still waiting for their turn will not get one
+        for connection, queued in encounter.take_all():
+            if connection in self.__connections:
+                self.__reply(connection, queued, self.__failure("the encounter %s ended" % encounter.get_name()))
+        
+        return { "ok" : True, "encounter" : encounter.get_name(), "rounds" : encounter.get_round() }
+
+#------------------------------------------------------------------------------#
+
+def main(arguments):
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-H", "--host", default = "127.0.0.1",
+                      help = "address to listen on [default: %default]")
+    parser.add_option("-p", "--port", type = "int", default = DEFAULT_PORT,
+                      help = "TCP port to listen on [default: %default]")
+    parser.add_option("-u", "--unix",
+                      help = "listen on this Unix socket instead of TCP")
+    parser.add_option("-d", "--database",
+                      help = "keep the creatures in this SQLite database, which is saved as it changes")
+    parser.add_option("-r", "--roster",
+                      help = "start with the creatures of this roster archive or directory")
+    parser.add_option("-s", "--seed", type = "int",
+                      help = "seed for the dice [default: the shared dice]")
+    parser.add_option("-t", "--turn-timeout", type = "float", dest = "turnTimeout", default = TURN_TIMEOUT,
+                      help = "seconds before an idle creature's turn is skipped [default: %default]")
+    options, rest = parser.parse_args(arguments)
+    if rest:
+        parser.error("no arguments are taken")
+    
+    dice = None
+    if options.seed is not None:
+        from diceStream import DiceStream
+        dice = DiceStream(options.seed)
+    
+    if options.database:
+        from creatureDatabase import CreatureDatabase
+        creatures = CreatureDatabase(options.database)
+    elif options.roster:
+        from rosterArchive import LazyCreatureList
+        creatures = LazyCreatureList(options.roster)
+    else:
+        from creatureInfo import CreatureList
+        creatures = CreatureList()
+    
+    address = options.unix or (options.host, options.port)
+    server = EncounterServer(creatures, address, dice, options.turnTimeout)
+    print "Serving on %s" % (server.get_address(),)
+    sys.stdout.flush()
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if options.database:
+            creatures.close()
+        print "%d commands were run." % server.get_command_count()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -6,6 +6,10 @@ This module contains the classes necessary for the GUI to function.
 
 Classes
     MainWindow
+    LogPane
+    DiagnosticsWindow
+    RosterModel
+    RosterBrowser
     SelectCreatureDialog
     CreateCreatureDialog
     ViewCreatureWindow
@@ -15,8 +19,14 @@ import pygtk
 pygtk.require("2.0")
 import gtk
 import gobject
+from bisect import bisect_left
+from timeit import default_timer
 from creatureInfo import Creature
 from skillInfo import *
+from changeTracking import observe, unobserve, observe_creature, unobserve_creature
+from logSink import LEVELS, INFO, WARNING, DEFAULT_MAX_LINES, level_name
+import instrumentation
+from instrumentation import timed
 
 #------------------------------------------------------------------------------#
 
@@ -30,11 +40,12 @@ class MainWindow:
         __init__()
         main()
         get_window()
-        get_log()
+        get_log()   -> returns the LogSink the window shows
     """
     
-    def __init__(self, controller):
+    def __init__(self, controller, logSink):
         self.__controller = controller
+        self.__logSink = logSink
         
         # create the window
         self.__window = gtk.Window(gtk.WINDOW_TOPLEVEL)
@@ -60,19 +71,44 @@ class MainWindow:
         menu = gtk.Menu()
         
         saveCreature = gtk.MenuItem("Save Creature")
-        saveCreature.connect("activate", self.__controller.save_creature)
+        saveCreature.connect("activate", timed("gui save_creature", self.__controller.save_creature))
         saveCreature.show()
         
-        loadCreature = gtk.MenuItem("Load Creature")
-        loadCreature.connect("activate", self.__controller.load_creature)
+        loadCreature = gtk.MenuItem("Load Creatures")
+        loadCreature.connect("activate", timed("gui load_creature", self.__controller.load_creature))
         loadCreature.show()
         
+        loadFolder = gtk.MenuItem("Load Folder")
+        loadFolder.connect("activate", timed("gui load_folder", self.__controller.load_folder))
+        loadFolder.show()
+        
+        saveAll = gtk.MenuItem("Save All")
+        saveAll.connect("activate", timed("gui save_all", self.__controller.save_all))
+        saveAll.show()
+        
+        saveRoster = gtk.MenuItem("Save Roster")
+        saveRoster.connect("activate", timed("gui save_roster", self.__controller.save_roster))
+        saveRoster.show()
+        
+        loadRoster = gtk.MenuItem("Load Roster")
+        loadRoster.connect("activate", timed("gui load_roster", self.__controller.load_roster))
+        loadRoster.show()
+        
+        openDatabase = gtk.MenuItem("Open Database")
+        openDatabase.connect("activate", timed("gui open_database", self.__controller.open_database))
+        openDatabase.show()
+        
         quitProgram = gtk.MenuItem("Quit")
-        quitProgram.connect("activate", self.__controller.gui_destroy)
+        quitProgram.connect("activate", timed("gui gui_destroy", self.__controller.gui_destroy))
         quitProgram.show()
         
         menu.append(saveCreature)
         menu.append(loadCreature)
+        menu.append(loadFolder)
+        menu.append(saveAll)
+        menu.append(saveRoster)
+        menu.append(loadRoster)
+        menu.append(openDatabase)
         menu.append(quitProgram)
         
         fileMenu.set_submenu(menu)
@@ -85,11 +121,11 @@ class MainWindow:
         menu = gtk.Menu()
         
         createCreature = gtk.MenuItem("Create")
-        createCreature.connect("activate", self.__controller.create_creature)
+        createCreature.connect("activate", timed("gui create_creature", self.__controller.create_creature))
         createCreature.show()
         
         viewCreature = gtk.MenuItem("View")
-        viewCreature.connect("activate", self.__controller.view_creature)
+        viewCreature.connect("activate", timed("gui view_creature", self.__controller.view_creature))
         viewCreature.show()
         
         menu.append(createCreature)
@@ -97,6 +133,21 @@ class MainWindow:
         
         creatureMenu.set_submenu(menu)
         
+        # tools menu and it's contents
+        
+        toolsMenu = gtk.MenuItem("Tools")
+        toolsMenu.show()
+        
+        menu = gtk.Menu()
+        
+        viewDiagnostics = gtk.MenuItem("Diagnostics")
+        viewDiagnostics.connect("activate", self.__controller.view_diagnostics)
+        viewDiagnostics.show()
+        
+        menu.append(viewDiagnostics)
+        
+        toolsMenu.set_submenu(menu)
+        
         # the menubar across the very top
         
         self.__menuBar = gtk.MenuBar()
@@ -104,28 +155,19 @@ class MainWindow:
         
         self.__menuBar.append(fileMenu)
         self.__menuBar.append(creatureMenu)
+        self.__menuBar.append(toolsMenu)
         
         # main window contents
         
-        self.__log = gtk.TextBuffer()
-        
-        logView = gtk.TextView(self.__log)
-        logView.set_editable(False)
-        logView.set_cursor_visible(False)
-        logView.set_wrap_mode(gtk.WRAP_WORD)
-        logView.show()
-        
-        logViewScroller = gtk.ScrolledWindow()
-        logViewScroller.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
-        logViewScroller.show()
-        logViewScroller.add(logView)
+        logPane = LogPane(logSink)
+        logPane.show()
         
         # window-level component packing
         
         vBox = gtk.VBox(False, 0)
         vBox.show()
         vBox.pack_start(self.__menuBar, False, False, 2)
-        vBox.pack_end(logViewScroller, False, False, 0)
+        vBox.pack_end(logPane, False, False, 0)
         
         self.__window.add(vBox)
         
@@ -141,7 +183,7 @@ class MainWindow:
         self.__window.show()
     
     def main(self):
-        self.__log.insert_at_cursor("Welcome to the SkillDnD program!\n\n")
+        self.__logSink.info("Welcome to the SkillDnD program!")
         
         # GTK now waits for an event to occur
         gtk.main()
@@ -150,7 +192,438 @@ class MainWindow:
         return self.__window
     
     def get_log(self):
-        return self.__log
+        return self.__logSink
+
+#------------------------------------------------------------------------------#
+
+# milliseconds a log pane waits after a line arrives before showing it and
+# any which follow it
+LOG_FLUSH_INTERVAL = 100
+
+class LogPane(gtk.VBox):
+
+    """
+    Shows the lines of a LogSink at or above a level, which the user picks.
+    Lines are added in batches, at most once each LOG_FLUSH_INTERVAL, and
+    the oldest are removed to keep to DEFAULT_MAX_LINES, so the pane stays
+    cheap however much is logged.
+    
+    Functions:
+        __flush()
+    """
+    
+    def __init__(self, logSink, level = INFO):
+        gtk.VBox.__init__(self, False, 2)
+        self.__logSink = logSink
+        self.__level = level
+        self.__flushPending = False
+        
+        levels = gtk.combo_box_new_text()
+        for each in LEVELS:
+            levels.append_text(level_name(each).capitalize())
+        levels.set_active(list(LEVELS).index(level))
+        levels.connect("changed", self.__level_changed)
+        levels.show()
+        self.pack_start(levels, False, False, 0)
+        
+        self.__buffer = gtk.TextBuffer()
+        
+        self.__view = gtk.TextView(self.__buffer)
+        self.__view.set_editable(False)
+        self.__view.set_cursor_visible(False)
+        self.__view.set_wrap_mode(gtk.WRAP_WORD)
+        self.__view.show()
+        
+        scroller = gtk.ScrolledWindow()
+        scroller.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scroller.add(self.__view)
+        scroller.show()
+        self.pack_start(scroller, True, True, 0)
+        
+        # lines can be logged from any thread; the wake function only
+        # schedules the flush, which runs on the main loop
+        logSink.set_wake(self.__wake)
+        self.__append(logSink.get_lines(level))
+    
+    def __wake(self):
+        if not self.__flushPending:
+            self.__flushPending = True
+            gobject.timeout_add(LOG_FLUSH_INTERVAL, self.__flush)
+    
+    def __flush(self):
+        self.__flushPending = False
+        self.__append(self.__logSink.take_pending())
+        
+        # timeout callbacks which return True are run again
+        return False
+    
+    def __level_changed(self, comboBox):
+        self.__level = LEVELS[comboBox.get_active()]
+        self.__logSink.take_pending()
+        self.__buffer.set_text("")
+        self.__append(self.__logSink.get_lines(self.__level))
+    
+    def __append(self, lines):
+        texts = [self.__format(level, message) for level, message in lines if level >= self.__level]
+        if not texts:
+            return
+        
+        self.__buffer.insert(self.__buffer.get_end_iter(), "\n".join(texts) + "\n")
+        
+        # the buffer ends with an empty line after the last one logged
+        excess = self.__buffer.get_line_count() - 1 - DEFAULT_MAX_LINES
+        if excess > 0:
+            self.__buffer.delete(self.__buffer.get_start_iter(), self.__buffer.get_iter_at_line(excess))
+        
+        self.__view.scroll_mark_onscreen(self.__buffer.get_insert())
+    
+    def __format(self, level, message):
+        if level >= WARNING:
+            return "%s: %s" % (level_name(level).capitalize(), message)
+        
+        return message
+
+# the roster's columns: the name, then percentages, then the level of each
+# standard skill
+NAME_COLUMN, WOUND_COLUMN, FATIGUE_COLUMN = range(3)
+SKILL_NAMES = [skill.get_name() for skill in SkillList()]
+COLUMN_TITLES = ["Name", "Wound %", "Fatigue %"] + SKILL_NAMES
+
+# rows read at a time from lists which can hand out pages
+ROSTER_PAGE_SIZE = 100
+
+def _row_values(creature):
+    values = [creature.get_name(), creature.get_wound_percentage(), creature.get_fatigue_percentage()]
+    skills = creature.get_skills("list of Skill")
+    for name in SKILL_NAMES:
+        skill = skills.get_skill(name)
+        values.append(skill.get_level() if skill is not None else 0)
+    
+    return values
+
+class RosterModel(gtk.GenericTreeModel):
+
+    """
+    A list model over a CreatureList, or any list like it, which reads a
+    creature only when its row is asked for, so making one costs the same
+    however many creatures there are.  order, if given, lists the index in
+    the creature list of each row; sorting makes a new model with a new
+    order rather than moving rows about.
+    
+    The number of rows is taken when the model is made; make a new model to
+    see creatures added or removed since.  The creatures of the rows read
+    last are observed, and a row whose creature changes is read again and
+    redrawn once the main loop is idle; release() stops observing them.
+    
+    Functions:
+        get_creature_index(int:row)     -> returns the index in the creature
+                                            list of the creature on a row
+        get_names()                     -> returns the names of the rows'
+                                            creatures, in row order
+        sorted_by(int:column[, bool:descending]) -> returns a new model with
+                                            the rows sorted by a column
+        is_sorted_by_name()             -> returns True if the rows are in
+                                            order of name, a to z
+        release()                       -> stops observing, for a model which
+                                            is no longer shown
+    """
+    
+    def __init__(self, creatureList, order = None, nameSorted = False):
+        gtk.GenericTreeModel.__init__(self)
+        self.__creatureList = creatureList
+        self.__order = order
+        self.__nameSorted = nameSorted
+        self.__length = len(creatureList) if order is None else len(order)
+        
+        # names are only read for searching and sorting
+        self.__names = None
+        
+        # the values of the rows read last, by row, and the row of each of
+        # their creatures' observed parts
+        self.__page = {}
+        self.__observedRows = {}
+        
+        # rows whose creatures changed, waiting for the main loop to be idle
+        self.__changedRows = set()
+    
+    def get_creature_index(self, row):
+        if self.__order is None:
+            return row
+        
+        return self.__order[row]
+    
+    def get_names(self):
+        if self.__names is None:
+            names = self.__creatureList.get_names()
+            if self.__order is not None:
+                names = [names[index] for index in self.__order]
+            self.__names = names
+        
+        return self.__names
+    
+    def sorted_by(self, column, descending = False):
+        names = self.__creatureList.get_names()
+        if column == NAME_COLUMN:
+            keys = [name.lower() for name in names]
+        else:
+            # every creature has to be read for these
+            keys = [_row_values(creature)[column] for creature in self.__creatureList]
+        
+        order = sorted(xrange(len(keys)), key = keys.__getitem__, reverse = descending)
+        
+        return RosterModel(self.__creatureList, order, column == NAME_COLUMN and not descending)
+    
+    def is_sorted_by_name(self):
+        return self.__nameSorted
+    
+    def release(self):
+        self.__forget_page()
+    
+    def __values(self, row):
+        values = self.__page.get(row)
+        if values is not None:
+            return values
+        
+        # unsorted rows are read a page at a time from lists which can, and
+        # otherwise one at a time, up to a page; only the last page is kept
+        if self.__order is None and hasattr(self.__creatureList, "get_page"):
+            self.__forget_page()
+            start = row - row % ROSTER_PAGE_SIZE
+            for i, creature in enumerate(self.__creatureList.get_page(start, ROSTER_PAGE_SIZE)):
+                self.__keep_row(start + i, creature)
+        else:
+            if len(self.__page) >= ROSTER_PAGE_SIZE:
+                self.__forget_page()
+            self.__keep_row(row, self.__creatureList[self.get_creature_index(row)])
+        
+        if row not in self.__page:
+            raise IndexError(row)
+        
+        return self.__page[row]
+    
+    def __keep_row(self, row, creature):
+        self.__page[row] = _row_values(creature)
+        for part in [creature, creature.get_health()] + list(creature.get_skills("list of Skill")):
+            if part not in self.__observedRows:
+                observe(part, self.__part_changed)
+            self.__observedRows[part] = row
+    
+    def __forget_page(self):
+        for part in self.__observedRows:
+            unobserve(part, self.__part_changed)
+        self.__observedRows = {}
+        self.__page = {}
+    
+    def __part_changed(self, part, event, value):
+        # the row is read again when it is next drawn; any number of changes
+        # before the main loop is idle get one redraw
+        row = self.__observedRows.get(part)
+        if row is None:
+            return
+        
+        self.__page.pop(row, None)
+        if not self.__changedRows:
+            gobject.idle_add(timed("gui roster redraw", self.__redraw_changed))
+        self.__changedRows.add(row)
+    
+    def __redraw_changed(self):
+        rows = self.__changedRows
+        self.__changedRows = set()
+        for row in sorted(rows):
+            if row < self.__length:
+                self.row_changed((row,), self.get_iter((row,)))
+        
+        # idle callbacks which return True are run again
+        return False
+    
+    # ----- gtk.GenericTreeModel callbacks; a row's reference is its number ----- #
+    
+    def on_get_flags(self):
+        return gtk.TREE_MODEL_LIST_ONLY | gtk.TREE_MODEL_ITERS_PERSIST
+    
+    def on_get_n_columns(self):
+        return len(COLUMN_TITLES)
+    
+    def on_get_column_type(self, column):
+        if column == NAME_COLUMN:
+            return str
+        
+        return int
+    
+    def on_get_iter(self, path):
+        if path[0] < self.__length:
+            return path[0]
+        
+        return None
+    
+    def on_get_path(self, row):
+        return (row,)
+    
+    def on_get_value(self, row, column):
+        try:
+            return self.__values(row)[column]
+        except IndexError:
+            # the creature was removed since the model was made
+            return None
+    
+    def on_iter_next(self, row):
+        if row + 1 < self.__length:
+            return row + 1
+        
+        return None
+    
+    def on_iter_children(self, parent):
+        if parent is None and self.__length:
+            return 0
+        
+        return None
+    
+    def on_iter_has_child(self, row):
+        return False
+    
+    def on_iter_n_children(self, row):
+        if row is None:
+            return self.__length
+        
+        return 0
+    
+    def on_iter_nth_child(self, parent, n):
+        if parent is None and n < self.__length:
+            return n
+        
+        return None
+    
+    def on_iter_parent(self, child):
+        return None
+
+class RosterBrowser(gtk.VBox):
+
+    """
+    A search entry over a list of creatures, with a column for each of the
+    name, wound and fatigue percentages, and standard skill levels.  Rows
+    are read as they are shown, so the browser opens as quickly for 100000
+    creatures as for 10.  Clicking a column's title sorts by it, and again
+    reverses it; typing in the entry selects the first creature whose name
+    starts with what was typed.  Connect to get_selection()'s "changed"
+    signal to follow the selected creature.
+    
+    Functions:
+        get_selected()          -> returns the selected creature's name, or
+                                    None
+        get_selection()         -> returns the view's gtk.TreeSelection
+        refresh()               -> shows creatures added or removed since it
+                                    was made, in their list order
+    """
+    
+    def __init__(self, creatureList):
+        gtk.VBox.__init__(self, False, 5)
+        self.__creatureList = creatureList
+        self.__sortColumn = None
+        self.__descending = False
+        
+        self.__search = gtk.Entry()
+        self.__search.connect("changed", self.__search_changed)
+        self.__search.show()
+        self.pack_start(self.__search, False, False, 0)
+        
+        self.__view = gtk.TreeView(RosterModel(creatureList))
+        self.__view.set_enable_search(False)
+        self.__columns = []
+        for i, title in enumerate(COLUMN_TITLES):
+            column = gtk.TreeViewColumn(title, gtk.CellRendererText(), text = i)
+            
+            # fixed sizes let the view skip measuring every row
+            column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+            column.set_fixed_width(150 if i == NAME_COLUMN else 70)
+            column.set_clickable(True)
+            column.connect("clicked", self.__column_clicked, i)
+            self.__view.append_column(column)
+            self.__columns.append(column)
+        self.__view.set_fixed_height_mode(True)
+        self.__view.show()
+        self.connect("destroy", self.__destroyed)
+        
+        scrolledWindow = gtk.ScrolledWindow()
+        scrolledWindow.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scrolledWindow.add(self.__view)
+        scrolledWindow.show()
+        self.pack_start(scrolledWindow, True, True, 0)
+    
+    def get_selected(self):
+        model, iter = self.__view.get_selection().get_selected()
+        if iter is None:
+            return None
+        
+        return model.get_value(iter, NAME_COLUMN)
+    
+    def get_selection(self):
+        return self.__view.get_selection()
+    
+    def refresh(self):
+        self.__sortColumn = None
+        for column in self.__columns:
+            column.set_sort_indicator(False)
+        self.__set_model(RosterModel(self.__creatureList))
+    
+    def __set_model(self, model):
+        # the model shown before stops observing its creatures
+        self.__view.get_model().release()
+        self.__view.set_model(model)
+    
+    def __destroyed(self, widget, data = None):
+        self.__view.get_model().release()
+    
+    def __column_clicked(self, column, index):
+        if index == self.__sortColumn:
+            self.__descending = not self.__descending
+        else:
+            self.__sortColumn = index
+            self.__descending = False
+        
+        for other in self.__columns:
+            other.set_sort_indicator(other is column)
+        column.set_sort_order(gtk.SORT_DESCENDING if self.__descending else gtk.SORT_ASCENDING)
+        
+        self.__set_model(self.__view.get_model().sorted_by(index, self.__descending))
+    
+    def __search_changed(self, entry):
+        text = entry.get_text().lower()
+        if not text:
+            return
+        
+        model = self.__view.get_model()
+        names = model.get_names()
+        row = None
+        if model.is_sorted_by_name():
+            # the names are in order, so the first match can be found by
+            # halving
+            keys = _LowerNames(names)
+            found = bisect_left(keys, text)
+            if found < len(names) and keys[found].startswith(text):
+                row = found
+        else:
+            for i, name in enumerate(names):
+                if name.lower().startswith(text):
+                    row = i
+                    break
+        
+        if row is not None:
+            self.__view.get_selection().select_path((row,))
+            self.__view.scroll_to_cell((row,), None, True, 0.5, 0.0)
+
+class _LowerNames(object):
+
+    # a lower cased view of a list of names, for bisect_left, which only
+    # needs the length and indexing
+    
+    def __init__(self, names):
+        self.__names = names
+    
+    def __len__(self):
+        return len(self.__names)
+    
+    def __getitem__(self, index):
+        return self.__names[index].lower()
 
 #------------------------------------------------------------------------------#
 
@@ -162,16 +635,13 @@ class SelectCreatureDialog(gtk.Dialog):
     
     def __init__(self, parent, creatureList):
         gtk.Dialog.__init__(self, "Select a Creature", parent, gtk.DIALOG_DESTROY_WITH_PARENT)
-        self.set_size_request(200, 100)
+        self.set_size_request(500, 400)
         
         # ----- dialog top area ----- #
         
-        self.__comboBox = gtk.combo_box_new_text()
-        self.__comboBox.show()
-        self.vbox.pack_start(self.__comboBox, True, True, 0)
-        
-        for creature in creatureList:
-            self.__comboBox.append_text(creature.get_name())
+        self.__browser = RosterBrowser(creatureList)
+        self.__browser.show()
+        self.vbox.pack_start(self.__browser, True, True, 0)
         
         # ----- dialog action (bottom) area ----- #
         
@@ -179,11 +649,7 @@ class SelectCreatureDialog(gtk.Dialog):
         self.add_button("Cancel", 0)
     
     def get_selected(self):
-        model = self.__comboBox.get_model()
-        active = self.__comboBox.get_active()
-        if active < 0:
-            return None;
-        return model[active][0]
+        return self.__browser.get_selected()
 
 #------------------------------------------------------------------------------#
 
@@ -363,17 +829,16 @@ class CreateCreatureDialog:
                                     self.__chaSpin.get_value_as_int(), skills = sks)
                                    )
         
-        print "    %s created." % self.__nameEntry.get_text()
-        self.__mainLog.insert_at_cursor("  Creature: %s created.\n" % self.__nameEntry.get_text())
+        self.__mainLog.info("Creature: %s created." % self.__nameEntry.get_text())
         
         self.close_dialog(widget, "completed")
     
     def close_dialog(self, widget, data = None):
-        print "    Creature creation Dialog closed."
+        self.__mainLog.debug("Creature creation Dialog closed.")
         if data is not None:
-            self.__mainLog.insert_at_cursor("Creature creation process %s.\n\n" % data)
+            self.__mainLog.info("Creature creation process %s." % data)
         else:
-            self.__mainLog.insert_at_cursor("Creature creation process aborted.\n\n")
+            self.__mainLog.info("Creature creation process aborted.")
         
         self.__dialog.destroy()
 
@@ -383,34 +848,41 @@ class ViewCreatureWindow:
 
     """
     This dialog allows the user to view the information for
-    a chosen creature.
+    a chosen creature.  It observes the creature, and while it changes
+    repaints at most once each time the main loop is idle, setting only the
+    fields whose text changed, so it can follow a creature which changes
+    thousands of times a second.
     
     Functions:
         close_window(widget,[data])
         __box_update(widget,[data])
+        __repaint()
     """
     
     def __init__(self, creatureList, log):
         self.__creatureList = creatureList
         self.__mainLog = log
         
+        # the creature shown, and whether a repaint is waiting for the main
+        # loop to be idle
+        self.__creature = None
+        self.__repaintPending = False
+        
         # create the window and set its options
         
         self.__window = gtk.Window()
         self.__window.set_title("View a Creature")
         self.__window.set_border_width(5)
-        self.__window.set_size_request(410, 400)
+        self.__window.set_size_request(560, 640)
+        self.__window.connect("destroy", self.__window_destroyed)
         
         # create the window's contents
         
-        ## top combo box holding creatureList
-        
-        self.__comboBox = gtk.combo_box_new_text()
-        self.__comboBox.connect("changed", self.__box_update)
-        self.__comboBox.show()
+        ## top browser over creatureList
         
-        for creature in self.__creatureList:
-            self.__comboBox.append_text(creature.get_name())
+        self.__browser = RosterBrowser(self.__creatureList)
+        self.__browser.get_selection().connect("changed", self.__box_update)
+        self.__browser.show()
         
         ## scrolled window contents
         
@@ -490,7 +962,7 @@ class ViewCreatureWindow:
         
         vbox = gtk.VBox(False, 0)
         vbox.show()
-        vbox.pack_start(self.__comboBox, False, False, 0)
+        vbox.pack_start(self.__browser, True, True, 0)
         vbox.pack_start(scrolledWindow, True, True, 5)
         vbox.pack_end(buttonHBox, False, False, 0)
         
@@ -501,46 +973,221 @@ class ViewCreatureWindow:
         self.__window.show()
     
     def close_window(self, widget, data = None):
-        print "    Creature view window closed."
-        self.__mainLog.insert_at_cursor("Creature view window closed.\n\n")
+        self.__mainLog.info("Creature view window closed.")
         
         self.__window.destroy()
     
     def __box_update(self, widget, data = None):
-        creature = self.__creatureList.get_by_name(self.__get_combobox_active(widget))
+        name = self.__browser.get_selected()
+        if name is None:
+            return
+        creature = self.__creatureList.get_by_name(name)
+        
+        if creature is not self.__creature:
+            if self.__creature is not None:
+                unobserve_creature(self.__creature, self.__creature_changed)
+            observe_creature(creature, self.__creature_changed)
+            self.__creature = creature
+        
+        self.__repaint()
+    
+    def __creature_changed(self, obj, event, value):
+        # any number of changes before the main loop is idle get one repaint
+        if not self.__repaintPending:
+            self.__repaintPending = True
+            gobject.idle_add(timed("gui repaint", self.__repaint))
+    
+    def __repaint(self):
+        self.__repaintPending = False
+        if self.__creature is None:
+            return False
+        
+        for entry, text in zip(self.__values, self.__field_texts(self.__creature)):
+            if entry.get_text() != text:
+                entry.set_text(text)
         
-        # set name
-        self.__values[0].set_text(creature.get_name())
+        # idle callbacks which return True are run again
+        return False
+    
+    def __field_texts(self, creature):
+        # name
+        texts = [creature.get_name()]
         
-        # set ability scores
+        # ability scores
         scores = creature.get_attributes()
-        self.__values[1].set_text(str(scores['Strength']))
-        self.__values[2].set_text(str(scores['Dexterity']))
-        self.__values[3].set_text(str(scores['Constitution']))
-        self.__values[4].set_text(str(scores['Intelligence']))
-        self.__values[5].set_text(str(scores['Wisdom']))
-        self.__values[6].set_text(str(scores['Charisma']))
-        
-        # set health stats
-        self.__values[7].set_text(str(creature.get_wound_percentage()))
-        self.__values[8].set_text(str(creature.get_fatigue_percentage()))
-        self.__values[9].set_text(", ".join(["%s" % k for k in creature.get_status_effects()]))
-        
-        # set skill values
-        skills = creature.get_skills("list of Skill")
-        s = 0
-        for i in range(10, len(self.__values)):
-            self.__values[i].set_text(str(skills[s].get_level()))
-            s += 1
+        for attribute in ["Strength", "Dexterity", "Constitution", "Intelligence", "Wisdom", "Charisma"]:
+            texts.append(str(scores[attribute]))
         
+        # health stats
+        texts.append(str(creature.get_wound_percentage()))
+        texts.append(str(creature.get_fatigue_percentage()))
+        texts.append(", ".join(["%s" % k for k in creature.get_status_effects()]))
         
+        # skill values
+        skills = creature.get_skills("list of Skill")
+        for s in range(min(len(skills), len(self.__values) - 10)):
+            texts.append(str(skills[s].get_level()))
         
-    def __get_combobox_active(self, comboBox):
-        model = comboBox.get_model()
-        active = comboBox.get_active()
-        if active < 0:
-            return None;
-        return model[active][0]
+        return texts
+    
+    def __window_destroyed(self, widget, data = None):
+        if self.__creature is not None:
+            unobserve_creature(self.__creature, self.__creature_changed)
+            self.__creature = None
 
 #------------------------------------------------------------------------------#
 
+# milliseconds between refreshes of the diagnostics window
+DIAGNOSTICS_INTERVAL = 1000
+
+class DiagnosticsWindow:
+
+    """
+    Shows, for each operation instrumentation has timed, how many times it
+    ran, how many times a second it ran since the last refresh, and its
+    median, 99th percentile and longest times.  Measuring can be switched
+    on and off, and the session profiled with cProfile; when profiling
+    stops the stats are dumped to profilePath, if given, and their summary
+    is logged.
+    
+    Functions:
+        close_window(widget,[data])
+        __refresh()
+    """
+    
+    def __init__(self, log, profilePath = None):
+        self.__mainLog = log
+        self.__profilePath = profilePath
+        self.__open = True
+        
+        # the row and count of each operation at the last refresh
+        self.__rows = {}
+        self.__counts = {}
+        self.__refreshed = default_timer()
+        
+        self.__window = gtk.Window()
+        self.__window.set_title("Diagnostics")
+        self.__window.set_border_width(5)
+        self.__window.set_default_size(560, 320)
+        self.__window.connect("destroy", self.__window_destroyed)
+        
+        ## controls across the top
+        
+        measure = gtk.CheckButton("Measure")
+        measure.set_active(instrumentation.is_enabled())
+        measure.connect("toggled", self.__measure_toggled)
+        measure.show()
+        
+        profile = gtk.ToggleButton("Profile")
+        profile.set_active(instrumentation.is_profiling())
+        profile.connect("toggled", self.__profile_toggled)
+        profile.show()
+        
+        reset = gtk.Button("Reset")
+        reset.connect("clicked", self.__reset)
+        reset.show()
+        
+        controls = gtk.HBox(False, 5)
+        controls.show()
+        controls.pack_start(measure, False, False, 0)
+        controls.pack_start(profile, False, False, 0)
+        controls.pack_start(reset, False, False, 0)
+        
+        ## the operations
+        
+        self.__store = gtk.ListStore(str, int, str, str, str, str)
+        view = gtk.TreeView(self.__store)
+        for i, title in enumerate(["Operation", "Count", "Per second", "p50 ms", "p99 ms", "Max ms"]):
+            column = gtk.TreeViewColumn(title, gtk.CellRendererText(), text = i)
+            view.append_column(column)
+        view.show()
+        
+        scrolledWindow = gtk.ScrolledWindow()
+        scrolledWindow.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scrolledWindow.add(view)
+        scrolledWindow.show()
+        
+        ## bottom close button
+        
+        close = gtk.Button("Close")
+        close.connect("clicked", self.close_window)
+        close.show()
+        
+        buttonHBox = gtk.HBox(False, 0)
+        buttonHBox.show()
+        buttonHBox.pack_end(close, False, False, 0)
+        
+        vbox = gtk.VBox(False, 5)
+        vbox.show()
+        vbox.pack_start(controls, False, False, 0)
+        vbox.pack_start(scrolledWindow, True, True, 0)
+        vbox.pack_end(buttonHBox, False, False, 0)
+        
+        self.__window.add(vbox)
+        self.__window.show()
+        
+        self.__refresh()
+        gobject.timeout_add(DIAGNOSTICS_INTERVAL, self.__refresh)
+    
+    def close_window(self, widget, data = None):
+        self.__window.destroy()
+    
+    def __window_destroyed(self, widget, data = None):
+        self.__open = False
+    
+    def __measure_toggled(self, button):
+        if button.get_active():
+            instrumentation.enable()
+            self.__mainLog.info("Measuring started.")
+        else:
+            instrumentation.disable()
+            self.__mainLog.info("Measuring stopped.")
+    
+    def __profile_toggled(self, button):
+        if button.get_active():
+            instrumentation.start_profile()
+            self.__mainLog.info("Profiling started.")
+            return
+        
+        summary = instrumentation.stop_profile(self.__profilePath)
+        if self.__profilePath is not None:
+            self.__mainLog.info("Profiling stopped; the stats were written to %s." % self.__profilePath)
+        else:
+            self.__mainLog.info("Profiling stopped.")
+        for line in summary.splitlines():
+            if line.strip():
+                self.__mainLog.debug(line)
+    
+    def __reset(self, widget, data = None):
+        instrumentation.reset()
+        self.__store.clear()
+        self.__rows = {}
+        self.__counts = {}
+    
+    def __refresh(self):
+        if not self.__open:
+            # timeout callbacks which return False are not run again
+            return False
+        
+        now = default_timer()
+        elapsed = max(now - self.__refreshed, 1e-6)
+        self.__refreshed = now
+        
+        for name, histogram in sorted(instrumentation.get_histograms().items()):
+            count = histogram.get_count()
+            values = [name, count, "%.0f" % ((count - self.__counts.get(name, 0)) / elapsed),
+                      "%.3f" % (histogram.percentile(0.5) * 1000.0),
+                      "%.3f" % (histogram.percentile(0.99) * 1000.0),
+                      "%.3f" % (histogram.get_max() * 1000.0)]
+            self.__counts[name] = count
+            
+            row = self.__rows.get(name)
+            if row is None:
+                self.__rows[name] = self.__store.append(values)
+            else:
+                for column in range(1, len(values)):
+                    self.__store.set_value(row, column, values[column])
+        
+        return True
+
+#------------------------------------------------------------------------------#
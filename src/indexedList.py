@@ -0,0 +1,271 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module contains a list type which keeps its items indexed by name.
+
+Classes
+    NameIndexedList
+"""
+
+#------------------------------------------------------------------------------#
+
+class NameIndexedList(list):
+
+    """
+    A subclass of the list datatype which keeps a dictionary of its items
+    keyed by each item's get_name(), so looking an item up by name does not
+    have to walk the list.  The dictionary is kept up to date by every list
+    operation that adds, removes or replaces items.
+    
+    Items sharing a name are all kept.  Name lookups return the one nearest
+    the front of the list, the same one a front-to-back search would find.
+    Items must be renamed through rename() for the index to follow them.
+    
+    Functions:
+        get_by_name(string:name)        -> returns the first item with that
+                                            name, or None
+        remove_by_name(string:name)     -> removes and returns the first item
+                                            with that name, or None
+        find_index_by_name(string:name) -> returns the index of the first item
+                                            with that name, or -1
+        has_name(string:name)           -> returns True if an item has that name
+        get_names()                     -> returns a list of item names, in
+                                            list order (cached between changes)
+        rename(string:oldName, string:newName) -> renames the first item called
+                                            oldName and returns it
+        reindex()                       -> rebuilds the name index from scratch
+    """
+    
+    # instances built without __init__ (e.g. by unpickling) have these slots
+    # unset; the index is then built on the first lookup
+    __slots__ = ("__byName", "__duplicates", "__names")
+    
+    def __init__(self, items = ()):
+        list.__init__(self)
+        self.__byName = {}
+        self.__duplicates = None
+        self.__names = None
+        self.extend(items)
+    
+    # ----- name based access ----- #
+    
+    def get_by_name(self, name):
+        try:
+            byName = self.__byName
+        except AttributeError:
+            byName = self.reindex()
+        
+        return byName.get(name)
+    
+    def remove_by_name(self, name):
+        item = self.get_by_name(name)
+        
+        # remove the item from the list if it was found
+        if item is not None:
+            return self.pop(self.__position(item))
+    
+    def find_index_by_name(self, name):
+        item = self.get_by_name(name)
+        
+        # if item not found return a value beyond bounds of the list
+        if item is None:
+            return -1
+        
+        return self.__position(item)
+    
+    def has_name(self, name):
+        return self.get_by_name(name) is not None
+    
+    def get_names(self):
+        # the names are cached until the next change to the list
+        names = getattr(self, "_NameIndexedList__names", None)
+        if names is None:
+            names = self.__names = [item.get_name() for item in self]
+        
+        return list(names)
+    
+    def rename(self, oldName, newName):
+        item = self.get_by_name(oldName)
+        if item is None:
+            return None
+        
+        self.__discard(item)
+        item.set_name(newName)
+        self.__add(item, False)
+        
+        return item
+    
+    def reindex(self):
+        self.__names = None
+        self.__byName = {}
+        self.__duplicates = None
+        for item in self:
+            self.__add(item, True)
+        
+        return self.__byName
+    
+    # ----- list operations which keep the index current ----- #
+    
+    def append(self, item):
+        list.append(self, item)
+        self.__add(item, True)
+    
+    def extend(self, items):
+        items = list(items)
+        list.extend(self, items)
+        for item in items:
+            self.__add(item, True)
+    
+    def insert(self, index, item):
+        list.insert(self, index, item)
+        self.__add(item, False)
+    
+    def pop(self, index = -1):
+        item = list.pop(self, index)
+        self.__discard(item)
+        
+        return item
+    
+    def remove(self, item):
+        self.pop(self.index(item))
+    
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self.__names = None
+        self.__reorder_duplicates()
+    
+    def reverse(self):
+        list.reverse(self)
+        self.__names = None
+        self.__reorder_duplicates()
+    
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            list.__setitem__(self, index, value)
+            self.reindex()
+        else:
+            old = self[index]
+            list.__setitem__(self, index, value)
+            self.__discard(old)
+            self.__add(value, False)
+    
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            list.__delitem__(self, index)
+            self.reindex()
+        else:
+            self.pop(index)
+    
+    def __setslice__(self, i, j, items):
+        list.__setslice__(self, i, j, items)
+        self.reindex()
+    
+    def __delslice__(self, i, j):
+        list.__delslice__(self, i, j)
+        self.reindex()
+    
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+    
+    def __imul__(self, n):
+        list.__imul__(self, n)
+        self.reindex()
+        return self
+    
+    # ----- pickling ----- #
+    
+    def __getstate__(self):
+        # the index is rebuilt on demand, so it is left out of pickles; a list
+        # with no other attributes pickles exactly like a plain list subclass
+        return dict(getattr(self, "__dict__", {}))
+    
+    def __setstate__(self, state):
+        if state:
+            self.__dict__.update(state)
+    
+    # ----- index bookkeeping ----- #
+    
+    def __position(self, item):
+        # list.index is a C level scan, but it stops at the first item that
+        # compares equal, which need not be the item itself
+        i = self.index(item)
+        if self[i] is item:
+            return i
+        
+        i = 0
+        for other in self:
+            if other is item:
+                return i
+            i += 1
+    
+    def __add(self, item, atEnd):
+        self.__names = None
+        byName = getattr(self, "_NameIndexedList__byName", None)
+        if byName is None:
+            return
+        
+        name = item.get_name()
+        if name not in byName:
+            byName[name] = item
+        elif atEnd:
+            if self.__duplicates is None:
+                # most lists never hold two items of the same name
+                self.__duplicates = {}
+            self.__duplicates.setdefault(name, []).append(item)
+        else:
+            # the new item may have landed in front of its namesakes
+            self.__reorder_name(name)
+    
+    def __discard(self, item):
+        self.__names = None
+        byName = getattr(self, "_NameIndexedList__byName", None)
+        if byName is None:
+            return
+        
+        name = item.get_name()
+        duplicates = None
+        if self.__duplicates:
+            duplicates = self.__duplicates.get(name)
+        if byName.get(name) is item:
+            if duplicates:
+                byName[name] = duplicates.pop(0)
+                if not duplicates:
+                    del self.__duplicates[name]
+            else:
+                del byName[name]
+        elif duplicates is not None:
+            for i in range(len(duplicates)):
+                if duplicates[i] is item:
+                    del duplicates[i]
+                    break
+            if not duplicates:
+                del self.__duplicates[name]
+        else:
+            # the item was renamed behind the list's back
+            self.reindex()
+    
+    def __reorder_name(self, name):
+        matches = [item for item in self if item.get_name() == name]
+        
+        if self.__duplicates is None:
+            self.__duplicates = {}
+        
+        self.__duplicates.pop(name, None)
+        if not matches:
+            self.__byName.pop(name, None)
+            return
+        
+        self.__byName[name] = matches[0]
+        if len(matches) > 1:
+            self.__duplicates[name] = matches[1:]
+    
+    def __reorder_duplicates(self):
+        if getattr(self, "_NameIndexedList__byName", None) is None or not self.__duplicates:
+            return
+        
+        for name in self.__duplicates.keys():
+            self.__reorder_name(name)
+
+#------------------------------------------------------------------------------#
@@ -0,0 +1,223 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module measures how often the engine's operations run and how long
+they take.  Each named operation has a Histogram of its timings, from
+which the count, total time and percentiles are read.
+
+Nothing is measured until enable() is called.  It replaces the timed
+methods of Creature and Skill (use_skill and gain_exp) with timed ones,
+and disable() puts the originals back, so the engine pays nothing while
+it is off.  Background jobs (the loading and saving) are timed by
+backgroundIO's WorkerPool, and anything else can be timed by wrapping it
+with timed(), as the GUI does with its callbacks.
+
+The whole program can also be profiled with cProfile between
+start_profile() and stop_profile(), which can dump the stats to a file
+for pstats.  cProfile only profiles the thread which started it.
+
+Classes
+    Histogram
+
+Functions
+    enable()                            -> starts measuring
+    disable()                           -> stops
+    is_enabled()                        -> returns True while measuring
+    record(string:name, float:seconds)  -> adds a timing to an operation
+    timed(string:name, function)        -> returns function wrapped so that
+                                            its calls are timed while
+                                            measuring
+    get_histograms()                    -> returns a dict of the Histogram of
+                                            each operation measured
+    reset()                             -> forgets every timing
+    start_profile()                     -> starts cProfile
+    stop_profile([string:path, int:lines]) -> stops it, dumps the stats to path
+                                            if given, and returns a summary
+                                            of them
+    is_profiling()                      -> returns True while profiling
+"""
+
+import cProfile
+import math
+import pstats
+import threading
+from cStringIO import StringIO
+from timeit import default_timer
+
+#------------------------------------------------------------------------------#
+
+# timings are counted in buckets, SUBDIVISIONS to each doubling, from
+# 2 ** MIN_EXPONENT seconds (about 60 ns) to 2 ** MAX_EXPONENT (256 s)
+SUBDIVISIONS = 8
+MIN_EXPONENT = -24
+MAX_EXPONENT = 8
+_BUCKETS = (MAX_EXPONENT - MIN_EXPONENT) * SUBDIVISIONS
+
+class Histogram(object):
+
+    """
+    The timings of one operation, counted in buckets about 9% wide, so
+    that recording one costs the same however many there are.  Percentiles
+    are the middle of the bucket they fall in.
+    
+    Functions:
+        record(float:seconds)           -> counts a timing
+        get_count()                     -> returns the number of timings
+        get_total()                     -> returns their sum, in seconds
+        get_max()                       -> returns the longest, in seconds
+        percentile(float:fraction)      -> returns the timing which that
+                                            fraction of timings are no longer
+                                            than, in seconds
+    """
+    
+    def __init__(self):
+        self.__buckets = [0] * _BUCKETS
+        self.__count = 0
+        self.__total = 0.0
+        self.__max = 0.0
+    
+    def record(self, seconds):
+        self.__count += 1
+        self.__total += seconds
+        if seconds > self.__max:
+            self.__max = seconds
+        
+        # frexp gives a mantissa from 0.5 to 1 and a power of two; timings
+        # too short for the timer to see are counted as the shortest
+        bucket = 0
+        if seconds > 0:
+            mantissa, exponent = math.frexp(seconds)
+            bucket = (exponent - MIN_EXPONENT) * SUBDIVISIONS + int((mantissa - 0.5) * 2 * SUBDIVISIONS)
+        self.__buckets[min(max(bucket, 0), _BUCKETS - 1)] += 1
+    
+    def get_count(self):
+        return self.__count
+    
+    def get_total(self):
+        return self.__total
+    
+    def get_max(self):
+        return self.__max
+    
+    def percentile(self, fraction):
+        if not self.__count:
+            return 0.0
+        
+        wanted = fraction * self.__count
+        seen = 0
+        for bucket, count in enumerate(self.__buckets):
+            seen += count
+            if count and seen >= wanted:
+                exponent, part = divmod(bucket, SUBDIVISIONS)
+                middle = math.ldexp(0.5 + (part + 0.5) / (2.0 * SUBDIVISIONS), exponent + MIN_EXPONENT)
+                return min(middle, self.__max)
+        
+        return self.__max
+
+#------------------------------------------------------------------------------#
+
+# the histogram of each operation, by name; a lock keeps timings recorded
+# on worker threads from being lost
+histograms = {}
+_lock = threading.Lock()
+
+# the original of each method replaced while measuring, by (class, name)
+_originals = {}
+
+# the profile being run, if any
+_profile = None
+
+def _timed_methods():
+    # the classes are only imported when measuring starts
+    from creatureInfo import Creature
+    from skillInfo import Skill
+    
+    return [(Creature, "use_skill", "use_skill"), (Skill, "gain_exp", "gain_exp")]
+
+def record(name, seconds):
+    with _lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.record(seconds)
+
+def _timer(name, function):
+    def call(*args, **kwargs):
+        start = default_timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, default_timer() - start)
+    
+    call.__name__ = function.__name__
+    call.__doc__ = function.__doc__
+    
+    return call
+
+def enable():
+    if _originals:
+        return
+    
+    # an opposed use_skill is timed twice, once for the use and once, within
+    # it, for the target's response
+    for cls, methodName, name in _timed_methods():
+        original = cls.__dict__[methodName]
+        _originals[(cls, methodName)] = original
+        setattr(cls, methodName, _timer(name, original))
+
+def disable():
+    for (cls, methodName), original in _originals.items():
+        setattr(cls, methodName, original)
+    _originals.clear()
+
+def is_enabled():
+    return bool(_originals)
+
+def timed(name, function):
+    timedFunction = _timer(name, function)
+    
+    def call(*args, **kwargs):
+        if _originals:
+            return timedFunction(*args, **kwargs)
+        
+        return function(*args, **kwargs)
+    
+    return call
+
+def get_histograms():
+    with _lock:
+        return dict(histograms)
+
+def reset():
+    with _lock:
+        histograms.clear()
+
+#------------------------------------------------------------------------------#
+
+def start_profile():
+    global _profile
+    if _profile is None:
+        _profile = cProfile.Profile()
+        _profile.enable()
+
+def stop_profile(path = None, lines = 25):
+    global _profile
+    if _profile is None:
+        return ""
+    
+    profile = _profile
+    _profile = None
+    profile.disable()
+    if path is not None:
+        profile.dump_stats(path)
+    
+    summary = StringIO()
+    pstats.Stats(profile, stream = summary).sort_stats("cumulative").print_stats(lines)
+    
+    return summary.getvalue()
+
+def is_profiling():
+    return _profile is not None
+
+#------------------------------------------------------------------------------#
@@ -0,0 +1,176 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module keeps the program's log: every message is given a level, and
+those at or above the sink's level are kept, up to a number of lines, in a
+ring buffer whose oldest lines are dropped as new ones come.  Each is also
+echoed to the console, and mirrored to a file which is rotated as it
+grows, if asked for.
+
+Views take the lines added since they last looked with take_pending(),
+in batches, rather than being handed each line; a wake function, if set,
+is called when the first line of a batch arrives, so a view can schedule
+its next update.  Nothing here imports GTK; lines may be logged from any
+thread.
+
+Classes
+    LogSink
+
+Functions
+    level_name(int:level)               -> returns the name of a level
+"""
+
+import collections
+import os
+import threading
+import time
+
+#------------------------------------------------------------------------------#
+
+# the levels, the same numbers the logging module uses
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = (DEBUG, INFO, WARNING, ERROR)
+_LEVEL_NAMES = { DEBUG : "DEBUG", INFO : "INFO", WARNING : "WARNING", ERROR : "ERROR" }
+
+# lines kept by default
+DEFAULT_MAX_LINES = 5000
+
+# the size a log file may grow to before it is rotated, and how many old
+# files are kept, as log.1, log.2 and so on
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+
+def level_name(level):
+    return _LEVEL_NAMES.get(level, str(level))
+
+class LogSink(object):
+
+    """
+    A bounded log of (level, message) lines.  echo is a file to which
+    each kept line is written as it is logged, such as sys.stdout; path is
+    a file to append the lines to, with their time and level.
+    
+    Functions:
+        log(string:message[, int:level])    -> keeps the message, if its level
+                                                is at least the sink's
+        debug(string:message)
+        info(string:message)
+        warning(string:message)
+        error(string:message)
+        set_level(int:level)                -> sets the least level kept
+        get_level()                         -> returns it
+        get_lines([int:level])              -> returns the kept (level,
+                                                message) lines at or above
+                                                level, oldest first
+        take_pending()                      -> returns the kept lines logged
+                                                since the last call, oldest
+                                                first
+        set_wake(function)                  -> calls function() when a line
+                                                arrives with none pending
+        get_dropped_count()                 -> returns the number of lines
+                                                dropped to keep within the
+                                                limit
+        close()                             -> closes the file
+    """
+    
+    def __init__(self, maxLines = DEFAULT_MAX_LINES, level = DEBUG, echo = None, path = None,
+                 maxBytes = DEFAULT_MAX_BYTES, backupCount = DEFAULT_BACKUP_COUNT):
+        self.__lock = threading.Lock()
+        self.__lines = collections.deque(maxlen = maxLines)
+        self.__pending = collections.deque(maxlen = maxLines)
+        self.__level = level
+        self.__echo = echo
+        self.__wake = None
+        self.__dropped = 0
+        
+        self.__path = path
+        self.__maxBytes = maxBytes
+        self.__backupCount = backupCount
+        self.__file = None
+        if path is not None:
+            self.__file = open(path, "ab")
+    
+    def log(self, message, level = INFO):
+        if level < self.__level:
+            return
+        
+        wake = None
+        with self.__lock:
+            if len(self.__lines) == self.__lines.maxlen:
+                self.__dropped += 1
+            self.__lines.append((level, message))
+            if not self.__pending:
+                wake = self.__wake
+            self.__pending.append((level, message))
+            
+            if self.__echo is not None:
+                # details are indented under what they belong to
+                self.__echo.write(("    " if level == DEBUG else "  ") + message + "\n")
+            if self.__file is not None:
+                self.__write_file(level, message)
+        
+        # the wake function is called outside the lock, so it may log
+        if wake is not None:
+            wake()
+    
+    def debug(self, message):
+        self.log(message, DEBUG)
+    
+    def info(self, message):
+        self.log(message, INFO)
+    
+    def warning(self, message):
+        self.log(message, WARNING)
+    
+    def error(self, message):
+        self.log(message, ERROR)
+    
+    def set_level(self, level):
+        self.__level = level
+    
+    def get_level(self):
+        return self.__level
+    
+    def get_lines(self, level = DEBUG):
+        with self.__lock:
+            return [line for line in self.__lines if line[0] >= level]
+    
+    def take_pending(self):
+        with self.__lock:
+            taken = list(self.__pending)
+            self.__pending.clear()
+        
+        return taken
+    
+    def set_wake(self, function):
+        self.__wake = function
+    
+    def get_dropped_count(self):
+        return self.__dropped
+    
+    def close(self):
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+    
+    def __write_file(self, level, message):
+        self.__file.write("%s %-7s %s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"), level_name(level), message))
+        self.__file.flush()
+        if self.__file.tell() >= self.__maxBytes:
+            self.__rotate()
+    
+    def __rotate(self):
+        # log.2 becomes log.3 and so on, the oldest being dropped, and the
+        # log becomes log.1
+        self.__file.close()
+        for i in range(self.__backupCount - 1, 0, -1):
+            older = "%s.%d" % (self.__path, i)
+            if os.path.exists(older):
+                os.rename(older, "%s.%d" % (self.__path, i + 1))
+        if self.__backupCount > 0:
+            os.rename(self.__path, self.__path + ".1")
+        else:
+            os.remove(self.__path)
+        self.__file = open(self.__path, "ab")
@@ -0,0 +1,622 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module keeps whole rosters of creatures in single files.  A roster
+archive holds one creature record (see creatureInfo.encode_creature) after
+another, followed by an index of each record's name, offset and length.
+
+Archives are read through mmap: opening one only reads its index, and
+getting a creature decodes just that creature's record, unpacking its
+numbers straight out of the mapped file.
+
+    header      4s "SDNR", B format version, I creature count, Q index offset
+    records     one creature record per creature, in roster order
+    index       for each creature, in roster order, its name (H length and
+                utf-8 bytes), Q record offset and I record length
+
+Classes
+    RosterArchive
+    LazyCreatureList
+
+Functions
+    save_roster(list:creatures, string:path)    -> writes the creatures to an
+                                                    archive at path
+    load_roster(string:path)                    -> returns a CreatureList of
+                                                    every creature in an archive
+    write_roster(string:path, records)          -> writes (name, creature
+                                                    record) pairs to an archive
+    is_roster(string:path)                      -> returns True if the file is
+                                                    a roster archive
+"""
+
+import mmap
+import os
+import struct
+from collections import deque
+from cStringIO import StringIO
+
+from creatureInfo import CreatureList, encode_creature, decode_creature, load_creature
+from creatureInfo import is_creature_record
+from indexedList import NameIndexedList
+from backgroundIO import replacing_file, write_file
+import changeTracking
+
+#------------------------------------------------------------------------------#
+
+ROSTER_FORMAT_VERSION = 1
+
+_MAGIC = "SDNR"
+_HEADER = struct.Struct("<4sBIQ")
+_SHORT = struct.Struct("<H")
+_ENTRY = struct.Struct("<QI")
+
+#------------------------------------------------------------------------------#
+
+class RosterArchive(object):
+
+    """
+    An open roster archive.  Creatures are decoded from the file each time
+    they are asked for, so changing one does not change the archive; save
+    the roster again to keep changes.  As in a CreatureList, when two
+    creatures share a name the first one is found by name.
+    
+    Archives should be closed when finished with, or used in a with
+    statement.
+    
+    Functions:
+        get_names()                 -> returns the creatures' names, in
+                                        roster order
+        has_name(string:name)       -> returns True if a creature has that name
+        get_by_name(string:name)    -> returns the creature with that name, or
+                                        None
+        get(int:index)              -> returns the creature at index
+        get_record(int:index)       -> returns the creature record at index
+        to_creature_list()          -> returns a CreatureList of every creature
+        close()                     -> unmaps and closes the file
+    """
+    
+    def __init__(self, path):
+        self.__file = open(path, "rb")
+        try:
+            self.__data = mmap.mmap(self.__file.fileno(), 0, access = mmap.ACCESS_READ)
+        except:
+            self.__file.close()
+            raise
+        
+        try:
+            self.__read_index()
+        except:
+            self.close()
+            raise
+    
+    def __read_index(self):
+        data = self.__data
+        if len(data) < _HEADER.size:
+            raise ValueError("not a roster archive")
+        
+        magic, version, count, offset = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError("not a roster archive")
+        if version > ROSTER_FORMAT_VERSION:
+            raise ValueError("roster archive version %d is newer than this program can read" % version)
+        
+        names = []
+        entries = []
+        byName = {}
+        try:
+            for i in xrange(count):
+                length, = _SHORT.unpack_from(data, offset)
+                offset += _SHORT.size
+                name = data[offset:offset + length]
+                offset += length
+                entry = _ENTRY.unpack_from(data, offset)
+                offset += _ENTRY.size
+                
+                names.append(name)
+                entries.append(entry)
+                byName.setdefault(name, entry)
+        except struct.error:
+            raise ValueError("roster archive index is cut short")
+        
+        self.__names = names
+        self.__entries = entries
+        self.__byName = byName
+    
+    def __len__(self):
+        return len(self.__entries)
+    
+    def __iter__(self):
+        for entry in self.__entries:
+            yield self.__decode(entry)
+    
+    def __contains__(self, name):
+        return name in self.__byName
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+    
+    def get_names(self):
+        return list(self.__names)
+    
+    def has_name(self, name):
+        return name in self.__byName
+    
+    def get_by_name(self, name):
+        entry = self.__byName.get(name)
+        if entry is None:
+            return None
+        
+        return self.__decode(entry)
+    
+    def get(self, index):
+        return self.__decode(self.__entries[index])
+    
+    def get_record(self, index):
+        if self.__data is None:
+            raise ValueError("the roster archive is closed")
+        
+        offset, length = self.__entries[index]
+        return self.__data[offset:offset + length]
+    
+    def to_creature_list(self):
+        creatures = CreatureList()
+        creatures.extend(self)
+        
+        return creatures
+    
+    def close(self):
+        if self.__data is not None:
+            self.__data.close()
+            self.__data = None
+        self.__file.close()
+    
+    def __decode(self, entry):
+        if self.__data is None:
+            raise ValueError("the roster archive is closed")
+        
+        offset, length = entry
+        creature, end = decode_creature(self.__data, offset)
+        if end != offset + length:
+            raise ValueError("roster archive record does not match its index")
+        
+        return creature
+
+#------------------------------------------------------------------------------#
+
+def save_roster(creatures, path):
+    # lazy lists hand over their records without decoding the creatures
+    if isinstance(creatures, LazyCreatureList):
+        records = creatures.iter_records()
+    else:
+        records = ((c.get_name(), encode_creature(c)) for c in creatures)
+    
+    write_roster(path, records)
+
+def write_roster(path, records):
+    # written beside the old archive and then moved over it, so an archive
+    # is never left half written, even if it is open at the time; if a
+    # record can not be written the old archive is left as it was
+    with replacing_file(path) as f:
+        f.write(_HEADER.pack(_MAGIC, ROSTER_FORMAT_VERSION, 0, 0))
+        
+        offset = _HEADER.size
+        index = []
+        
+        # the loop runs once a creature, so what it calls is looked up once
+        write, add, packShort, packEntry = f.write, index.append, _SHORT.pack, _ENTRY.pack
+        for name, record in records:
+            write(record)
+            
+            if isinstance(name, unicode):
+                name = name.encode("utf-8")
+            length = len(record)
+            add(packShort(len(name)) + name + packEntry(offset, length))
+            offset += length
+        
+        f.write("".join(index))
+        
+        # the header is filled in once the index's place is known
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, ROSTER_FORMAT_VERSION, len(index), offset))
+
+def load_roster(path):
+    with RosterArchive(path) as archive:
+        return archive.to_creature_list()
+
+def is_roster(path):
+    with open(path, "rb") as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+#------------------------------------------------------------------------------#
+
+# how many creatures a LazyCreatureList keeps decoded at once by default
+DEFAULT_MAX_LOADED = 1000
+
+class _LazySlot(object):
+
+    # one creature of a LazyCreatureList.  source is the creature's index in
+    # the list's archive or its file in the list's directory, or None for
+    # creatures added since.  record is the creature's encoding once it has
+    # been dropped with changes its source does not have.
+    
+    __slots__ = ("name", "source", "record", "creature")
+    
+    def __init__(self, name, source = None, creature = None):
+        self.name = name
+        self.source = source
+        self.record = None
+        self.creature = creature
+    
+    def get_name(self):
+        return self.name
+    
+    def set_name(self, name):
+        self.name = name
+
+class LazyCreatureList(object):
+
+    """
+    A list of creatures which reads only their names when it is opened, and
+    decodes each creature the first time it is asked for.  It is opened on
+    a roster archive or on a directory of .creature files, in which case
+    each creature's name is its file name.
+    
+    At most maxLoaded creatures are kept decoded; the least recently used
+    one is dropped when another is needed.  A dropped creature which has
+    changed is kept encoded in memory until the list is saved, so changes
+    are never lost, but a creature should only be held on to while it is
+    being used: changes made to it after it has been dropped are.  Creatures
+    which are observed (see changeTracking.observe) are never dropped.
+    
+    save() writes the list back.  A directory only has the files of
+    creatures which changed (or were added or renamed) rewritten, and the
+    files of renamed creatures are moved to their new names; creatures
+    removed from the list keep their files.
+    
+    Functions:
+        get_names()                     -> returns the creatures' names, in
+                                            list order, without decoding any
+        has_name(string:name)           -> returns True if a creature has
+                                            that name
+        get_by_name(string:name)        -> returns the first creature with
+                                            that name, or None
+        find_index_by_name(string:name) -> returns the index of the first
+                                            creature with that name, or -1
+        remove_by_name(string:name)     -> removes and returns the first
+                                            creature with that name, or None
+        rename(string:oldName, string:newName) -> renames a creature and
+                                            returns it
+        append(Creature:creature)
+        extend(list:creatures)
+        get_loaded_count()              -> returns how many creatures are
+                                            decoded
+        get_loaded()                    -> returns the decoded creatures
+        is_loaded(Creature:creature)    -> returns True if the creature is
+                                            in the list and decoded
+        get_dirty_names()               -> returns the names of creatures
+                                            which differ from their source
+        get_unsaved_names()             -> returns the names of creatures
+                                            added since, which have no
+                                            source yet
+        get_file(Creature:creature)     -> returns the file in the list's
+                                            directory the creature was read
+                                            from or saved to, or None
+        set_file(Creature:creature, string:path) -> records that the
+                                            creature has been written to a
+                                            file in the list's directory
+        iter_records()                  -> yields each creature's name and
+                                            creature record, in list order
+        save([string:path])             -> writes the list to a roster
+                                            archive, or to a directory when
+                                            path is one, and reopens it there
+        close()
+    """
+    
+    def __init__(self, path = None, maxLoaded = DEFAULT_MAX_LOADED):
+        self.__path = None
+        self.__archive = None
+        self.__directory = None
+        self.__slots = NameIndexedList()
+        
+        # the decoded creatures' slots, least recently used first; __order
+        # may hold stale entries, which __loaded's stamps tell apart
+        self.__maxLoaded = max(1, maxLoaded)
+        self.__loaded = {}
+        self.__order = deque()
+        self.__stamp = 0
+        
+        if path is None:
+            pass
+        elif os.path.isdir(path):
+            self.__open_directory(path)
+        else:
+            self.__open_archive(path)
+    
+    def __open_archive(self, path):
+        archive = RosterArchive(path)
+        if self.__archive is not None:
+            self.__archive.close()
+        
+        self.__path = path
+        self.__archive = archive
+        self.__directory = None
+        
+        if not self.__slots:
+            self.__slots.extend([_LazySlot(name, i) for i, name in enumerate(archive.get_names())])
+    
+    def __open_directory(self, directory):
+        self.__path = directory
+        self.__directory = directory
+        
+        fileNames = [f for f in os.listdir(directory) if f.endswith(".creature")]
+        fileNames.sort()
+        self.__slots.extend([_LazySlot(f[:-len(".creature")], os.path.join(directory, f))
+                             for f in fileNames])
+    
+    # ----- list access ----- #
+    
+    def __len__(self):
+        return len(self.__slots)
+    
+    def __iter__(self):
+        for slot in list(self.__slots):
+            yield self.__materialize(slot)
+    
+    def __getitem__(self, index):
+        if not isinstance(index, (int, long)):
+            raise TypeError("LazyCreatureList indices must be integers")
+        
+        return self.__materialize(self.__slots[index])
+    
+    def __contains__(self, item):
+        if isinstance(item, basestring):
+            return self.__slots.has_name(item)
+        
+        for slot in self.__slots:
+            if slot.creature is item:
+                return True
+        
+        return False
+    
+    def get_names(self):
+        return self.__slots.get_names()
+    
+    def has_name(self, name):
+        return self.__slots.has_name(name)
+    
+    def get_by_name(self, name):
+        slot = self.__slots.get_by_name(name)
+        if slot is None:
+            return None
+        
+        return self.__materialize(slot)
+    
+    def find_index_by_name(self, name):
+        return self.__slots.find_index_by_name(name)
+    
+    def remove_by_name(self, name):
+        slot = self.__slots.get_by_name(name)
+        if slot is None:
+            return None
+        
+        creature = self.__materialize(slot)
+        self.__slots.remove_by_name(name)
+        del self.__loaded[id(slot)]
+        
+        return creature
+    
+    def rename(self, oldName, newName):
+        slot = self.__slots.get_by_name(oldName)
+        if slot is None:
+            return None
+        
+        creature = self.__materialize(slot)
+        self.__slots.rename(oldName, newName)
+        creature.set_name(newName)
+        
+        return creature
+    
+    def append(self, creature):
+        slot = _LazySlot(creature.get_name(), None, creature)
+        self.__slots.append(slot)
+        self.__use(slot)
+        self.__evict()
+    
+    def extend(self, creatures):
+        for creature in creatures:
+            self.append(creature)
+    
+    def get_loaded_count(self):
+        return len(self.__loaded)
+    
+    def get_loaded(self):
+        return [slot.creature for slot in self.__slots if id(slot) in self.__loaded]
+    
+    def is_loaded(self, creature):
+        slot = self.__slots.get_by_name(creature.get_name())
+        
+        return slot is not None and slot.creature is creature and id(slot) in self.__loaded
+    
+    def get_dirty_names(self):
+        return [slot.name for slot in self.__slots if self.__is_dirty(slot)]
+    
+    def get_unsaved_names(self):
+        return [slot.name for slot in self.__slots if slot.source is None]
+    
+    def get_file(self, creature):
+        slot = self.__slots.get_by_name(creature.get_name())
+        if slot is None or slot.creature is not creature or self.__directory is None:
+            return None
+        
+        return slot.source
+    
+    def set_file(self, creature, path):
+        # for an autosaver, which writes creatures' files itself; the file
+        # becomes the creature's source, while any changes dropped since
+        # stay kept encoded
+        slot = self.__slots.get_by_name(creature.get_name())
+        if slot is None or self.__directory is None:
+            return
+        if slot.creature is not None and slot.creature is not creature:
+            return
+        
+        if os.path.samefile(os.path.dirname(path) or ".", self.__directory):
+            slot.source = path
+    
+    # ----- saving ----- #
+    
+    def iter_records(self):
+        for slot in list(self.__slots):
+            yield slot.name, self.__current_record(slot)
+    
+    def save(self, path = None):
+        if path is None:
+            path = self.__path
+            if path is None:
+                raise ValueError("the roster has no file or directory to be saved to")
+        
+        if os.path.isdir(path):
+            self.__save_directory(path)
+        else:
+            write_roster(path, self.iter_records())
+            
+            # the archive just written is now every creature's source
+            self.__open_archive(path)
+            for i, slot in enumerate(self.__slots):
+                slot.source = i
+                slot.record = None
+    
+    def __save_directory(self, directory):
+        sameDirectory = self.__directory is not None and os.path.samefile(directory, self.__directory)
+        
+        # each file is written beside its old one and moved over it, so a
+        # creature's file is never left half written
+        paths = []
+        for slot in self.__slots:
+            path = os.path.join(directory, slot.name + ".creature")
+            if not sameDirectory or slot.source != path or self.__is_dirty(slot):
+                write_file(path, self.__current_record(slot))
+            paths.append(path)
+        
+        # renamed creatures' files under their old names would bring them
+        # back under those names, unless another creature has taken them
+        if sameDirectory:
+            kept = set(paths)
+            for slot in self.__slots:
+                if isinstance(slot.source, basestring) and slot.source not in kept and os.path.exists(slot.source):
+                    os.remove(slot.source)
+        
+        if self.__archive is not None:
+            self.__archive.close()
+            self.__archive = None
+        self.__path = directory
+        self.__directory = directory
+        for slot, path in zip(self.__slots, paths):
+            slot.source = path
+            slot.record = None
+    
+    def close(self):
+        if self.__archive is not None:
+            self.__archive.close()
+    
+    # ----- decoding and dropping creatures ----- #
+    
+    def __materialize(self, slot):
+        creature = slot.creature
+        if creature is None:
+            if slot.record is not None:
+                creature = decode_creature(slot.record)[0]
+            elif self.__directory is not None:
+                with open(slot.source, "rb") as f:
+                    creature = load_creature(f)
+            else:
+                creature = self.__archive.get(slot.source)
+            slot.creature = creature
+        
+        self.__use(slot)
+        self.__evict()
+        
+        return creature
+    
+    def __use(self, slot):
+        self.__stamp += 1
+        self.__loaded[id(slot)] = self.__stamp
+        self.__order.append((self.__stamp, slot))
+        
+        if len(self.__order) > 2 * len(self.__loaded) + 64:
+            # drop the stale entries left by creatures used more than once
+            loaded = self.__loaded
+            self.__order = deque([(stamp, s) for stamp, s in self.__order if loaded.get(id(s)) == stamp])
+    
+    def __evict(self):
+        loaded = self.__loaded
+        changes = changeTracking.changed
+        kept = []
+        while len(loaded) > self.__maxLoaded and self.__order:
+            stamp, slot = self.__order.popleft()
+            if loaded.get(id(slot)) != stamp:
+                continue
+            
+            if stamp == self.__stamp:
+                # the creature just asked for is never dropped
+                kept.append((stamp, slot))
+                break
+            
+            if changes and changeTracking.is_creature_changed(slot.creature, changes):
+                # changes an autosaver has yet to take stay decoded
+                kept.append((stamp, slot))
+                continue
+            
+            if changeTracking.is_observed(slot.creature):
+                # a view observing the creature would be left with a copy
+                # nobody changes, were it decoded again
+                kept.append((stamp, slot))
+                continue
+            
+            del loaded[id(slot)]
+            self.__drop(slot)
+        
+        kept.reverse()
+        self.__order.extendleft(kept)
+    
+    def __drop(self, slot):
+        # there is no telling whether the creature was changed, so it is
+        # kept encoded unless it matches its source
+        record = encode_creature(slot.creature)
+        if slot.source is None or record != self.__source_record(slot):
+            slot.record = record
+        else:
+            slot.record = None
+        slot.creature = None
+    
+    def __is_dirty(self, slot):
+        if slot.creature is not None:
+            return slot.source is None or encode_creature(slot.creature) != self.__source_record(slot)
+        
+        return slot.record is not None
+    
+    def __current_record(self, slot):
+        if slot.creature is not None:
+            return encode_creature(slot.creature)
+        if slot.record is not None:
+            return slot.record
+        
+        return self.__source_record(slot)
+    
+    def __source_record(self, slot):
+        if self.__directory is None:
+            return self.__archive.get_record(slot.source)
+        
+        with open(slot.source, "rb") as f:
+            data = f.read()
+        if is_creature_record(data):
+            return data
+        
+        # files saved as pickles are compared and written as records
+        return encode_creature(load_creature(StringIO(data)))
+
+#------------------------------------------------------------------------------#
@@ -0,0 +1,391 @@
+#! /usr/bin/env python
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module runs head-to-head encounters between two creatures many times
+over, to see how evenly they are matched.  Run it with the names of two
+creatures in the data directory (or the paths of two .creature files):
+
+    python simulate.py [options] first second
+
+In an encounter the two creatures take turns to use a skill against each
+other (Attack by default, which the target opposes with Defense) until one
+of them runs out of wound points.  The degree of success of each use is
+dealt as damage.  The creatures take the first turn in alternate
+encounters.  Every encounter starts from fresh copies of the creatures, so
+the experience they gain only carries through one encounter.
+
+Encounters are split into chunks which are run by a pool of worker
+processes.  Encounter i always rolls the dice stream keyed (seed, i), so
+a simulation comes out the same whatever the number of workers or the
+chunk size.
+
+Classes
+    SimulationResult
+
+Functions
+    simulate(Creature:first, Creature:second, int:encounters[, workers, chunkSize, seed, skillName, maxTurns])
+                                        -> returns a SimulationResult
+    run_encounters(Creature:first, Creature:second, int:start, int:stop, seed[, skillName, maxTurns])
+                                        -> returns a SimulationResult for
+                                            encounters start to stop, in
+                                            this process
+    load_creature_file(string:nameOrPath) -> returns the creature in a data
+                                            file
+"""
+
+import cPickle
+import multiprocessing
+import optparse
+import os
+import random
+import sys
+from timeit import default_timer
+
+from creatureInfo import load_creature
+from diceStream import DiceStream
+from skillInfo import experience_gain
+
+# the directory creatures are saved to, as skillDnD.py sees it
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data")
+
+# encounters which have not ended after this many turns are draws
+DEFAULT_MAX_TURNS = 100
+
+#------------------------------------------------------------------------------#
+
+class SimulationResult(object):
+
+    """
+    The outcome of a number of encounters.  Results of separate runs over
+    the same two creatures can be combined with merge().
+    
+    Sides are numbered 0 for the first creature and 1 for the second.  A
+    side's degree of success is the margin its skill roll beat the
+    opposing roll by; it is zero or negative when the use missed.  Curves
+    are indexed by turn, and give the mean over the encounters which
+    lasted that many turns.
+    
+    Functions:
+        merge(SimulationResult:other)   -> adds other's encounters to this
+                                            result
+        add_encounter(winner, int:turns, degrees, experience, levels)
+                                        -> records one encounter
+        get_names()                     -> returns the two creatures' names
+        get_seed()                      -> returns the seed the dice were
+                                            keyed with
+        get_encounters()                -> returns the number of encounters
+        get_wins()                      -> returns [first wins, second wins,
+                                            draws]
+        get_win_rates()                 -> returns get_wins() as fractions of
+                                            the encounters
+        get_degree_distribution(int:side) -> returns a dictionary of degree
+                                            of success to the fraction of
+                                            the side's skill uses
+        get_turn_distribution()         -> returns a dictionary of encounter
+                                            length in turns to count
+        get_experience_curve(int:side)  -> returns the side's mean experience
+                                            gained by the end of each turn
+        get_level_curve(int:side)       -> returns the side's mean levels
+                                            gained by the end of each turn
+        report()                        -> returns the result as text
+    """
+    
+    def __init__(self, names, seed):
+        self.__names = tuple(names)
+        self.__seed = seed
+        self.__wins = [0, 0, 0]
+        self.__degrees = [{}, {}]
+        self.__turns = {}
+        
+        # sums over encounters, per turn; __running[t] encounters lasted
+        # past turn t
+        self.__running = []
+        self.__experience = [[], []]
+        self.__levels = [[], []]
+    
+    def merge(self, other):
+        if other.get_names() != self.__names or other.get_seed() != self.__seed:
+            raise ValueError("results of different simulations can not be merged")
+        
+        for i in range(3):
+            self.__wins[i] += other.__wins[i]
+        for side in (0, 1):
+            _add_counts(self.__degrees[side], other.__degrees[side])
+            _add_sums(self.__experience[side], other.__experience[side])
+            _add_sums(self.__levels[side], other.__levels[side])
+        _add_counts(self.__turns, other.__turns)
+        _add_sums(self.__running, other.__running)
+        
+        return self
+    
+    def add_encounter(self, winner, turns, degrees, experience, levels):
+        # winner is 0, 1 or None for a draw; the rest are per side lists,
+        # the curves holding one running total per turn
+        self.__wins[winner is None and 2 or winner] += 1
+        self.__turns[turns] = self.__turns.get(turns, 0) + 1
+        _add_sums(self.__running, [1] * turns)
+        for side in (0, 1):
+            counts = self.__degrees[side]
+            for degree in degrees[side]:
+                counts[degree] = counts.get(degree, 0) + 1
+            _add_sums(self.__experience[side], experience[side])
+            _add_sums(self.__levels[side], levels[side])
+    
+    def get_names(self):
+        return self.__names
+    
+    def get_seed(self):
+        return self.__seed
+    
+    def get_encounters(self):
+        return sum(self.__wins)
+    
+    def get_wins(self):
+        return list(self.__wins)
+    
+    def get_win_rates(self):
+        encounters = float(max(self.get_encounters(), 1))
+        return [wins / encounters for wins in self.__wins]
+    
+    def get_degree_distribution(self, side):
+        counts = self.__degrees[side]
+        uses = float(max(sum(counts.values()), 1))
+        return dict([(degree, count / uses) for degree, count in counts.items()])
+    
+    def get_turn_distribution(self):
+        return dict(self.__turns)
+    
+    def get_experience_curve(self, side):
+        return _means(self.__experience[side], self.__running)
+    
+    def get_level_curve(self, side):
+        return _means(self.__levels[side], self.__running)
+    
+    def report(self):
+        lines = []
+        lines.append("%d encounters, seed %s" % (self.get_encounters(), self.__seed))
+        
+        rates = self.get_win_rates()
+        lines.append("  %-30s %6.1f%%" % ("%s wins" % self.__names[0], rates[0] * 100))
+        lines.append("  %-30s %6.1f%%" % ("%s wins" % self.__names[1], rates[1] * 100))
+        lines.append("  %-30s %6.1f%%" % ("draws", rates[2] * 100))
+        
+        turns = self.__turns
+        if turns:
+            mean = sum([t * n for t, n in turns.items()]) / float(sum(turns.values()))
+            lines.append("  %-30s %8.1f (%d to %d)" % ("turns per encounter", mean, min(turns), max(turns)))
+        
+        for side in (0, 1):
+            lines.append("")
+            lines.append("  %s" % self.__names[side])
+            distribution = self.get_degree_distribution(side)
+            hits = sum([p for degree, p in distribution.items() if degree > 0])
+            lines.append("    %-28s %6.1f%%" % ("uses that hit", hits * 100))
+            lines.append("    degree of success:")
+            for degree in sorted(distribution):
+                lines.append("      %4d  %6.2f%%" % (degree, distribution[degree] * 100))
+            
+            experience = self.get_experience_curve(side)
+            levels = self.get_level_curve(side)
+            lines.append("    %-6s %12s %12s" % ("turn", "experience", "levels"))
+            for turn in _curve_turns(len(experience)):
+                lines.append("    %-6d %12.1f %12.2f" % (turn + 1, experience[turn], levels[turn]))
+        
+        return "\n".join(lines)
+
+def _add_counts(counts, other):
+    for key, count in other.items():
+        counts[key] = counts.get(key, 0) + count
+
+def _add_sums(sums, other):
+    # element-wise sums, lengthening sums as needed
+    if len(other) > len(sums):
+        sums.extend([0] * (len(other) - len(sums)))
+    for i in xrange(len(other)):
+        sums[i] += other[i]
+
+def _means(sums, counts):
+    return [float(s) / c for s, c in zip(sums, counts)]
+
+def _curve_turns(length):
+    # a handful of turns spread over the curve, always including the last
+    if length <= 10:
+        return range(length)
+    
+    step = length / 10.0
+    return sorted(set([int(i * step) for i in range(10)] + [length - 1]))
+
+#------------------------------------------------------------------------------#
+
+def run_encounters(first, second, start, stop, seed, skillName = "Attack", maxTurns = DEFAULT_MAX_TURNS):
+    prototypes = (cPickle.dumps(first, 2), cPickle.dumps(second, 2))
+    return _run_encounters(prototypes, start, stop, seed, skillName, maxTurns)
+
+def _run_encounters(prototypes, start, stop, seed, skillName, maxTurns):
+    loads = cPickle.loads
+    creatures = [loads(p) for p in prototypes]
+    outcome = SimulationResult([c.get_name() for c in creatures], seed)
+    
+    opposingName = creatures[0].get_skills("list of Skill").get_skill(skillName).get_opposing_skill()
+    if opposingName is None:
+        raise ValueError("%s is not opposed, so it can not be used in an encounter" % skillName)
+    
+    for index in xrange(start, stop):
+        # every encounter starts from fresh copies of the two creatures
+        creatures = [loads(p) for p in prototypes]
+        healths = [c.get_health() for c in creatures]
+        skills = [c.get_skills("list of Skill") for c in creatures]
+        attacking = [s.get_skill(skillName) for s in skills]
+        defending = [s.get_skill(opposingName) for s in skills]
+        dice = DiceStream((seed, index), 64)
+        
+        degrees = ([], [])
+        experience = ([], [])
+        levels = ([], [])
+        gained = [0, 0]
+        startLevels = [attacking[side].get_level() + defending[side].get_level() for side in (0, 1)]
+        
+        winner = None
+        turns = 0
+        alive = [h.get_current_wp() > 0 for h in healths]
+        if not alive[0] or not alive[1]:
+            # a creature without wound points loses before a turn is taken
+            if alive[0]:
+                winner = 0
+            elif alive[1]:
+                winner = 1
+        else:
+            opener = index % 2
+            for turn in xrange(maxTurns):
+                attacker = (opener + turn) % 2
+                defender = 1 - attacker
+                
+                # the target's result is the margin its roll beat the
+                # attacker's by; both sides gain experience from it
+                result = creatures[attacker].use_skill(skillName, target = creatures[defender], dice = dice)
+                degree = -result
+                degrees[attacker].append(degree)
+                
+                gain = experience_gain(result)
+                gained[attacker] += gain
+                gained[defender] += gain
+                for side in (0, 1):
+                    experience[side].append(gained[side])
+                    levels[side].append(attacking[side].get_level() + defending[side].get_level() - startLevels[side])
+                
+                turns = turn + 1
+                if degree > 0 and healths[defender].damage_wp(degree) <= 0:
+                    winner = attacker
+                    break
+        
+        outcome.add_encounter(winner, turns, degrees, experience, levels)
+    
+    return outcome
+
+#------------------------------------------------------------------------------#
+
+# the creatures a worker process runs encounters between, set when the
+# worker starts so they are only sent to it once
+_workerPrototypes = None
+
+def _init_worker(prototypes):
+    global _workerPrototypes
+    _workerPrototypes = prototypes
+
+def _run_chunk(chunk):
+    start, stop, seed, skillName, maxTurns = chunk
+    return _run_encounters(_workerPrototypes, start, stop, seed, skillName, maxTurns)
+
+def simulate(first, second, encounters, workers = None, chunkSize = None, seed = None,
+             skillName = "Attack", maxTurns = DEFAULT_MAX_TURNS):
+    """
+    Run encounters between first and second, spread over workers processes
+    (one per cpu by default; 1 runs them in this process).  seed keys the
+    dice; a random one is picked when it is not given, and kept in the
+    result so the run can be repeated.
+    """
+    
+    if seed is None:
+        seed = random.SystemRandom().randint(0, 2 ** 31 - 1)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if chunkSize is None:
+        # a few chunks per worker keeps them all busy to the end
+        chunkSize = max(1, min(5000, encounters / (workers * 4) + 1))
+    
+    if workers <= 1:
+        return run_encounters(first, second, 0, encounters, seed, skillName, maxTurns)
+    
+    prototypes = (cPickle.dumps(first, 2), cPickle.dumps(second, 2))
+    chunks = [(start, min(start + chunkSize, encounters), seed, skillName, maxTurns)
+              for start in xrange(0, encounters, chunkSize)]
+    
+    result = SimulationResult((first.get_name(), second.get_name()), seed)
+    pool = multiprocessing.Pool(workers, _init_worker, (prototypes,))
+    try:
+        for chunkResult in pool.imap_unordered(_run_chunk, chunks):
+            result.merge(chunkResult)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    
+    return result
+
+#------------------------------------------------------------------------------#
+
+def load_creature_file(nameOrPath):
+    path = nameOrPath
+    if not os.path.exists(path):
+        path = os.path.join(DATA_DIRECTORY, nameOrPath + ".creature")
+    
+    with open(path, "rb") as f:
+        return load_creature(f)
+
+def main(arguments):
+    parser = optparse.OptionParser(usage = "%prog [options] first second")
+    parser.add_option("-n", "--encounters", type = "int", default = 10000,
+                      help = "number of encounters to run [default: %default]")
+    parser.add_option("-w", "--workers", type = "int",
+                      help = "number of worker processes [default: one per cpu]")
+    parser.add_option("-c", "--chunk-size", type = "int", dest = "chunkSize",
+                      help = "encounters given to a worker at a time")
+    parser.add_option("-s", "--seed", type = "int",
+                      help = "seed for the dice [default: random]")
+    parser.add_option("-k", "--skill", default = "Attack",
+                      help = "opposed skill the creatures use [default: %default]")
+    parser.add_option("-t", "--max-turns", type = "int", dest = "maxTurns", default = DEFAULT_MAX_TURNS,
+                      help = "turns before an encounter is a draw [default: %default]")
+    options, names = parser.parse_args(arguments)
+    if len(names) != 2:
+        parser.error("two creatures are needed")
+    
+    first, second = [load_creature_file(name) for name in names]
+    
+    # both creatures use the skill, and defend with its opposing skill
+    for creature in (first, second):
+        skill = creature.get_skills("list of Skill").get_skill(options.skill)
+        if skill is None:
+            parser.error("%s has no skill %s" % (creature.get_name(), options.skill))
+        opposingName = skill.get_opposing_skill()
+        if opposingName is None:
+            parser.error("%s is not opposed, so it can not be used in an encounter" % options.skill)
+        if creature.get_skills("list of Skill").get_skill(opposingName) is None:
+            parser.error("%s has no skill %s to defend with" % (creature.get_name(), opposingName))
+    
+    start = default_timer()
+    result = simulate(first, second, options.encounters, options.workers, options.chunkSize,
+                      options.seed, options.skill, options.maxTurns)
+    elapsed = default_timer() - start
+    
+    print result.report()
+    print
+    print "%d encounters in %.2f s (%.0f per second)" % (result.get_encounters(), elapsed,
+                                                          result.get_encounters() / max(elapsed, 1e-9))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,270 @@
+#! /usr/bin/env python
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module runs SkillDnD commands without a user interface, for driving
+the engine from scripts and other programs.  Commands are read as JSON
+objects, one per line, from stdin, and a result is written for each, one
+per line, to stdout:
+
+    python skillBatch.py [options] < commands > results
+
+Each command names its operation in "op":
+
+    create      name, and optionally the six attributes in lower case
+                ("strength", ...) and "skills", a mapping of skill name to
+                level; makes a creature with the standard skills
+    use_skill   creature, skill, and optionally dc, target and modifiers;
+                the result is the skill check's "result"
+    damage      creature, amount; the result holds the creature's "wp"
+    heal        creature, and amount or "full": true; as damage
+    query       creature; the result holds the creature's attributes,
+                health, status and skills.  Without a creature the result
+                holds the number of creatures as "count"
+    remove      creature; removes the creature
+
+A command's "id", if it has one, is copied to its result.  Results have
+"ok" true, or "ok" false and an "error"; a command which fails does not
+stop the ones after it.
+
+Commands are read, run and written one at a time, as a pipeline of
+generators, so the program's memory does not grow with the number of
+commands.  It never imports gtk, and starts in a few milliseconds.
+
+Functions
+    read_commands(lines)                -> yields the command on each line
+    run_commands(commands, creatures[, DiceStream:dice]) -> yields the result
+                                            of each command
+    run_command(dict:command, creatures[, DiceStream:dice]) -> runs one
+                                            command and returns its result
+    write_results(results, file:out[, bool:lineBuffered]) -> writes each
+                                            result as a line, and returns how
+                                            many were written
+"""
+
+import json
+import optparse
+import sys
+
+from creatureInfo import Creature, CreatureList, ATTRIBUTE_NAMES
+
+#------------------------------------------------------------------------------#
+
+# results written between flushes of the output, unless every line is
+# flushed
+FLUSH_EVERY = 1000
+
+class _CommandError(Exception):
+    pass
+
+def read_commands(lines):
+    # lines which are not JSON objects become commands which fail, so
+    # that they still get a result
+    for number, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        
+        try:
+            command = json.loads(line)
+        except ValueError, e:
+            command = { "op" : None, "error" : "line %d is not JSON: %s" % (number + 1, e) }
+        if not isinstance(command, dict):
+            command = { "op" : None, "error" : "line %d is not a JSON object" % (number + 1) }
+        
+        yield command
+
+def run_commands(commands, creatures, dice = None):
+    for command in commands:
+        yield run_command(command, creatures, dice)
+
+def run_command(command, creatures, dice = None):
+    result = { "ok" : True }
+    try:
+        if not isinstance(command, dict):
+            raise _CommandError("a command is a JSON object")
+        operation = _OPERATIONS.get(command.get("op"))
+        if operation is None:
+            raise _CommandError(command.get("error") or "unknown op %r" % command.get("op"))
+        
+        operation(creatures, command, dice, result)
+    except Exception, e:
+        # whatever goes wrong, only this command fails
+        result = { "ok" : False, "error" : _describe(e) }
+    
+    if isinstance(command, dict) and "id" in command:
+        result["id"] = command["id"]
+    
+    return result
+
+def write_results(results, out, lineBuffered = False):
+    count = 0
+    for result in results:
+        out.write(json.dumps(result, separators = (",", ":")) + "\n")
+        count += 1
+        if lineBuffered or count % FLUSH_EVERY == 0:
+            out.flush()
+    
+    out.flush()
+    
+    return count
+
+def _describe(error):
+    if isinstance(error, KeyError):
+        return "missing %s" % error.args[0]
+    if not isinstance(error, (_CommandError, TypeError, ValueError)):
+        return "%s: %s" % (error.__class__.__name__, error)
+    
+    return str(error)
+
+#------------------------------------------------------------------------------#
+
+def _text(value):
+    # creature names and skill names are utf-8 byte strings
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    if not isinstance(value, str):
+        raise _CommandError("%r is not a string" % (value,))
+    
+    return value
+
+def _int(value):
+    # numbers in commands are whole numbers; floats are truncated, as int()
+    # does, but strings, lists and the like are refused
+    if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+        raise _CommandError("%r is not a number" % (value,))
+    
+    return int(value)
+
+def _creature(creatures, command, key = "creature"):
+    name = _text(command[key])
+    creature = creatures.get_by_name(name)
+    if creature is None:
+        raise _CommandError("no creature is called %s" % name)
+    
+    return creature
+
+def _create(creatures, command, dice, result):
+    name = _text(command["name"])
+    attributes = [_int(command.get(attribute.lower(), 0)) for attribute in ATTRIBUTE_NAMES]
+    levels = command.get("skills", {})
+    if not isinstance(levels, dict):
+        raise _CommandError("skills is not a mapping of skill name to level")
+    creature = Creature(name, *attributes)
+    
+    skills = creature.get_skills("list of Skill")
+    for skillName, level in levels.items():
+        skill = skills.get_skill(_text(skillName))
+        if skill is None:
+            raise _CommandError("%s is not a standard skill" % skillName)
+        skill.set_level(_int(level))
+    
+    creatures.append(creature)
+    result["name"] = name
+
+def _use_skill(creatures, command, dice, result):
+    creature = _creature(creatures, command)
+    skillName = _text(command["skill"])
+    if creature.get_skills("list of Skill").get_skill(skillName) is None:
+        raise _CommandError("%s has no skill %s" % (creature.get_name(), skillName))
+    
+    target = None
+    if command.get("target") is not None:
+        target = _creature(creatures, command, "target")
+    
+    result["result"] = creature.use_skill(skillName, _int(command.get("dc", 0)), target,
+                                          _int(command.get("modifiers", 0)), dice)
+
+def _damage(creatures, command, dice, result):
+    health = _creature(creatures, command).get_health()
+    result["wp"] = health.damage_wp(_int(command["amount"]))
+
+def _heal(creatures, command, dice, result):
+    health = _creature(creatures, command).get_health()
+    if command.get("full"):
+        result["wp"] = health.heal_wp(fullRecover = True)
+    else:
+        result["wp"] = health.heal_wp(_int(command["amount"]))
+
+def _query(creatures, command, dice, result):
+    if command.get("creature") is None:
+        result["count"] = len(creatures)
+        return
+    
+    creature = _creature(creatures, command)
+    health = creature.get_health()
+    result["name"] = creature.get_name()
+    result["attributes"] = creature.get_attributes()
+    result["wp"] = health.get_current_wp()
+    result["max_wp"] = health.get_max_wp()
+    result["fatigue"] = health.get_current_fatigue()
+    result["max_fatigue"] = health.get_max_fatigue()
+    result["status"] = [effect for effect in health.get_status() if effect != "None"]
+    result["skills"] = dict([(skill.get_name(), { "level" : skill.get_level(), "exp" : skill.get_exp() })
+                             for skill in creature.get_skills("list of Skill")])
+
+def _remove(creatures, command, dice, result):
+    creatures.remove_by_name(_creature(creatures, command).get_name())
+
+_OPERATIONS = { "create"    : _create,
+                "use_skill" : _use_skill,
+                "damage"    : _damage,
+                "heal"      : _heal,
+                "query"     : _query,
+                "remove"    : _remove }
+
+#------------------------------------------------------------------------------#
+
+def _open_creatures(options):
+    # the storage modules are only imported when they are asked for
+    if options.database:
+        from creatureDatabase import CreatureDatabase
+        return CreatureDatabase(options.database)
+    if options.roster:
+        from rosterArchive import LazyCreatureList
+        return LazyCreatureList(options.roster)
+    
+    return CreatureList()
+
+def main(arguments):
+    parser = optparse.OptionParser(usage = "%prog [options] < commands > results")
+    parser.add_option("-d", "--database",
+                      help = "keep the creatures in this SQLite database, which is saved as it changes")
+    parser.add_option("-r", "--roster",
+                      help = "start with the creatures of this roster archive or directory")
+    parser.add_option("-S", "--save", action = "store_true", default = False,
+                      help = "save the creatures back to the roster when the commands run out")
+    parser.add_option("-s", "--seed", type = "int",
+                      help = "seed for the dice [default: the shared dice]")
+    parser.add_option("-l", "--line-buffered", action = "store_true", dest = "lineBuffered", default = False,
+                      help = "flush every result as it is written, for request and reply use")
+    options, rest = parser.parse_args(arguments)
+    if rest:
+        parser.error("commands are read from stdin")
+    if options.save and not options.roster:
+        parser.error("--save needs a --roster")
+    
+    dice = None
+    if options.seed is not None:
+        from diceStream import DiceStream
+        dice = DiceStream(options.seed)
+    
+    creatures = _open_creatures(options)
+    try:
+        # iterating over the file reads ahead in large blocks, and is many
+        # times faster than readline; readline hands over each line as soon
+        # as it arrives, which is what line buffered use needs
+        if options.lineBuffered:
+            lines = iter(sys.stdin.readline, "")
+        else:
+            lines = sys.stdin
+        write_results(run_commands(read_commands(lines), creatures, dice), sys.stdout, options.lineBuffered)
+    finally:
+        if options.save:
+            creatures.save()
+        if options.database or options.roster:
+            creatures.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,333 @@
+
+#   author: Respen (respen@gmail.com)
+
+"""
+This module resolves skill checks in batches with numpy, for simulations
+which need far more checks than Creature.use_skill can make one at a time.
+
+A batch gives the same results as calling use_skill for each check in
+order with the same d20 rolls: the attacker's roll is level + attribute
+bonus + modifiers + d20, an opposed check makes the target roll its
+opposing skill against it, and both sides gain experience (and level up)
+exactly as Skill.gain_exp would.  Checks which share a creature's skill
+have to see each other's experience, so they are resolved in successive
+rounds; a batch in which every creature appears once is a single round.
+
+numpy is required by this module.
+
+Functions
+    resolve_checks(creatures, string:skillName[, dcs, modifiers, targets, rows, rolls, dice])
+                                        -> returns a dictionary of result arrays
+    attribute_bonuses(scores)           -> returns attribute_bonus() of each score
+    experience_gains(results)           -> returns experience_gain() of each result
+"""
+
+import numpy
+
+import diceStream
+from creatureInfo import CreatureStore, StoredCreature
+
+#------------------------------------------------------------------------------#
+
+def attribute_bonuses(scores):
+    scores = numpy.asarray(scores)
+    # python 2 integer division floors, as numpy's // does
+    return numpy.where(scores >= 10, (scores - 10) // 2, (scores - 11) // 2)
+
+def experience_gains(results):
+    results = numpy.asarray(results)
+    return numpy.where(results >= 0, 15 - results,
+                       numpy.where(results >= -5, 6 + results, 0))
+
+#------------------------------------------------------------------------------#
+
+def resolve_checks(creatures, skillName, dcs = 0, modifiers = 0, targets = None,
+                   rows = None, rolls = None, dice = None):
+    """
+    Resolve one check of skillName for each creature.
+    
+    creatures is either a sequence of creatures (Creature or StoredCreature)
+    or a CreatureStore.  For a store, rows picks the rows making checks (all
+    of them by default) and targets, if given, are rows of the same store;
+    otherwise targets is a sequence of creatures.  dcs and modifiers may be
+    single values or one per check.  Targets are only rolled against when
+    the skill has an opposing skill, as in Skill.use.
+    
+    rolls, if given, are the d20 rolls to use, in the order use_skill would
+    make them: one per check, or for opposed checks the attacker's and then
+    the target's roll for each check in turn.  Otherwise they are drawn from
+    dice (diceStream.defaultDice by default) in that same order, so a batch
+    and a loop of use_skill calls on equal dice streams roll the same.
+    
+    The returned dictionary holds numpy arrays, one entry per check:
+        "rolls"         -> the attacker's total roll
+        "targetRolls"   -> the target's total roll (opposed checks only)
+        "results"       -> the result use_skill would return
+        "expGains"      -> the experience the attacker gained
+        "levelUps"      -> whether the attacker's skill levelled up
+    """
+    
+    if isinstance(creatures, CreatureStore):
+        batch = _StoreBatch(creatures, skillName, rows, targets)
+    else:
+        batch = _ObjectBatch(creatures, skillName, targets)
+    
+    n = batch.size
+    opposed = batch.opposed
+    
+    if rolls is None:
+        if dice is None:
+            dice = diceStream.defaultDice
+        rolls = dice.rolls((opposed and 2 or 1) * n)
+    rolls = numpy.asarray(rolls, dtype = numpy.int64)
+    if opposed:
+        d20, targetD20 = rolls[0::2], rolls[1::2]
+    else:
+        d20, targetD20 = rolls, None
+    
+    base = batch.bonuses + _per_check(modifiers, n)
+    dcs = _per_check(dcs, n)
+    
+    results = numpy.empty(n, dtype = numpy.int64)
+    totals = numpy.empty(n, dtype = numpy.int64)
+    targetTotals = None
+    if opposed:
+        targetTotals = numpy.empty(n, dtype = numpy.int64)
+    expGains = numpy.empty(n, dtype = numpy.int64)
+    levelUps = numpy.zeros(n, dtype = bool)
+    
+    levels, exps = batch.levels, batch.exps
+    targetLevels, targetExps = batch.targetLevels, batch.targetExps
+    
+    for checks in _rounds(batch):
+        slots = batch.slots[checks]
+        
+        # the attacker rolls first
+        roll = levels[slots] + base[checks] + d20[checks]
+        totals[checks] = roll
+        
+        if opposed:
+            # then the target rolls its opposing skill with the attacker's
+            # roll as the difficulty, and gains experience from its result
+            targetSlots = batch.targetSlots[checks]
+            targetRoll = targetLevels[targetSlots] + batch.targetBonuses[checks] + targetD20[checks]
+            targetTotals[checks] = targetRoll
+            result = targetRoll - roll
+            _gain_exp(targetLevels, targetExps, targetSlots, result)
+        else:
+            result = roll - dcs[checks]
+        
+        results[checks] = result
+        expGains[checks] = experience_gains(result)
+        levelUps[checks] = _gain_exp(levels, exps, slots, result)
+    
+    batch.write_back()
+    
+    return { "rolls"       : totals,
+             "targetRolls" : targetTotals,
+             "results"     : results,
+             "expGains"    : expGains,
+             "levelUps"    : levelUps }
+
+def _per_check(values, n):
+    values = numpy.asarray(values, dtype = numpy.int64)
+    if values.ndim == 0:
+        return numpy.full(n, values, dtype = numpy.int64)
+    if len(values) != n:
+        raise ValueError("expected one value per check")
+    
+    return values
+
+def _gain_exp(levels, exps, slots, results):
+    # Skill.gain_exp for every slot at once; slots are unique within a round
+    gained = exps[slots] + experience_gains(results)
+    levelUp = gained >= 100
+    gained[levelUp] = 0
+    exps[slots] = gained
+    levels[slots[levelUp]] += 1
+    
+    return levelUp
+
+def _rounds(batch):
+    # yields arrays of checks such that no two checks in one array touch the
+    # same skill of the same creature, and each check comes after every
+    # earlier check touching one of its skills
+    slots = batch.slots
+    n = len(slots)
+    if n == 0:
+        return
+    
+    if not batch.opposed:
+        if _all_different(slots):
+            yield slice(None)
+            return
+        rounds = _occurrence_ranks(slots)
+    else:
+        targetSlots = batch.targetSlots
+        if not batch.sharedSlots:
+            # attackers' and targets' skills are different columns
+            targetSlots = targetSlots + (slots.max() + 1)
+        
+        # a creature opposing itself with the same skill is one check
+        if _all_different(numpy.concatenate((slots, targetSlots[targetSlots != slots]))):
+            yield slice(None)
+            return
+        rounds = _chain_depths([slots, targetSlots])
+    
+    order = numpy.argsort(rounds, kind = "mergesort")
+    ends = numpy.cumsum(numpy.bincount(rounds))
+    start = 0
+    for end in ends:
+        yield order[start:end]
+        start = end
+
+def _all_different(slots):
+    return numpy.bincount(slots).max() <= 1
+
+def _occurrence_ranks(slots):
+    # how many earlier checks used the same slot
+    n = len(slots)
+    ranks = numpy.zeros(n, dtype = numpy.int64)
+    if n == 0:
+        return ranks
+    
+    order = numpy.argsort(slots, kind = "mergesort")
+    ordered = slots[order]
+    groupStart = numpy.concatenate(([True], ordered[1:] != ordered[:-1]))
+    starts = numpy.maximum.accumulate(numpy.where(groupStart, numpy.arange(n), 0))
+    ranks[order] = numpy.arange(n) - starts
+    
+    return ranks
+
+def _chain_depths(slotArrays):
+    # each check's round is one past the latest round of an earlier check
+    # sharing a slot with it; this needs a pass over the checks in order
+    n = len(slotArrays[0])
+    lists = [a.tolist() for a in slotArrays]
+    latest = {}
+    rounds = [0] * n
+    for i in xrange(n):
+        r = 0
+        for slotList in lists:
+            previous = latest.get(slotList[i])
+            if previous is not None and previous >= r:
+                r = previous + 1
+        rounds[i] = r
+        for slotList in lists:
+            latest[slotList[i]] = r
+    
+    return numpy.array(rounds, dtype = numpy.int64)
+
+#------------------------------------------------------------------------------#
+
+class _StoreBatch(object):
+
+    # checks made by rows of a CreatureStore; levels and experience are read
+    # and written in place through views of the store's columns
+    
+    def __init__(self, store, skillName, rows, targets):
+        definition = _find_definition(store.get_skill_definitions(), skillName)
+        
+        if rows is None:
+            rows = numpy.arange(len(store))
+        self.slots = numpy.asarray(rows, dtype = numpy.int64)
+        self.size = len(self.slots)
+        
+        self.levels = store.numpy_column(skillName + " level")
+        self.exps = store.numpy_column(skillName + " exp")
+        self.bonuses = _store_bonuses(store, definition, self.slots)
+        
+        opposingName = definition.get_opposing_skill()
+        self.opposed = targets is not None and opposingName is not None
+        self.sharedSlots = self.opposed and opposingName == skillName
+        self.targetLevels = self.targetExps = self.targetSlots = self.targetBonuses = None
+        
+        if self.opposed:
+            opposing = _find_definition(store.get_skill_definitions(), opposingName)
+            self.targetSlots = _per_check(targets, self.size)
+            self.targetLevels = store.numpy_column(opposingName + " level")
+            self.targetExps = store.numpy_column(opposingName + " exp")
+            self.targetBonuses = _store_bonuses(store, opposing, self.targetSlots)
+    
+    def write_back(self):
+        # the columns were updated in place
+        pass
+
+def _store_bonuses(store, definition, rows):
+    bonuses = numpy.zeros(len(rows), dtype = numpy.int64)
+    for attribute in definition.get_associated_attributes():
+        bonuses += attribute_bonuses(store.numpy_column(attribute)[rows])
+    
+    return bonuses
+
+def _find_definition(definitions, skillName):
+    for definition in definitions:
+        if definition.get_name() == skillName:
+            return definition
+    
+    raise KeyError(skillName)
+
+#------------------------------------------------------------------------------#
+
+class _ObjectBatch(object):
+
+    # checks made by creature objects; each distinct skill gets a slot in
+    # flat level and experience arrays, which are copied back afterwards
+    
+    def __init__(self, creatures, skillName, targets):
+        self.__skills = []
+        self.__slotsByKey = {}
+        
+        creatures = list(creatures)
+        self.size = len(creatures)
+        
+        skills = [self.__skill(c, skillName) for c in creatures]
+        self.slots = numpy.array([self.__slot(c, s) for c, s in zip(creatures, skills)], dtype = numpy.int64)
+        self.bonuses = numpy.array([c.get_attribute_bonus(s) for c, s in zip(creatures, skills)], dtype = numpy.int64)
+        
+        opposingName = self.size and skills[0].get_opposing_skill() or None
+        self.opposed = targets is not None and opposingName is not None
+        self.sharedSlots = True
+        self.targetSlots = self.targetBonuses = None
+        
+        if self.opposed:
+            targets = list(targets)
+            targetSkills = [self.__skill(t, opposingName) for t in targets]
+            self.targetSlots = numpy.array([self.__slot(t, s) for t, s in zip(targets, targetSkills)], dtype = numpy.int64)
+            self.targetBonuses = numpy.array([t.get_attribute_bonus(s) for t, s in zip(targets, targetSkills)], dtype = numpy.int64)
+        
+        # attackers and targets share one set of slots
+        self.levels = numpy.array([s.get_level() for s in self.__skills], dtype = numpy.int64)
+        self.exps = numpy.array([s.get_exp() for s in self.__skills], dtype = numpy.int64)
+        self.targetLevels, self.targetExps = self.levels, self.exps
+    
+    def write_back(self):
+        for skill, level, exp in zip(self.__skills, self.levels.tolist(), self.exps.tolist()):
+            if skill.get_level() != level:
+                skill.set_level(level)
+            if skill.get_exp() != exp:
+                skill.set_exp(exp)
+    
+    def __skill(self, creature, skillName):
+        skill = creature.get_skills("list of Skill").get_skill(skillName)
+        if skill is None:
+            raise KeyError(skillName)
+        
+        return skill
+    
+    def __slot(self, creature, skill):
+        # views of a stored creature are made afresh on every call, so they
+        # are told apart by store, row and skill rather than by identity
+        if isinstance(creature, StoredCreature):
+            key = (id(creature.get_store()), creature.get_row(), skill.get_name())
+        else:
+            key = id(skill)
+        
+        slot = self.__slotsByKey.get(key)
+        if slot is None:
+            slot = self.__slotsByKey[key] = len(self.__skills)
+            self.__skills.append(skill)
+        
+        return slot
+
+#------------------------------------------------------------------------------#
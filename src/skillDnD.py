@@ -2,24 +2,52 @@
 
 #   author: Respen (respen@gmail.com)
 
-from gui import *
-from creatureInfo import CreatureList
-import cPickle
+import os
+import sys
 
-import pygtk
-pygtk.require("2.0")
-import gtk
+from creatureInfo import encode_creature
+from rosterArchive import LazyCreatureList, load_roster, write_roster
+from backgroundIO import WorkerPool, BulkLoad, Autosaver, write_file
+from logSink import LogSink
 
 """
 This module contains the controller for the SkillDnD program.  It
 is run in order to run the program.
 
+The toolkit is only imported by load_gui(), which running the program or
+making a Controller with its interface calls, so programs which only want
+the controller's data operations, or the engine, never import GTK.
+
 Classes
     Controller
+
+Functions
+    load_gui()                          -> imports the user interface and GTK
 """
     
 #------------------------------------------------------------------------------#
 
+# seconds between autosaves of changed creatures
+AUTOSAVE_INTERVAL = 10
+
+# the log is mirrored here when the program is run, if ../data exists
+LOG_PATH = "../data/skillDnD.log"
+
+# where the diagnostics window dumps its profiles, if ../data exists
+PROFILE_PATH = "../data/skillDnD.pstats"
+
+# the user interface modules, which load_gui() imports
+gui = gtk = gobject = None
+
+def load_gui():
+    global gui, gtk, gobject
+    if gui is None:
+        import pygtk
+        pygtk.require("2.0")
+        import gtk
+        import gobject
+        import gui
+
 class Controller:
 
     """
@@ -34,13 +62,63 @@ class Controller:
         view_creature()
         save_creature()
         load_creature()
+        load_folder()
+        save_all()
+        save_roster()
+        load_roster()
+        open_database()
+        view_diagnostics()
         gui_delete_event(widget,event,[data])
         gui_destroy(widget,[data])
+    
+    Without its interface, a Controller imports no GTK and runs the jobs'
+    callbacks on the worker threads; only the data operations and
+    save_all() are of use, and nothing is autosaved.
+    
+    Everything the controller reports goes to one LogSink, which echoes it
+    to the console, is shown in the main window's log pane, and is
+    mirrored to logPath, if given.
     """
     
-    def __init__(self):
-        self.__mainWindow = MainWindow(self)
-        self.__creatureList = CreatureList()
+    def __init__(self, interface = True, logPath = None):
+        self.__logSink = LogSink(echo = sys.stdout, path = logPath)
+        self.__mainWindow = None
+        dispatch = None
+        if interface:
+            load_gui()
+            self.__mainWindow = gui.MainWindow(self, self.__logSink)
+            dispatch = gobject.idle_add
+        
+        # files are read on these threads, and written on the one writer
+        # thread, so two writes of a file are made one after the other in
+        # the order they were asked for; the results are handed back on
+        # the main loop
+        self.__workers = WorkerPool(2, dispatch)
+        self.__writer = WorkerPool(1, dispatch)
+        
+        # the saved creatures are listed at start up, but each is only read
+        # from its file when it is first used
+        if os.path.isdir("../data"):
+            self.__creatureList = LazyCreatureList("../data")
+        else:
+            self.__creatureList = LazyCreatureList()
+        
+        # set once a database is opened, which then holds the creatures
+        self.__database = None
+        
+        # creatures which change are written back to ../data, or to the
+        # database, on a timer; without the interface there is no timer, and
+        # the changes are not tracked at all
+        self.__autosaver = None
+        if interface and os.path.isdir("../data"):
+            self.__start_autosaver()
+        if interface:
+            gobject.timeout_add(AUTOSAVE_INTERVAL * 1000, self.__autosave)
+    
+    def __start_autosaver(self):
+        self.__autosaver = Autosaver(self.__creatureList, "../data", self.__writer,
+                                     self.__autosaved,
+                                     lambda error: self.__logSink.error("Autosave failed: %s" % error))
     
     def start_session(self):
         self.__mainWindow.main()
@@ -54,65 +132,252 @@ class Controller:
     # ----- gui callback functions ----- #
     
     def create_creature(self, widget, data = None):
-        print "  Creature creation process initiated."
-        self.__mainWindow.get_log().insert_at_cursor("Creature creation process initiated.\n")
-        dialog = CreateCreatureDialog(self.__mainWindow.get_window(), self.__creatureList, self.__mainWindow.get_log())
+        self.__logSink.info("Creature creation process initiated.")
+        dialog = gui.CreateCreatureDialog(self.__mainWindow.get_window(), self.__creatureList, self.__logSink)
     
     def view_creature(self, widget, data = None):
-        print "  Starting to view a creature."
-        self.__mainWindow.get_log().insert_at_cursor("Viewing a creature...\n")
-        window = ViewCreatureWindow(self.__creatureList, self.__mainWindow.get_log())
+        self.__logSink.info("Viewing a creature...")
+        window = gui.ViewCreatureWindow(self.__creatureList, self.__logSink)
     
     def save_creature(self, widget, data = None):
-        print "  Starting to save a creature."
-        print "    Selecting a creature..."
-        dialog = SelectCreatureDialog(self.__mainWindow.get_window(), self.__creatureList)
+        self.__logSink.info("Starting to save a creature.")
+        self.__logSink.debug("Selecting a creature...")
+        dialog = gui.SelectCreatureDialog(self.__mainWindow.get_window(), self.__creatureList)
         response = dialog.run()
         creature = None
         if response == 1:
             creature = dialog.get_selected()
-            print "    %s selected." % creature
+            self.__logSink.debug("%s selected." % creature)
         else:
-            print "  Saving aborted."
+            self.__logSink.info("Saving aborted.")
         dialog.destroy()
         
-        if creature != None:
-            with open("../data/" + creature + ".creature", "w") as f:
-                cPickle.dump(self.__creatureList.get_by_name(creature), f)
-                print "  %s was saved." % creature
+        if creature != None and self.__autosaver is not None:
+            # the autosaver writes the creature's file too, so it is written
+            # with the autosaver's next batch rather than beside it
+            self.__autosaver.save(self.__creatureList.get_by_name(creature))
+            self.__logSink.info("%s is being saved." % creature)
+        elif creature != None:
+            # the creature is encoded here, so it can not change while the
+            # file is being written
+            record = encode_creature(self.__creatureList.get_by_name(creature))
+            self.__writer.submit(write_file, ("../data/" + creature + ".creature", record),
+                                 lambda result: self.__logSink.info("%s was saved." % creature),
+                                 lambda error: self.__logSink.error("%s could not be saved: %s" % (creature, error)))
     
     def load_creature(self, widget, data = None):
-        print "  Starting to load a creature."
-        print "    Selecting a creature..."
-        dialog = gtk.FileChooserDialog()
+        self.__logSink.info("Starting to load creatures.")
+        self.__logSink.debug("Selecting creatures...")
+        dialog = gtk.FileChooserDialog("Load Creatures", self.__mainWindow.get_window())
         dialog.add_button("Load", 1)
         dialog.add_button("Cancel", 0)
+        dialog.set_select_multiple(True)
         response = dialog.run()
-        creature = None
+        paths = []
         if response == 1:
-            creature = dialog.get_filename()
-            print "    %s was selected." % creature
+            paths = dialog.get_filenames()
+            self.__logSink.debug("%d files were selected." % len(paths))
         else:
-            print "  Loading aborted."
+            self.__logSink.info("Loading aborted.")
         dialog.destroy()
         
-        if creature != None:
-            with open(creature, "r") as f:
-                self.__creatureList.append(cPickle.load(f))
-                print "  %s loaded." % creature
+        if paths:
+            self.__load_files(paths)
+    
+    def load_folder(self, widget, data = None):
+        self.__logSink.info("Starting to load a folder of creatures.")
+        dialog = gtk.FileChooserDialog("Load Folder", self.__mainWindow.get_window(),
+                                       gtk.FILE_CHOOSER_ACTION_SELECT_FOLDER)
+        dialog.add_button("Load", 1)
+        dialog.add_button("Cancel", 0)
+        response = dialog.run()
+        folder = None
+        if response == 1:
+            folder = dialog.get_filename()
+            self.__logSink.debug("%s was selected." % folder)
+        else:
+            self.__logSink.info("Loading aborted.")
+        dialog.destroy()
+        
+        if folder != None:
+            paths = [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(".creature")]
+            self.__load_files(paths)
+    
+    def __load_files(self, paths):
+        self.__logSink.info("Loading %d creature files..." % len(paths))
+        BulkLoad(self.__workers, paths, self.__file_loaded, self.__file_failed,
+                 self.__load_progress, self.__load_finished)
+    
+    # ----- background job callbacks, run on the main loop ----- #
+    
+    def __file_loaded(self, path, creature):
+        self.__creatureList.append(creature)
+        self.__logSink.debug("%s loaded." % path)
+    
+    def __file_failed(self, path, error):
+        self.__logSink.error("%s could not be loaded: %s" % (path, error))
+    
+    def __load_progress(self, done, total):
+        self.__logSink.info("%d of %d files read..." % (done, total))
+    
+    def __load_finished(self, loaded, failed):
+        if failed:
+            self.__logSink.warning("%d creatures loaded, %d files failed." % (loaded, failed))
+        else:
+            self.__logSink.info("%d creatures loaded." % loaded)
+    
+    def __autosave(self):
+        if self.__database is not None:
+            count = self.__database.save()
+            if count:
+                self.__autosaved(count)
+        elif self.__autosaver is not None:
+            self.__autosaver.tick()
+        
+        # keep the timer running
+        return True
+    
+    def __autosaved(self, count):
+        self.__logSink.info("Saved %d changed creatures." % count)
+    
+    def save_all(self, widget, data = None):
+        if self.__database is not None:
+            self.__logSink.info("%d changed creatures were saved." % self.__database.save())
+            return
+        
+        if not os.path.isdir("../data"):
+            os.mkdir("../data")
+        
+        if self.__mainWindow is None:
+            # without the interface there is no main loop to keep free
+            changed = self.__creatureList.get_dirty_names()
+            self.__creatureList.save("../data")
+            self.__logSink.info("%d changed creatures were saved." % len(changed))
+            return
+        
+        # the autosaver writes them on the writer thread, in order with its
+        # own batches.  It has the changes made since it started; creatures
+        # with no file yet are handed to it as well, in case they were added
+        # and never changed
+        if self.__autosaver is None:
+            self.__start_autosaver()
+        for name in self.__creatureList.get_unsaved_names():
+            self.__autosaver.save(self.__creatureList.get_by_name(name))
+        self.__logSink.info("%d changed creatures are being saved." % self.__autosaver.tick())
+    
+    def save_roster(self, widget, data = None):
+        self.__logSink.info("Starting to save the roster.")
+        dialog = gtk.FileChooserDialog("Save Roster", self.__mainWindow.get_window(),
+                                       gtk.FILE_CHOOSER_ACTION_SAVE)
+        dialog.add_button("Save", 1)
+        dialog.add_button("Cancel", 0)
+        dialog.set_current_folder("../data")
+        dialog.set_current_name("roster.roster")
+        dialog.set_do_overwrite_confirmation(True)
+        response = dialog.run()
+        path = None
+        if response == 1:
+            path = dialog.get_filename()
+        else:
+            self.__logSink.info("Saving aborted.")
+        dialog.destroy()
+        
+        if path != None:
+            records = list(self.__creatureList.iter_records())
+            self.__logSink.info("Saving %d creatures to %s..." % (len(records), path))
+            self.__writer.submit(write_roster, (path, records),
+                                 lambda result: self.__logSink.info("%d creatures were saved to %s." % (len(records), path)),
+                                 lambda error: self.__logSink.error("%s could not be saved: %s" % (path, error)))
+    
+    def load_roster(self, widget, data = None):
+        self.__logSink.info("Starting to load a roster.")
+        dialog = gtk.FileChooserDialog("Load Roster", self.__mainWindow.get_window())
+        dialog.add_button("Load", 1)
+        dialog.add_button("Cancel", 0)
+        dialog.set_current_folder("../data")
+        response = dialog.run()
+        path = None
+        if response == 1:
+            path = dialog.get_filename()
+            self.__logSink.debug("%s was selected." % path)
+        else:
+            self.__logSink.info("Loading aborted.")
+        dialog.destroy()
+        
+        if path != None:
+            self.__logSink.info("Loading the roster %s..." % path)
+            self.__workers.submit(load_roster, (path,), self.__roster_loaded,
+                                  lambda error: self.__logSink.error("%s could not be loaded: %s" % (path, error)))
+    
+    def __roster_loaded(self, creatures):
+        self.__creatureList.extend(creatures)
+        self.__logSink.info("%d creatures loaded from the roster." % len(creatures))
+    
+    def open_database(self, widget, data = None):
+        self.__logSink.info("Starting to open a database.")
+        dialog = gtk.FileChooserDialog("Open Database", self.__mainWindow.get_window(),
+                                       gtk.FILE_CHOOSER_ACTION_SAVE)
+        dialog.add_button("Open", 1)
+        dialog.add_button("Cancel", 0)
+        dialog.set_current_folder("../data")
+        dialog.set_current_name("creatures.db")
+        response = dialog.run()
+        path = None
+        if response == 1:
+            path = dialog.get_filename()
+            self.__logSink.debug("%s was selected." % path)
+        else:
+            self.__logSink.info("Opening aborted.")
+        dialog.destroy()
+        
+        if path != None:
+            from creatureDatabase import CreatureDatabase
+            database = CreatureDatabase(path)
+            
+            # a new database starts with the creatures already open; either
+            # way creatures are read from it a page at a time from now on
+            if len(database) == 0:
+                database.extend(self.__creatureList)
+            
+            if self.__autosaver is not None:
+                self.__autosaver.stop()
+                self.__autosaver = None
+            if self.__database is not None:
+                self.__database.close()
+            self.__database = database
+            self.__creatureList = database
+            self.__logSink.info("Opened %s, which holds %d creatures." % (path, len(database)))
+    
+    def view_diagnostics(self, widget, data = None):
+        profilePath = PROFILE_PATH if os.path.isdir("../data") else None
+        window = gui.DiagnosticsWindow(self.__logSink, profilePath)
     
     def gui_delete_event(self, widget, event, data = None):
-        print "  Signal received to terminate program."
+        self.__logSink.info("Signal received to terminate program.")
         # return False to destroy gui, True to not destroy gui
         return False
     
     def gui_destroy(self, widget, data = None):
-        print "  Thank you for using SkillDnD!"
+        self.__logSink.info("Thank you for using SkillDnD!")
+        
+        # let the workers finish, then write whatever changed since the
+        # last autosave
+        self.__workers.shutdown(True)
+        self.__writer.shutdown(True)
+        if self.__autosaver is not None:
+            self.__autosaver.flush()
+        if self.__database is not None:
+            self.__database.close()
+        self.__logSink.close()
         gtk.main_quit()
     
 #------------------------------------------------------------------------------#
 
 if __name__ == "__main__":
-    controller = Controller()
+    load_gui()
+    
+    # the background workers need python threads to run alongside gtk's
+    gobject.threads_init()
+    controller = Controller(logPath = LOG_PATH if os.path.isdir("../data") else None)
     controller.start_session()
 
@@ -1,44 +1,188 @@
 
 #   author: Respen (respen@gmail.com)
 
-from random import randint
 from math import sqrt
 
+import diceStream
+
+from indexedList import NameIndexedList
+from changeTracking import mark_changed
+from changeTracking import DESCRIBED, LEVEL_SET, EXP_SET, LEVELLED_UP, EXP_GAINED
+
 """
 This module contains the classes for skills.
 
 Classes
+    SkillDefinition
     Skill
     SkillList
+
+Functions
+    get_skill_definition(string:name)   -> returns the standard definition of
+                                            the named skill
+    experience_gain(int:skillCheckResult) -> returns the experience a skill
+                                            check with that result earns
 """
     
 #------------------------------------------------------------------------------#
 
-class Skill:
+def _intern(string):
+    # only byte strings can be interned
+    if type(string) is str:
+        return intern(string)
+    
+    return string
+
+class SkillDefinition(object):
 
     """
-    A class which defines the behavior of skills.
+    The read-only description of a skill: its name, associated attributes,
+    opposing skill and description.  Definitions are interned, so every
+    creature with a given skill shares one definition object, and only the
+    creature's own level and experience live in its Skill.
     
     Functions:
+        get_name()                          -> returns the name string
+        get_associated_attributes()         -> returns tuple of attribute names
+        get_opposing_skill()                -> returns the opposing skill's name
+        get_description()                   -> returns the description string
+    """
+    
+    __slots__ = ("__name", "__associatedAttributes", "__opposingSkill", "__description")
+    
+    # every definition ever made, keyed by its contents
+    __interned = {}
+    
+    def __new__(cls, name, associatedAttributes, oppSk = None, description = "No description given."):
+        key = (name, tuple(associatedAttributes), oppSk, description)
+        
+        definition = cls.__interned.get(key)
+        if definition is None:
+            definition = object.__new__(cls)
+            object.__setattr__(definition, "_SkillDefinition__name", _intern(name))
+            object.__setattr__(definition, "_SkillDefinition__associatedAttributes",
+                               tuple([_intern(i) for i in associatedAttributes]))
+            object.__setattr__(definition, "_SkillDefinition__opposingSkill", oppSk)
+            object.__setattr__(definition, "_SkillDefinition__description", description)
+            definition = cls.__interned.setdefault(key, definition)
+        
+        return definition
+    
+    def get_name(self):
+        return self.__name
+    
+    def get_associated_attributes(self):
+        return self.__associatedAttributes
+    
+    def get_opposing_skill(self):
+        return self.__opposingSkill
+    
+    def get_description(self):
+        return self.__description
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("skill definitions are read-only")
+    
+    def __delattr__(self, name):
+        raise AttributeError("skill definitions are read-only")
+    
+    def __reduce__(self):
+        # unpickling goes back through __new__, so it finds the interned copy
+        return (SkillDefinition, (self.__name, self.__associatedAttributes,
+                                  self.__opposingSkill, self.__description))
+    
+    def __repr__(self):
+        return "SkillDefinition(%r)" % self.__name
+
+# the standard skills every creature starts with (see Skill_Database)
+SKILL_DEFINITIONS = (
+    SkillDefinition("Attack", ("Strength", "Dexterity"), "Defense"),
+    SkillDefinition("Defense", ("Dexterity", "Constitution")),
+    SkillDefinition("Magic", ("Constitution", "Intelligence", "Wisdom"), "Magic Defense"),
+    SkillDefinition("Magic Defense", ("Dexterity", "Constitution", "Intelligence", "Wisdom")),
+)
+
+_standardDefinitions = dict([(d.get_name(), d) for d in SKILL_DEFINITIONS])
+
+def get_skill_definition(name):
+    return _standardDefinitions[name]
+
+def experience_gain(skillCheckResult):
+    # determine gained experience using the skill check's result
+    expGain = 0
+    if skillCheckResult >= 0:
+        expGain = 15 - skillCheckResult
+    elif skillCheckResult < 0 and skillCheckResult >= -5:
+        expGain = 6 + skillCheckResult
+    
+    return expGain
+
+#------------------------------------------------------------------------------#
+
+class Skill(object):
+
+    """
+    A creature's own standing in a skill.  The skill itself is described by
+    a shared SkillDefinition; a Skill only holds the creature's level and
+    experience on top of it, in slots.
+    
+    A Skill can be made from a SkillDefinition, from the name of one of the
+    standard skills, or from a full description of a skill, which is then
+    interned as a new definition.
+    
+    Functions:
+        get_definition()                    -> returns the shared SkillDefinition
         get_level()                         -> returns the level value
         get_exp()                           -> returns the experience value
         get_description()                   -> returns the description string
         get_name()                          -> returns the name string
-        get_associated_attributes()         -> returns list of attribute names
+        get_associated_attributes()         -> returns tuple of attribute names
         get_opposing_skill()                -> returns the opposing skill's name
         set_description(string:newDesc)     -> sets description to newDesc
+        set_level(int:lvl)                  -> sets the level value
+        set_exp(int:exp)                    -> sets the experience value
         level_up(int:numOfLevels)           -> levels up this skill by numOfLevels and resets experience to zero
         gain_exp(int:skillCheckResult)      -> 
-        use(int:attributeBonus[, int:difficulty, Creature:target, int:modifiers])    -> returns an int rating the success
+        use(int:attributeBonus[, int:difficulty, Creature:target, int:modifiers, DiceStream:dice])    -> returns an int rating the success;
+                                            the d20 comes from dice (and so does the target's, in
+                                            an opposed check), or diceStream.defaultDice
     """
 
-    def __init__(self, name, associatedAttributes, oppSk = None, lvl = 0, exp = 0, description = "No description given."):
+    __slots__ = ("__definition", "__level", "__experience")
+    
+    def __init__(self, name, associatedAttributes = None, oppSk = None, lvl = 0, exp = 0, description = None):
+        if isinstance(name, SkillDefinition):
+            self.__definition = name
+        elif associatedAttributes is None:
+            self.__definition = get_skill_definition(name)
+        elif description is None:
+            self.__definition = SkillDefinition(name, associatedAttributes, oppSk)
+        else:
+            self.__definition = SkillDefinition(name, associatedAttributes, oppSk, description)
+        
         self.__level = lvl
         self.__experience = exp
-        self.__description = description
-        self.__name = name
-        self.__associatedAttributes = associatedAttributes
-        self.__opposingSkill = oppSk
+    
+    def __getstate__(self):
+        return { "_Skill__definition" : self.__definition,
+                 "_Skill__level"      : self.__level,
+                 "_Skill__experience" : self.__experience }
+    
+    def __setstate__(self, state):
+        # files saved before definitions were shared hold the whole skill
+        if "_Skill__definition" in state:
+            self.__definition = state["_Skill__definition"]
+        else:
+            self.__definition = SkillDefinition(state["_Skill__name"],
+                                                state["_Skill__associatedAttributes"],
+                                                state["_Skill__opposingSkill"],
+                                                state["_Skill__description"])
+        
+        self.__level = state["_Skill__level"]
+        self.__experience = state["_Skill__experience"]
+    
+    def get_definition(self):
+        return self.__definition
         
     def get_level(self):
         return self.__level
@@ -47,47 +191,56 @@ class Skill:
         return self.__experience
         
     def get_description(self):
-        return self.__description
+        return self.__definition.get_description()
     
     def get_name(self):
-        return self.__name
+        return self.__definition.get_name()
     
     def get_associated_attributes(self):
-        return self.__associatedAttributes
+        return self.__definition.get_associated_attributes()
     
     def get_opposing_skill(self):
-        return self.__opposingSkill
+        return self.__definition.get_opposing_skill()
     
     def set_description(self, newDesc):
-        self.__description = newDesc
+        mark_changed(self, DESCRIBED, newDesc)
+        definition = self.__definition
+        self.__definition = SkillDefinition(definition.get_name(), definition.get_associated_attributes(),
+                                            definition.get_opposing_skill(), newDesc)
         
+    def set_level(self, lvl):
+        mark_changed(self, LEVEL_SET, lvl)
+        self.__level = lvl
+    
+    def set_exp(self, exp):
+        mark_changed(self, EXP_SET, exp)
+        self.__experience = exp
+    
     def level_up(self, numOfLevels = 1):
+        mark_changed(self, LEVELLED_UP, numOfLevels)
         self.__level += numOfLevels
         self.__experience = 0
         
     def gain_exp(self, skillCheckResult):
-        # determine gained experience using the skill check's result
-        expGain = 0
-        if skillCheckResult >= 0:
-            expGain = 15 - skillCheckResult
-        elif skillCheckResult < 0 and skillCheckResult >= -5:
-            expGain = 6 + skillCheckResult
-        
+        mark_changed(self, EXP_GAINED, skillCheckResult)
         # apply gained experience
-        self.__experience += expGain
+        self.__experience += experience_gain(skillCheckResult)
         
         # check for a level up, and perform it if necessary
         if self.__experience >= 100:
-            self.__level_up()
+            self.level_up()
     
-    def use(attributeBonus, dc = 0, target = None, modifiers = 0):
+    def use(self, attributeBonus, dc = 0, target = None, modifiers = 0, dice = None):
+        if dice is None:
+            dice = diceStream.defaultDice
+        
         # perform creature's roll
-        roll = self.__level + attributeBonus + modifiers + randint(1, 20)
+        roll = self.__level + attributeBonus + modifiers + dice.roll()
         
         # determine the result
-        if target is not None and self.__opposingSkill is not None:
+        if target is not None and self.get_opposing_skill() is not None:
             # determine difficulty for the target and then call for their response
-            result = target.use_skill(self.__opposingSkill, roll)
+            result = target.use_skill(self.get_opposing_skill(), roll, dice = dice)
         else:
             result = roll - dc
         
@@ -99,36 +252,42 @@ class Skill:
                 
 #------------------------------------------------------------------------------#
 
-class SkillList(list):
+class SkillList(NameIndexedList):
 
     """
     A subclass of the list datatype which displays different types of skills.
+    The skills are indexed by name, so finding a skill, or checking whether
+    the list holds one (e.g. "Attack" in skills), does not scan the list.
     
     Functions:
         get_all_skill_names()          -> returns a list of names of all of the
                                         skills in the master list
-        get_skill(string:name)       -> returns the skill whose name is passed
+        get_skill(string:name)       -> returns the skill whose name is passed,
+                                        or None if there is no such skill
     """
     
+    __slots__ = ()
+    
     def __init__(self, empty = False):
-        list.__init__(self)
+        NameIndexedList.__init__(self)
         
         if not empty:
             # now add all known skills to self's list
-            self.append(Skill("Attack", ["Strength", "Dexterity"], "Defense"))
-            self.append(Skill("Defense", ["Dexterity", "Constitution"]))
-            self.append(Skill("Magic", ["Constitution", "Intelligence", "Wisdom"], "Magic Defense"))
-            self.append(Skill("Magic Defense", ["Dexterity", "Constitution", "Intelligence", "Wisdom"]))
+            for definition in SKILL_DEFINITIONS:
+                self.append(Skill(definition))
 
     def get_all_skill_names(self):
-        allSkillNames = []
-        for i in self:
-            allSkillNames.append(i.get_name())
-            
-        return allSkillNames
+        return self.get_names()
     
     def get_skill(self, name):
-        return self[self.index(name)]
+        return self.get_by_name(name)
+    
+    def __contains__(self, skill):
+        # accept skill names as well as Skill objects
+        if isinstance(skill, basestring):
+            return self.has_name(skill)
+        
+        return list.__contains__(self, skill)
     
 #------------------------------------------------------------------------------#
 